@@ -0,0 +1,214 @@
+import asyncio
+import collections
+import math
+import random
+import re
+import time
+from contextlib import asynccontextmanager
+
+# Controle de admissão das chamadas ao LLM:
+# - SingleFlight: perguntas idênticas em andamento compartilham uma única execução;
+# - LLMAdmission: limita as chamadas simultâneas com fila justa (FIFO) e espera máxima;
+# - call_with_backoff: repete chamadas recusadas por limite de taxa (HTTP 429).
+
+
+class AdmissionRejected(Exception):
+    """
+    O LLM está saturado (fila cheia, espera esgotada ou limite de taxa do
+    provedor). retry_after é a sugestão, em segundos, para o cabeçalho Retry-After.
+    """
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class SingleFlight:
+    """
+    Agrupa chamadas concorrentes com a mesma chave em uma única execução.
+    A execução continua mesmo se quem a iniciou for cancelado (ex.: cliente
+    desconectado), pois outras requisições podem estar aguardando o resultado.
+    """
+
+    def __init__(self):
+        self._inflight = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    async def do(self, key, fn):
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(fn())
+            self.executions += 1
+            self._inflight[key] = task
+            task.add_done_callback(lambda done, key=key: self._forget(key, done))
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Evita o aviso de exceção não lida quando todos os interessados desistiram.
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self):
+        return {"in_flight": len(self._inflight), "executions": self.executions, "coalesced": self.coalesced}
+
+
+class LLMAdmission:
+    """
+    Semáforo justo para as chamadas ao LLM: no máximo max_concurrent em
+    execução e max_queue aguardando, atendidas por ordem de chegada. Quem não
+    consegue vaga em max_wait_seconds (ou encontra a fila cheia) recebe
+    AdmissionRejected em vez de se acumular.
+    """
+
+    def __init__(self, max_concurrent: int = 8, max_queue: int = 32, max_wait_seconds: float = 10.0):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait_seconds = max_wait_seconds
+        self._active = 0
+        self._waiters = collections.deque()
+        # Média móvel da duração de uma chamada, usada para estimar o Retry-After.
+        self._average_seconds = 1.0
+        self.admitted = 0
+        self.rejected = 0
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for waiter in self._waiters if not waiter.done())
+
+    def is_saturated(self) -> bool:
+        return self._active >= self.max_concurrent and self.waiting >= self.max_queue
+
+    def retry_after(self) -> float:
+        """
+        Estimativa do tempo até haver vaga, pelo tamanho da fila e pela duração média.
+        """
+        return self._average_seconds * (self.waiting + 1) / max(1, self.max_concurrent)
+
+    def _reject(self, reason: str):
+        self.rejected += 1
+        raise AdmissionRejected(reason, self.retry_after())
+
+    async def acquire(self):
+        if self._active < self.max_concurrent and not self.waiting:
+            self._active += 1
+            self.admitted += 1
+            return
+        if self.waiting >= self.max_queue:
+            self._reject("A fila de chamadas ao LLM está cheia.")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout=self.max_wait_seconds)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # A vaga foi transferida no mesmo instante: repassa para o próximo.
+                self.release()
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                pass
+            if isinstance(e, asyncio.TimeoutError):
+                self._reject("Tempo de espera por uma vaga no LLM esgotado.")
+            raise
+        self.admitted += 1
+
+    def release(self):
+        # A vaga passa direto para o primeiro da fila, sem reabrir a disputa.
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._active -= 1
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._average_seconds = 0.8 * self._average_seconds + 0.2 * (time.perf_counter() - started)
+            self.release()
+
+    def stats(self):
+        return {
+            "active": self._active,
+            "waiting": self.waiting,
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "average_call_seconds": self._average_seconds,
+        }
+
+
+_RETRY_DELAY_PATTERNS = (
+    re.compile(r"retry_delay\s*\{\s*seconds:\s*(\d+)"),
+    re.compile(r"retry in ([\d.]+)\s*s", re.IGNORECASE),
+)
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """
+    Reconhece recusas por limite de taxa/cota (HTTP 429 ou ResourceExhausted).
+    """
+    for candidate in (error, getattr(error, "__cause__", None)):
+        if candidate is None:
+            continue
+        if getattr(candidate, "code", None) == 429 or getattr(candidate, "status_code", None) == 429:
+            return True
+        if type(candidate).__name__ in ("ResourceExhausted", "RateLimitError", "TooManyRequests"):
+            return True
+    message = str(error)
+    return bool(re.search(r"\b429\b", message)) or "RESOURCE_EXHAUSTED" in message
+
+
+def retry_delay_hint(error: Exception):
+    """
+    Atraso sugerido pelo provedor (RetryInfo do Gemini ou texto da mensagem), se houver.
+    """
+    hint = getattr(error, "retry_after", None)
+    if isinstance(hint, (int, float)) and hint > 0:
+        return float(hint)
+    for detail in getattr(error, "details", None) or []:
+        delay = getattr(detail, "retry_delay", None)
+        if delay is not None and hasattr(delay, "seconds"):
+            return delay.seconds + getattr(delay, "nanos", 0) / 1e9
+    for pattern in _RETRY_DELAY_PATTERNS:
+        match = pattern.search(str(error))
+        if match:
+            return float(match.group(1))
+    return None
+
+
+async def call_with_backoff(fn, max_retries: int = 3, base_delay: float = 1.0, max_delay: float = 30.0,
+                            on_retry=None):
+    """
+    Executa a corrotina criada por fn, repetindo-a quando o provedor recusa por
+    limite de taxa. Usa o atraso sugerido pelo provedor quando existe; caso
+    contrário, backoff exponencial com jitter. Se o atraso necessário passar de
+    max_delay ou as tentativas acabarem, levanta AdmissionRejected.
+    """
+    attempt = 0
+    while True:
+        try:
+            return await fn()
+        except Exception as e:
+            if not is_rate_limit_error(e):
+                raise
+            hint = retry_delay_hint(e)
+            delay = hint if hint is not None else random.uniform(0, base_delay * 2 ** attempt)
+            if attempt >= max_retries or delay > max_delay:
+                raise AdmissionRejected("O provedor do LLM recusou a chamada por limite de taxa.",
+                                        hint if hint is not None else base_delay * 2 ** attempt) from e
+            attempt += 1
+            if on_retry is not None:
+                on_retry(attempt, delay)
+            await asyncio.sleep(delay)
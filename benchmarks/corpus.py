@@ -0,0 +1,123 @@
+import os
+import random
+
+# Gerador de corpus sintético (PDF, TXT e DOCX) para os benchmarks.
+# O conteúdo é determinístico para uma mesma semente.
+
+_WORDS = (
+    "empresa colaborador politica procedimento contrato fornecedor prazo pagamento "
+    "reembolso viagem ferias beneficio seguranca informacao acesso sistema senha "
+    "treinamento auditoria conformidade relatorio mensal anual orcamento projeto "
+    "entrega cliente atendimento suporte chamado prioridade incidente backup "
+    "servidor rede cadastro aprovacao gestor diretoria norma interna manual "
+    "qualidade indicador meta resultado avaliacao desempenho equipe reuniao"
+).split()
+
+
+def _sentence(rng: random.Random) -> str:
+    words = [rng.choice(_WORDS) for _ in range(rng.randint(8, 18))]
+    return " ".join(words).capitalize() + "."
+
+
+def _paragraphs(rng: random.Random, count: int):
+    return [" ".join(_sentence(rng) for _ in range(rng.randint(3, 7))) for _ in range(count)]
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _wrap(text: str, width: int = 95):
+    lines, current = [], ""
+    for word in text.split():
+        if current and len(current) + len(word) + 1 > width:
+            lines.append(current)
+            current = word
+        else:
+            current = f"{current} {word}".strip()
+    if current:
+        lines.append(current)
+    return lines
+
+
+def write_pdf(path: str, pages):
+    """
+    Escreve um PDF mínimo (fonte Helvetica, texto ASCII) com uma página por
+    item de pages, sem dependências externas.
+    """
+    objects = []
+    page_count = len(pages)
+    font_id = 3
+    first_page_id = 4
+    kids = " ".join(f"{first_page_id + 2 * index} 0 R" for index in range(page_count))
+    objects.append("<< /Type /Catalog /Pages 2 0 R >>")
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {page_count} >>")
+    objects.append("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    for index, text in enumerate(pages):
+        content_id = first_page_id + 2 * index + 1
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 {font_id} 0 R >> >> /Contents {content_id} 0 R >>"
+        )
+        lines = "\n".join(f"({_pdf_escape(line)}) '" for line in _wrap(text)[:60])
+        stream = f"BT /F1 9 Tf 12 TL 40 760 Td\n{lines}\nET"
+        objects.append(f"<< /Length {len(stream.encode('latin-1'))} >>\nstream\n{stream}\nendstream")
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref_offset = len(output)
+    output += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    for offset in offsets:
+        output += f"{offset:010d} 00000 n \n".encode("latin-1")
+    output += (f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\n"
+               f"startxref\n{xref_offset}\n%%EOF\n").encode("latin-1")
+    with open(path, "wb") as pdf_file:
+        pdf_file.write(output)
+
+
+def write_docx(path: str, paragraphs):
+    import docx
+
+    document = docx.Document()
+    for paragraph in paragraphs:
+        document.add_paragraph(paragraph)
+    document.save(path)
+
+
+def generate_corpus(directory: str, files_per_type: int = 10, pages_per_pdf: int = 5,
+                    paragraphs_per_file: int = 20, seed: int = 42):
+    """
+    Gera files_per_type arquivos de cada tipo (PDF, TXT, DOCX) em directory.
+    Retorna a lista de caminhos gerados.
+    """
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    paths = []
+    for index in range(files_per_type):
+        pdf_path = os.path.join(directory, f"manual_{index:04d}.pdf")
+        write_pdf(pdf_path, ["\n".join(_paragraphs(rng, 4)) for _ in range(pages_per_pdf)])
+        paths.append(pdf_path)
+
+        txt_path = os.path.join(directory, f"politica_{index:04d}.txt")
+        with open(txt_path, "w", encoding="utf-8") as txt_file:
+            txt_file.write("\n\n".join(_paragraphs(rng, paragraphs_per_file)))
+        paths.append(txt_path)
+
+        docx_path = os.path.join(directory, f"procedimento_{index:04d}.docx")
+        write_docx(docx_path, _paragraphs(rng, paragraphs_per_file))
+        paths.append(docx_path)
+    return paths
+
+
+def generate_queries(count: int, seed: int = 7):
+    """
+    Gera perguntas sintéticas distintas sobre o vocabulário do corpus.
+    """
+    rng = random.Random(seed)
+    return [
+        f"Qual é a regra sobre {rng.choice(_WORDS)} e {rng.choice(_WORDS)} para {rng.choice(_WORDS)}? ({index})"
+        for index in range(count)
+    ]
@@ -0,0 +1,97 @@
+import asyncio
+import hashlib
+import math
+import random
+import time
+from typing import Any, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+# Implementações determinísticas (sem rede e sem cota) do LLM e dos embeddings,
+# usadas pelos benchmarks. Ative com LLM_PROVIDER=fake e EMBEDDINGS_PROVIDER=fake.
+
+_VOCABULARY = (
+    "documento politica processo contrato prazo cliente servico relatorio "
+    "pagina secao norma equipe projeto sistema dados acesso registro "
+    "pedido analise resultado custo entrega suporte qualidade treinamento"
+).split()
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    LLM falso e determinístico: a resposta depende apenas do hash do prompt.
+    latency_ms simula o tempo até o primeiro token e tokens_per_second o ritmo
+    de geração (0 = todos os tokens de uma vez).
+    """
+
+    latency_ms: float = 0.0
+    tokens_per_second: float = 0.0
+    answer_tokens: int = 60
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _answer_tokens(self, messages: List[BaseMessage]) -> List[str]:
+        prompt = "\n".join(str(message.content) for message in messages)
+        rng = random.Random(hashlib.sha256(prompt.encode("utf-8")).digest())
+        words = [rng.choice(_VOCABULARY) for _ in range(self.answer_tokens)]
+        return ["Resposta sintética: "] + [f"{word} " for word in words] + ["(página 1)."]
+
+    def _token_delay(self) -> float:
+        return 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        tokens = self._answer_tokens(messages)
+        time.sleep(self.latency_ms / 1000.0 + self._token_delay() * len(tokens))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(tokens)))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        tokens = self._answer_tokens(messages)
+        await asyncio.sleep(self.latency_ms / 1000.0 + self._token_delay() * len(tokens))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(tokens)))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any):
+        time.sleep(self.latency_ms / 1000.0)
+        for token in self._answer_tokens(messages):
+            time.sleep(self._token_delay())
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any):
+        await asyncio.sleep(self.latency_ms / 1000.0)
+        for token in self._answer_tokens(messages):
+            await asyncio.sleep(self._token_delay())
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    Embeddings falsos e determinísticos (vetor unitário derivado do hash do texto).
+    latency_ms simula o tempo de cada chamada ao provedor.
+    """
+
+    def __init__(self, size: int = 768, latency_ms: float = 0.0):
+        self.size = size
+        self.latency_ms = latency_ms
+
+    def _vector(self, text: str) -> List[float]:
+        rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+        vector = [rng.gauss(0.0, 1.0) for _ in range(self.size)]
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self.latency_ms / 1000.0)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        time.sleep(self.latency_ms / 1000.0)
+        return self._vector(text)
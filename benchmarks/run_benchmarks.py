@@ -0,0 +1,300 @@
+"""
+Benchmarks offline do KlarosAI (sem chamadas ao Gemini).
+
+Gera um corpus sintético, mede a vazão do ingest.py e a latência do /chat/
+da aplicação FastAPI real, usando o LLM e os embeddings falsos de
+benchmarks/fakes.py. O resultado é gravado em JSON para comparação entre commits.
+
+Uso (a partir da raiz do repositório):
+    python -m benchmarks.run_benchmarks --output bench.json
+    python -m benchmarks.run_benchmarks --compare bench_anterior.json
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.corpus import generate_corpus, generate_queries
+from ingest_manifest import IngestManifest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _percentile(sorted_values, percentile: float):
+    """
+    Percentil pelo método nearest-rank.
+    """
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(percentile / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def _children_peak_rss_mb():
+    """
+    Pico de memória residente (MB) dos processos filhos já finalizados.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # ru_maxrss é em KB no Linux e em bytes no macOS.
+    return peak / (1024 * 1024) if platform.system() == "Darwin" else peak / 1024
+
+
+def _process_peak_rss_mb(pid: int):
+    """
+    Pico de memória residente (MB) de um processo em execução (somente Linux).
+    """
+    try:
+        with open(f"/proc/{pid}/status", "r") as status_file:
+            for line in status_file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def build_env(args, workdir: str):
+    """
+    Ambiente dos subprocessos: provedores falsos e diretórios isolados.
+    """
+    env = dict(os.environ)
+    env.update({
+        "DOCUMENTS_PATH": os.path.join(workdir, "data"),
+        "CHROMA_PERSIST_DIRECTORY": os.path.join(workdir, "chroma_db"),
+        "EMBEDDING_CACHE_PATH": os.path.join(workdir, "embedding_cache", "embeddings.sqlite3"),
+        "EMBEDDING_CACHE_MAX_ENTRIES": "100000" if args.embedding_cache else "0",
+        "TASK_STORE_PATH": os.path.join(workdir, "task_store", "tasks.sqlite3"),
+        "LLM_PROVIDER": "fake",
+        "EMBEDDINGS_PROVIDER": "fake",
+        "FAKE_LLM_LATENCY_MS": str(args.llm_latency_ms),
+        "FAKE_LLM_TOKENS_PER_SECOND": str(args.llm_tokens_per_second),
+        "FAKE_EMBEDDINGS_LATENCY_MS": str(args.embedding_latency_ms),
+        "INGEST_WORKERS": str(args.ingest_workers),
+        "VECTORSTORE_BACKEND": args.vectorstore_backend,
+        "PYTHONPATH": REPO_ROOT + os.pathsep + env.get("PYTHONPATH", ""),
+    })
+    if not args.chat_cache:
+        env["RETRIEVAL_CACHE_MAX_ENTRIES"] = "0"
+        env["ANSWER_CACHE_MAX_ENTRIES"] = "0"
+    return env
+
+
+def run_ingest_benchmark(args, env):
+    """
+    Executa o ingest.py sobre o corpus e mede arquivos/s, chunks/s e pico de RSS.
+    """
+    command = [sys.executable, "ingest.py"]
+    if args.ingest_mode == "pipeline":
+        command.append("--pipeline")
+    started = time.perf_counter()
+    process = subprocess.run(command, cwd=REPO_ROOT, env=env, capture_output=True, text=True)
+    elapsed = time.perf_counter() - started
+    if process.returncode != 0:
+        raise RuntimeError(f"ingest.py falhou (código {process.returncode}):\n{process.stderr[-4000:]}")
+
+    manifest = IngestManifest(env["CHROMA_PERSIST_DIRECTORY"])
+    files = manifest.sources()
+    chunks = sum(len(manifest.get(source)["chunk_ids"]) for source in files)
+    return {
+        "mode": args.ingest_mode,
+        "files": len(files),
+        "chunks": chunks,
+        "seconds": elapsed,
+        "files_per_second": len(files) / elapsed,
+        "chunks_per_second": chunks / elapsed,
+        "peak_rss_mb": _children_peak_rss_mb(),
+    }
+
+
+def _wait_until_ready(base_url: str, server, timeout: float = 120.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError("O servidor da API terminou durante a inicialização.")
+        try:
+            if requests.get(f"{base_url}/readyz", timeout=1).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("Tempo esgotado aguardando a API ficar disponível.")
+
+
+def run_chat_benchmark(args, env, workdir: str):
+    """
+    Sobe a aplicação FastAPI real (uvicorn) e mede a latência do /chat/ sob
+    a concorrência configurada.
+    """
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    log_path = os.path.join(workdir, "server.log")
+    with open(log_path, "w") as log_file:
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+             "--log-level", "warning"],
+            cwd=REPO_ROOT, env=env, stdout=log_file, stderr=subprocess.STDOUT,
+        )
+    try:
+        _wait_until_ready(base_url, server)
+        local = threading.local()
+
+        def send(query: str):
+            session = getattr(local, "session", None)
+            if session is None:
+                session = local.session = requests.Session()
+            started = time.perf_counter()
+            response = session.post(f"{base_url}/chat/", json={"query": query}, timeout=300)
+            return time.perf_counter() - started, response.status_code
+
+        for query in generate_queries(args.warmup_requests, seed=1):
+            send(query)
+
+        queries = generate_queries(args.requests)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            results = list(executor.map(send, queries))
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(latency for latency, status in results if status == 200)
+        errors = sum(1 for _, status in results if status != 200)
+        to_ms = lambda value: value * 1000 if value is not None else None
+        return {
+            "requests": len(results),
+            "concurrency": args.concurrency,
+            "errors": errors,
+            "seconds": elapsed,
+            "requests_per_second": len(results) / elapsed,
+            "p50_ms": to_ms(_percentile(latencies, 50)),
+            "p95_ms": to_ms(_percentile(latencies, 95)),
+            "p99_ms": to_ms(_percentile(latencies, 99)),
+            "mean_ms": to_ms(sum(latencies) / len(latencies)) if latencies else None,
+            "server_peak_rss_mb": _process_peak_rss_mb(server.pid),
+        }
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+# Métricas comparadas com --compare e se "maior é melhor".
+_COMPARED_METRICS = [
+    ("ingest", "files_per_second", True),
+    ("ingest", "chunks_per_second", True),
+    ("ingest", "peak_rss_mb", False),
+    ("chat", "p50_ms", False),
+    ("chat", "p95_ms", False),
+    ("chat", "p99_ms", False),
+    ("chat", "requests_per_second", True),
+]
+
+
+def compare_results(previous, current):
+    """
+    Imprime a variação das principais métricas em relação a um resultado anterior.
+    """
+    print(f"Comparação com {previous.get('commit') or 'resultado anterior'}:")
+    for section, metric, higher_is_better in _COMPARED_METRICS:
+        old = (previous.get(section) or {}).get(metric)
+        new = (current.get(section) or {}).get(metric)
+        if old is None or new is None or old == 0:
+            continue
+        change = (new - old) / old * 100
+        improved = change > 0 if higher_is_better else change < 0
+        print(f"  {section}.{metric}: {old:.2f} -> {new:.2f} ({change:+.1f}%{'' if abs(change) < 1 else (' melhor' if improved else ' pior')})")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks offline de ingestão e chat do KlarosAI.")
+    parser.add_argument("--files-per-type", type=int, default=20, help="Arquivos gerados de cada tipo (PDF, TXT, DOCX).")
+    parser.add_argument("--pages-per-pdf", type=int, default=10)
+    parser.add_argument("--paragraphs-per-file", type=int, default=30)
+    parser.add_argument("--ingest-mode", choices=["pipeline", "sequential"], default="pipeline")
+    parser.add_argument("--ingest-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--vectorstore-backend", choices=["chroma", "mmap"], default="chroma")
+    parser.add_argument("--requests", type=int, default=200, help="Requisições medidas no /chat/.")
+    parser.add_argument("--warmup-requests", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0, help="Latência simulada do LLM.")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=0.0)
+    parser.add_argument("--embedding-latency-ms", type=float, default=20.0, help="Latência simulada de cada chamada de embeddings.")
+    parser.add_argument("--embedding-cache", action="store_true", help="Mantém o cache persistente de embeddings habilitado.")
+    parser.add_argument("--chat-cache", action="store_true", help="Mantém os caches de recuperação/resposta do chat habilitados.")
+    parser.add_argument("--skip-chat", action="store_true")
+    parser.add_argument("--workdir", help="Diretório de trabalho (padrão: diretório temporário removido ao final).")
+    parser.add_argument("--output", default="bench_output.json")
+    parser.add_argument("--compare", help="JSON de uma execução anterior para comparação.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="klaros-bench-")
+    try:
+        env = build_env(args, workdir)
+        print(f"Gerando corpus sintético em {env['DOCUMENTS_PATH']}...")
+        generate_corpus(env["DOCUMENTS_PATH"], files_per_type=args.files_per_type,
+                        pages_per_pdf=args.pages_per_pdf, paragraphs_per_file=args.paragraphs_per_file)
+
+        results = {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "params": {key: value for key, value in vars(args).items() if key not in ("output", "compare", "workdir")},
+        }
+
+        print("Medindo ingestão...")
+        results["ingest"] = run_ingest_benchmark(args, env)
+        print(json.dumps(results["ingest"], indent=2))
+
+        if not args.skip_chat:
+            print("Medindo latência do /chat/...")
+            results["chat"] = run_chat_benchmark(args, env, workdir)
+            print(json.dumps(results["chat"], indent=2))
+
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(results, output_file, indent=2)
+        print(f"Resultados gravados em {args.output}")
+
+        if args.compare:
+            with open(args.compare, encoding="utf-8") as previous_file:
+                compare_results(json.load(previous_file), results)
+        return results
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
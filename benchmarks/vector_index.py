@@ -0,0 +1,174 @@
+"""
+Benchmark dos backends de índice vetorial (ChromaDB x mmap quantizado).
+
+Gera vetores sintéticos agrupados (parecidos com embeddings reais), grava os
+mesmos dados em cada backend e mede, em um processo novo por backend, o tempo
+de abertura, a latência da busca, o recall@k em relação à busca exata em
+float32 e a memória residente.
+
+Uso (a partir da raiz do repositório):
+    python -m benchmarks.vector_index --vectors 100000 --dim 768
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.run_benchmarks import REPO_ROOT, _percentile
+
+BACKENDS = ("chroma", "mmap-int8", "mmap-float16")
+
+
+def _current_rss_mb():
+    """
+    Memória residente atual (MB) deste processo (somente Linux).
+    """
+    try:
+        with open("/proc/self/status", "r") as status_file:
+            for line in status_file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+def generate_dataset(workdir: str, vectors: int, dim: int, queries: int, k: int, seed: int = 0):
+    """
+    Vetores unitários em torno de centros aleatórios, consultas próximas de
+    vetores do conjunto e a resposta exata (top-k por distância L2).
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, vectors // 500), dim)).astype(np.float32)
+    data = centers[rng.integers(0, len(centers), vectors)] + 0.6 * rng.standard_normal((vectors, dim)).astype(np.float32)
+    data /= np.linalg.norm(data, axis=1, keepdims=True)
+    query_vectors = data[rng.integers(0, vectors, queries)] + 0.2 * rng.standard_normal((queries, dim)).astype(np.float32)
+    query_vectors /= np.linalg.norm(query_vectors, axis=1, keepdims=True)
+
+    # Vetores unitários: a ordem por distância L2 é a ordem inversa do produto escalar.
+    truth = np.argsort(-(data @ query_vectors.T), axis=0)[:k].T
+    np.save(os.path.join(workdir, "data.npy"), data)
+    np.save(os.path.join(workdir, "queries.npy"), query_vectors)
+    np.save(os.path.join(workdir, "truth.npy"), truth)
+
+
+def _open_backend(backend: str, directory: str):
+    if backend == "chroma":
+        from langchain_chroma import Chroma
+        return Chroma(persist_directory=directory, embedding_function=None, collection_name="bench")
+    from mmap_vectorstore import MmapVectorStore
+    return MmapVectorStore(persist_directory=directory, embedding_function=None,
+                           quantization=backend.split("-", 1)[1])
+
+
+def build_backend(backend: str, workdir: str, batch_size: int = 5000):
+    data = np.load(os.path.join(workdir, "data.npy"), mmap_mode="r")
+    vectorstore = _open_backend(backend, os.path.join(workdir, backend))
+    collection = getattr(vectorstore, "_collection", vectorstore)
+    started = time.perf_counter()
+    for start in range(0, len(data), batch_size):
+        block = np.asarray(data[start:start + batch_size])
+        ids = [str(row) for row in range(start, start + len(block))]
+        collection.upsert(ids=ids, embeddings=block.tolist(),
+                          metadatas=[{"row": int(row)} for row in ids], documents=ids)
+    return {"build_seconds": time.perf_counter() - started}
+
+
+def query_backend(backend: str, workdir: str, k: int):
+    query_vectors = np.load(os.path.join(workdir, "queries.npy"))
+    truth = np.load(os.path.join(workdir, "truth.npy"))
+    rss_before = _current_rss_mb()
+    started = time.perf_counter()
+    vectorstore = _open_backend(backend, os.path.join(workdir, backend))
+    open_seconds = time.perf_counter() - started
+
+    latencies, hits = [], 0
+    for query, expected in zip(query_vectors, truth):
+        started = time.perf_counter()
+        documents = vectorstore.similarity_search_by_vector(query.tolist(), k=k)
+        latencies.append(time.perf_counter() - started)
+        hits += len({int(document.page_content) for document in documents} & set(expected.tolist()))
+    latencies.sort()
+    rss_after = _current_rss_mb()
+    return {
+        "open_seconds": open_seconds,
+        "recall_at_k": hits / (len(truth) * k),
+        "p50_ms": _percentile(latencies, 50) * 1000,
+        "p95_ms": _percentile(latencies, 95) * 1000,
+        "rss_mb": rss_after - rss_before if rss_before is not None and rss_after is not None else None,
+    }
+
+
+def _directory_size_mb(directory: str):
+    total = 0
+    for root, _, files in os.walk(directory):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total / (1024 * 1024)
+
+
+def _run_step(step: str, backend: str, workdir: str, k: int):
+    """
+    Executa uma etapa em um processo novo, para medir abertura a frio e RSS isolados.
+    """
+    process = subprocess.run(
+        [sys.executable, "-m", "benchmarks.vector_index", "--step", step, "--backend", backend,
+         "--workdir", workdir, "--k", str(k)],
+        cwd=REPO_ROOT, capture_output=True, text=True,
+    )
+    if process.returncode != 0:
+        raise RuntimeError(f"{step} de {backend} falhou:\n{process.stderr[-4000:]}")
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark dos backends de índice vetorial.")
+    parser.add_argument("--vectors", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    parser.add_argument("--workdir", help="Diretório de trabalho (padrão: diretório temporário removido ao final).")
+    parser.add_argument("--output", default="bench_vector_index.json")
+    parser.add_argument("--step", choices=["build", "query"], help=argparse.SUPPRESS)
+    parser.add_argument("--backend", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.step == "build":
+        print(json.dumps(build_backend(args.backend, args.workdir)))
+        return
+    if args.step == "query":
+        print(json.dumps(query_backend(args.backend, args.workdir, args.k)))
+        return
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="klaros-vector-bench-")
+    try:
+        print(f"Gerando {args.vectors} vetores de dimensão {args.dim}...")
+        generate_dataset(workdir, args.vectors, args.dim, args.queries, args.k)
+        results = {"params": {key: value for key, value in vars(args).items() if key not in ("step", "backend", "workdir")}}
+        for backend in args.backends.split(","):
+            print(f"Medindo {backend}...")
+            result = _run_step("build", backend, workdir, args.k)
+            result.update(_run_step("query", backend, workdir, args.k))
+            result["disk_mb"] = _directory_size_mb(os.path.join(workdir, backend))
+            results[backend] = result
+            print(json.dumps(result, indent=2))
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(results, output_file, indent=2)
+        print(f"Resultados gravados em {args.output}")
+        return results
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
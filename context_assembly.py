@@ -0,0 +1,249 @@
+import math
+import os
+import re
+from dataclasses import dataclass, field
+from typing import List
+
+# Montagem do contexto do prompt a partir dos chunks recuperados:
+# 1) junta chunks adjacentes ou sobrepostos da mesma fonte e página
+#    (o split usa chunk_overlap=200, então vizinhos repetem texto);
+# 2) descarta blocos quase duplicados de blocos já escolhidos;
+# 3) preenche um orçamento de tokens, em ordem de relevância;
+# 4) prefixa cada bloco com a fonte e a página, para as citações.
+
+# Estimativa de tokens: ~4 caracteres por token (suficiente para o orçamento).
+CHARS_PER_TOKEN = 4
+
+# Tamanho mínimo (em caracteres) de uma sobreposição textual para juntar chunks
+# sem start_index (bases ingeridas antes de o split registrar a posição).
+_MIN_TEXT_OVERLAP = 40
+
+# Distância máxima (em caracteres, normalmente uma quebra de linha) entre dois
+# chunks com start_index para que sejam considerados adjacentes.
+_MAX_ADJACENT_GAP = 2
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+@dataclass
+class ContextBlock:
+    source: str
+    page: object
+    text: str
+    rank: int
+    start: int = None
+
+    @property
+    def citation(self) -> str:
+        if self.page is None or self.page == "N/A":
+            return f"[Fonte: {self.source}]"
+        return f"[Fonte: {self.source}, página {self.page}]"
+
+    def render(self) -> str:
+        return f"{self.citation}\n{self.text}"
+
+
+@dataclass
+class AssembledContext:
+    text: str
+    blocks: List[ContextBlock] = field(default_factory=list)
+    input_chunks: int = 0
+    merged_chunks: int = 0
+    dropped_duplicates: int = 0
+    dropped_over_budget: int = 0
+    baseline_tokens: int = 0
+    tokens: int = 0
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(0, self.baseline_tokens - self.tokens)
+
+    def stats(self):
+        return {
+            "chunks": self.input_chunks,
+            "blocks": len(self.blocks),
+            "merged_chunks": self.merged_chunks,
+            "dropped_duplicates": self.dropped_duplicates,
+            "dropped_over_budget": self.dropped_over_budget,
+            "tokens": self.tokens,
+            "baseline_tokens": self.baseline_tokens,
+            "tokens_saved": self.tokens_saved,
+        }
+
+
+def _text_overlap(left: str, right: str) -> int:
+    """
+    Tamanho do maior sufixo de left que é prefixo de right (0 se for menor
+    que _MIN_TEXT_OVERLAP).
+    """
+    probe = right[:_MIN_TEXT_OVERLAP]
+    if len(probe) < _MIN_TEXT_OVERLAP:
+        return 0
+    position = left.find(probe)
+    while position != -1:
+        suffix = left[position:]
+        if right.startswith(suffix):
+            return len(suffix)
+        position = left.find(probe, position + 1)
+    return 0
+
+
+def _merge_by_offset(blocks: List[ContextBlock]):
+    ordered = sorted(blocks, key=lambda block: block.start)
+    merged, merges = [ordered[0]], 0
+    for block in ordered[1:]:
+        current = merged[-1]
+        end = current.start + len(current.text)
+        overlap = end - block.start
+        if overlap < -_MAX_ADJACENT_GAP:
+            merged.append(block)
+            continue
+        if overlap >= len(block.text):
+            # Só está contido se o texto na posição indicada for o mesmo.
+            offset = block.start - current.start
+            if current.text[offset:offset + len(block.text)] != block.text:
+                merged.append(block)
+                continue
+            text = current.text
+        elif overlap > 0 and current.text[-overlap:] == block.text[:overlap]:
+            text = current.text + block.text[overlap:]
+        elif overlap <= 0:
+            text = current.text + "\n" + block.text
+        else:
+            # Offsets inconsistentes (ex.: espaços removidos pelo split).
+            merged.append(block)
+            continue
+        merged[-1] = ContextBlock(current.source, current.page, text, min(current.rank, block.rank), current.start)
+        merges += 1
+    return merged, merges
+
+
+def _merge_by_text(blocks: List[ContextBlock]):
+    merged, merges = [], 0
+    for block in blocks:
+        for index, current in enumerate(merged):
+            if block.text in current.text:
+                text = current.text
+            elif current.text in block.text:
+                text = block.text
+            else:
+                overlap = _text_overlap(current.text, block.text)
+                if overlap:
+                    text = current.text + block.text[overlap:]
+                else:
+                    overlap = _text_overlap(block.text, current.text)
+                    if not overlap:
+                        continue
+                    text = block.text + current.text[overlap:]
+            merged[index] = ContextBlock(current.source, current.page, text, min(current.rank, block.rank))
+            merges += 1
+            break
+        else:
+            merged.append(block)
+    return merged, merges
+
+
+def _merge_group(blocks: List[ContextBlock]):
+    """
+    Junta os blocos de uma mesma fonte/página que se sobrepõem ou se tocam.
+    Usa start_index quando disponível; caso contrário, procura a sobreposição
+    no próprio texto. Retorna (blocos resultantes, número de junções).
+    """
+    if all(block.start is not None for block in blocks):
+        return _merge_by_offset(blocks)
+    # Sem posições, uma junção pode criar uma nova sobreposição: repete até estabilizar.
+    total = 0
+    while True:
+        blocks, merges = _merge_by_text(blocks)
+        total += merges
+        if not merges:
+            return blocks, total
+
+
+def _shingles(text: str, size: int = 3):
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < size:
+        return {tuple(words)} if words else set()
+    return {tuple(words[index:index + size]) for index in range(len(words) - size + 1)}
+
+
+def _page_label(metadata):
+    """
+    Página como o leitor a vê: page_label do PDF, se houver; senão a página
+    numerada a partir de 1 (o PyPDFLoader numera a partir de 0).
+    """
+    label = metadata.get("page_label")
+    if label:
+        return label
+    page = metadata.get("page", "N/A")
+    return page + 1 if isinstance(page, int) else page
+
+
+def assemble_context(documents, token_budget: int = None, dedup_threshold: float = None) -> AssembledContext:
+    """
+    Monta o contexto do prompt a partir dos documentos recuperados (em ordem de
+    relevância). Blocos quase duplicados (fração de trigramas de palavras
+    contida em um bloco já escolhido >= dedup_threshold) são descartados, e os
+    blocos são incluídos em ordem de relevância até token_budget.
+    O resultado inclui a comparação com o contexto sem tratamento ("stuff").
+    """
+    if token_budget is None:
+        token_budget = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+    if dedup_threshold is None:
+        dedup_threshold = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.85"))
+
+    documents = list(documents)
+    baseline_tokens = estimate_tokens("\n\n".join(doc.page_content for doc in documents))
+    result = AssembledContext(text="", input_chunks=len(documents), baseline_tokens=baseline_tokens)
+    if not documents:
+        return result
+
+    groups = {}
+    for rank, doc in enumerate(documents):
+        # Agrupa pelo caminho completo: arquivos homônimos em pastas diferentes
+        # não se juntam; a citação mostra só o nome do arquivo.
+        source = str(doc.metadata.get("source", "Desconhecido"))
+        page = doc.metadata.get("page", "N/A")
+        start = doc.metadata.get("start_index")
+        block = ContextBlock(os.path.basename(source), _page_label(doc.metadata), doc.page_content, rank,
+                             start if isinstance(start, int) else None)
+        groups.setdefault((source, str(page)), []).append(block)
+
+    candidates = []
+    for blocks in groups.values():
+        merged, merges = _merge_group(blocks)
+        candidates.extend(merged)
+        result.merged_chunks += merges
+    candidates.sort(key=lambda block: block.rank)
+
+    kept, kept_shingles = [], []
+    for block in candidates:
+        shingles = _shingles(block.text)
+        if shingles and any(len(shingles & other) / len(shingles) >= dedup_threshold for other in kept_shingles):
+            result.dropped_duplicates += 1
+            continue
+        kept.append(block)
+        kept_shingles.append(shingles)
+
+    separator_tokens = estimate_tokens("\n\n")
+    used = 0
+    for block in kept:
+        cost = estimate_tokens(block.render()) + (separator_tokens if result.blocks else 0)
+        if used + cost > token_budget:
+            if result.blocks:
+                result.dropped_over_budget += 1
+                continue
+            # O bloco mais relevante entra sempre, truncado ao orçamento.
+            limit = max(0, token_budget * CHARS_PER_TOKEN - len(block.citation) - 1)
+            block = ContextBlock(block.source, block.page, block.text[:limit].rsplit(" ", 1)[0], block.rank, block.start)
+            cost = estimate_tokens(block.render())
+        result.blocks.append(block)
+        used += cost
+
+    result.text = "\n\n".join(block.render() for block in result.blocks)
+    result.tokens = estimate_tokens(result.text)
+    return result
@@ -0,0 +1,163 @@
+import os
+import sqlite3
+import hashlib
+import threading
+import time
+from array import array
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+
+# Limite de variáveis por consulta do SQLite (o padrão antigo é 999).
+_SQLITE_MAX_VARIABLES = 900
+
+
+class EmbeddingCache:
+    """
+    Cache persistente de embeddings em SQLite, com chave (modelo, hash do texto),
+    despejo LRU limitado por número de entradas e contadores de acertos/erros.
+    Pode ser compartilhado entre processos (modo WAL do SQLite).
+    """
+
+    def __init__(self, path: str, max_entries: int = 100000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings(last_access)")
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    @staticmethod
+    def make_key(namespace: str, text: str) -> str:
+        return hashlib.sha256(f"{namespace}\x00{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: List[str]):
+        """
+        Retorna um dict {chave: vetor} com as chaves encontradas no cache
+        e atualiza o horário de último acesso (LRU) dessas entradas.
+        """
+        found = {}
+        if not keys:
+            return found
+        now = time.time()
+        with self._lock:
+            for start in range(0, len(keys), _SQLITE_MAX_VARIABLES):
+                batch = keys[start:start + _SQLITE_MAX_VARIABLES]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+                if rows:
+                    self._conn.execute(
+                        f"UPDATE embeddings SET last_access = ? WHERE key IN ({placeholders})",
+                        [now, *batch]
+                    )
+            self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(set(keys)) - len(found)
+        return found
+
+    def put_many(self, items):
+        """
+        Grava pares (chave, vetor) no cache e despeja as entradas menos
+        recentemente usadas se o limite for ultrapassado.
+        """
+        if not items or self.max_entries <= 0:
+            return
+        now = time.time()
+        rows = [(key, array("f", vector).tobytes(), now) for key, vector in items]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_access) VALUES (?, ?, ?)", rows
+            )
+            self._size += len(rows)
+            if self._size > self.max_entries:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        # Recalcula o tamanho real (outros processos podem ter escrito) e
+        # despeja até 90% do limite, para não despejar a cada inserção.
+        self._size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        if self._size <= self.max_entries:
+            return
+        target = int(self.max_entries * 0.9)
+        to_remove = self._size - target
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN "
+            "(SELECT key FROM embeddings ORDER BY last_access ASC LIMIT ?)",
+            (to_remove,)
+        )
+        self._size = target
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0,
+            "entries": self._size,
+            "max_entries": self.max_entries,
+        }
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Envolve um modelo de embeddings do LangChain consultando o EmbeddingCache
+    antes de chamar o modelo. Documentos e consultas usam namespaces separados,
+    pois alguns provedores (ex.: Gemini) geram vetores diferentes para cada tipo.
+    """
+
+    def __init__(self, underlying: Embeddings, namespace: str, cache: EmbeddingCache):
+        self.underlying = underlying
+        self.namespace = namespace
+        self.cache = cache
+
+    def _embed_with_cache(self, texts: List[str], kind: str, embed_fn):
+        namespace = f"{self.namespace}:{kind}"
+        keys = [EmbeddingCache.make_key(namespace, text) for text in texts]
+        found = self.cache.get_many(list(dict.fromkeys(keys)))
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        if missing:
+            vectors = embed_fn(list(missing.values()))
+            computed = list(zip(missing.keys(), vectors))
+            self.cache.put_many(computed)
+            found.update(computed)
+        return [found[key] for key in keys]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed_with_cache(texts, "document", self.underlying.embed_documents)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed_with_cache(
+            [text], "query", lambda texts: [self.underlying.embed_query(texts[0])]
+        )[0]
+
+    def embed_queries(self, texts: List[str], batch_fn=None) -> List[List[float]]:
+        """
+        Embeddings de várias consultas. As que não estão no cache são calculadas
+        por batch_fn em uma única chamada (ou uma a uma, se batch_fn for None).
+        """
+        if batch_fn is None:
+            batch_fn = lambda missing: [self.underlying.embed_query(text) for text in missing]
+        return self._embed_with_cache(texts, "query", batch_fn)
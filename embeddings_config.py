@@ -0,0 +1,145 @@
+import os
+from embedding_cache import EmbeddingCache, CachedEmbeddings
+
+# Configuração do modelo de embeddings, compartilhada por ingest.py e main.py
+
+_embeddings = None
+
+# Backend usado por todas as bases criadas antes da configuração de provedor.
+LEGACY_EMBEDDINGS_BACKEND = "google:models/embedding-001"
+COLLECTION_BACKEND_KEY = "embeddings_backend"
+
+
+def get_embeddings_backend() -> str:
+    """
+    Identificador do provedor e modelo de embeddings configurados
+    (ex.: "google:models/embedding-001"). É gravado nos metadados da coleção
+    do ChromaDB e usado como namespace do cache de embeddings.
+    """
+    provider = os.getenv("EMBEDDINGS_PROVIDER", "google").lower()
+    if provider == "google":
+        default_model = "models/embedding-001"
+    elif provider == "fake":
+        default_model = "fake-768"
+    else:
+        from local_embeddings import DEFAULT_LOCAL_MODEL
+        default_model = DEFAULT_LOCAL_MODEL
+    return f"{provider}:{os.getenv('EMBEDDINGS_MODEL', default_model)}"
+
+
+def _build_base_embeddings(provider: str, model_name: str):
+    if provider == "google":
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+        return GoogleGenerativeAIEmbeddings(model=model_name)
+    if provider in ("huggingface", "onnx"):
+        from local_embeddings import build_local_embeddings, QueryBatchingEmbeddings
+        local_embeddings = build_local_embeddings(
+            provider,
+            model_name,
+            threads=int(os.getenv("EMBEDDINGS_THREADS", "0")),
+            batch_size=int(os.getenv("EMBEDDINGS_BATCH_SIZE", "32")),
+        )
+        return QueryBatchingEmbeddings(
+            local_embeddings,
+            max_batch_size=int(os.getenv("EMBEDDINGS_QUERY_BATCH_SIZE", "32")),
+            max_wait_ms=float(os.getenv("EMBEDDINGS_QUERY_BATCH_WAIT_MS", "5")),
+        )
+    if provider == "fake":
+        # Embeddings determinísticos dos benchmarks (sem rede).
+        from benchmarks.fakes import FakeEmbeddings
+        return FakeEmbeddings(latency_ms=float(os.getenv("FAKE_EMBEDDINGS_LATENCY_MS", "0")))
+    raise ValueError(f"EMBEDDINGS_PROVIDER desconhecido: {provider}. Use 'google', 'huggingface' ou 'onnx'.")
+
+
+def get_embeddings():
+    """
+    Retorna a instância (única por processo) do modelo de embeddings configurado,
+    envolvida pelo cache persistente de embeddings.
+    Por padrão, usa o GoogleGenerativeAIEmbeddings; EMBEDDINGS_PROVIDER=huggingface
+    ou onnx usa um modelo sentence-transformers local, sem chamadas de rede.
+    """
+    global _embeddings
+    if _embeddings is not None:
+        return _embeddings
+
+    backend = get_embeddings_backend()
+    provider, model_name = backend.split(":", 1)
+    base_embeddings = _build_base_embeddings(provider, model_name)
+
+    max_entries = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "100000"))
+    if max_entries <= 0:
+        # Cache desabilitado explicitamente.
+        _embeddings = base_embeddings
+        return _embeddings
+
+    cache = EmbeddingCache(
+        path=os.getenv("EMBEDDING_CACHE_PATH", "./embedding_cache/embeddings.sqlite3"),
+        max_entries=max_entries,
+    )
+    _embeddings = CachedEmbeddings(base_embeddings, namespace=backend, cache=cache)
+    return _embeddings
+
+
+def _query_batch_fn(embeddings):
+    """
+    Função que calcula os embeddings de várias consultas em uma única chamada
+    ao provedor configurado.
+    """
+    provider = get_embeddings_backend().split(":", 1)[0]
+    if provider == "google":
+        # Endpoint em lote do Gemini, com o mesmo tipo de tarefa das consultas.
+        return lambda texts: embeddings.embed_documents(texts, task_type="RETRIEVAL_QUERY")
+    # Provedores locais e falsos usam o mesmo modelo para consultas e documentos.
+    return embeddings.embed_documents
+
+
+def embed_queries(texts):
+    """
+    Embeddings de várias consultas (ex.: /chat/batch) em uma única chamada em
+    lote ao provedor, consultando antes o cache de embeddings.
+    """
+    embeddings = get_embeddings()
+    if isinstance(embeddings, CachedEmbeddings):
+        return embeddings.embed_queries(texts, _query_batch_fn(embeddings.underlying))
+    return _query_batch_fn(embeddings)(texts)
+
+
+def get_embedding_cache_stats():
+    """
+    Retorna as estatísticas do cache de embeddings do processo atual (ou None).
+    """
+    if isinstance(_embeddings, CachedEmbeddings):
+        return _embeddings.cache.stats()
+    return None
+
+
+def check_collection_backend(vectorstore):
+    """
+    Garante que a coleção do índice vetorial foi criada com o mesmo backend de
+    embeddings configurado. Coleções novas (vazias) recebem o backend atual
+    nos metadados; coleções antigas sem o registro são tratadas como criadas
+    com o backend legado (Gemini embedding-001).
+    Levanta ValueError se houver divergência.
+    """
+    backend = get_embeddings_backend()
+    # O MmapVectorStore expõe a mesma interface da coleção do ChromaDB.
+    collection = getattr(vectorstore, "_collection", vectorstore)
+    metadata = dict(collection.metadata or {})
+    stored_backend = metadata.get(COLLECTION_BACKEND_KEY)
+
+    if stored_backend is None:
+        if collection.count() > 0:
+            stored_backend = LEGACY_EMBEDDINGS_BACKEND
+        else:
+            stored_backend = backend
+        # Parâmetros "hnsw:*" não podem ser alterados depois da criação.
+        metadata = {key: value for key, value in metadata.items() if not key.startswith("hnsw:")}
+        metadata[COLLECTION_BACKEND_KEY] = stored_backend
+        collection.modify(metadata=metadata)
+
+    if stored_backend != backend:
+        raise ValueError(
+            f"A base vetorial foi criada com o backend de embeddings '{stored_backend}', "
+            f"mas o configurado é '{backend}'. Ajuste EMBEDDINGS_PROVIDER/EMBEDDINGS_MODEL "
+            f"ou recrie a base com 'python ingest.py clean'."
+        )
@@ -1,9 +1,16 @@
 import streamlit as st
 import requests
-import time
 import os
+import json
 
 API_BASE_URL = "http://localhost:8000"
+# Timeouts (conexão, leitura) das chamadas à API: o chat nunca fica preso
+# indefinidamente se o provedor do LLM travar.
+CHAT_TIMEOUT = (5, 120)
+UPLOAD_TIMEOUT = (5, 600)
+# Quanto o frontend aguarda, em /chat/answer/, uma resposta que excedeu o prazo
+# do /chat/stream (a API limita a espera a 30 s).
+CHAT_ANSWER_WAIT_MS = 30000
 
 st.set_page_config(
     page_title="KlarosAI - Seu Assistente de Conhecimento",
@@ -27,32 +34,109 @@ if "ingestion_status" not in st.session_state:
 if "ingestion_task_id" not in st.session_state:
     st.session_state.ingestion_task_id = None
 
+@st.cache_resource
+def get_http_session():
+    """
+    Sessão HTTP compartilhada entre as execuções do script e as abas, com pool
+    de conexões reutilizáveis para a API.
+    """
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=32)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+http_session = get_http_session()
+
 def display_message(role, content):
     with st.chat_message(role):
         st.markdown(content)
 
+def iter_sse_events(response):
+    """
+    Lê uma resposta Server-Sent Events e gera pares (evento, dados).
+    """
+    event, data_lines = "message", []
+    for line in response.iter_lines(decode_unicode=True):
+        if line is None:
+            continue
+        if line == "":
+            if data_lines:
+                yield event, json.loads("\n".join(data_lines))
+            event, data_lines = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data_lines.append(line[len("data:"):].strip())
+
+def stream_answer_tokens(response, stream_state):
+    """
+    Gera os tokens da resposta para o st.write_stream, guardando os documentos
+    de origem (enviados antes dos tokens) em stream_state. Se a geração exceder
+    o prazo da API, guarda o answer_id da resposta pendente.
+    """
+    for event, data in iter_sse_events(response):
+        if event == "sources":
+            stream_state["source_documents"] = data.get("source_documents", [])
+        elif event == "token":
+            yield data.get("text", "")
+        elif event == "error":
+            raise RuntimeError(data.get("detail", "Erro desconhecido durante o streaming."))
+        elif event == "done":
+            stream_state["response"] = data.get("response")
+            return
+        elif event == "pending":
+            stream_state["answer_id"] = data.get("answer_id")
+            stream_state["pending_message"] = data.get("response")
+            return
+
+def fetch_pending_answer(answer_id):
+    """
+    Aguarda, em /chat/answer/, a resposta de uma geração que excedeu o prazo.
+    Retorna a resposta completa, ou None se ela ainda não estiver pronta.
+    """
+    response = http_session.get(f"{API_BASE_URL}/chat/answer/{answer_id}",
+                                params={"wait_ms": CHAT_ANSWER_WAIT_MS},
+                                timeout=(5, CHAT_ANSWER_WAIT_MS / 1000 + 10))
+    response.raise_for_status()
+    if response.status_code == 202:
+        return None
+    return response.json().get("response")
+
 for message in st.session_state.messages:
     display_message(message["role"], message["content"])
 
-uploaded_file = st.sidebar.file_uploader(
-    "Carregar Documento (PDF, TXT, DOCX)",
-    type=["pdf", "txt", "docx"],
-    accept_multiple_files=False,
+uploaded_files = st.sidebar.file_uploader(
+    "Carregar Documentos (PDF, TXT, DOCX ou ZIP)",
+    type=["pdf", "txt", "docx", "zip"],
+    accept_multiple_files=True,
     key="file_uploader"
 )
 
-if uploaded_file is not None:
+if uploaded_files:
     if st.session_state.ingestion_status is None or st.session_state.ingestion_status in ["completed", "failed"]:
-        st.sidebar.info("Arquivo carregado. Iniciando ingestão...")
+        st.sidebar.info("Arquivos carregados. Iniciando ingestão...")
         try:
-            files = {"file": (uploaded_file.name, uploaded_file.getvalue(), uploaded_file.type)}
-            response = requests.post(f"{API_BASE_URL}/uploadfile/", files=files)
+            if len(uploaded_files) == 1 and not uploaded_files[0].name.lower().endswith(".zip"):
+                uploaded_file = uploaded_files[0]
+                files = {"file": (uploaded_file.name, uploaded_file.getvalue(), uploaded_file.type)}
+                response = http_session.post(f"{API_BASE_URL}/uploadfile/", files=files, timeout=UPLOAD_TIMEOUT)
+            else:
+                # Vários arquivos (ou um .zip): uma única tarefa de ingestão em lote.
+                files = [("files", (uploaded_file.name, uploaded_file.getvalue(), uploaded_file.type))
+                         for uploaded_file in uploaded_files]
+                response = http_session.post(f"{API_BASE_URL}/uploadfiles/", files=files, timeout=UPLOAD_TIMEOUT)
             response.raise_for_status()
 
             upload_result = response.json()
             st.session_state.ingestion_task_id = upload_result.get("task_id")
-            st.session_state.ingestion_status = "pending"
-            st.sidebar.success(f"Upload bem-sucedido! ID da Tarefa: {st.session_state.ingestion_task_id}")
+            if st.session_state.ingestion_task_id is None:
+                # Conteúdo já ingerido: a API não cria tarefa de ingestão.
+                st.session_state.ingestion_status = "completed"
+                st.sidebar.info(upload_result.get("message", "Documento já ingerido."))
+            else:
+                st.session_state.ingestion_status = "pending"
+                st.sidebar.success(f"Upload bem-sucedido! ID da Tarefa: {st.session_state.ingestion_task_id}")
 
         except requests.exceptions.RequestException as e:
             st.sidebar.error(f"Erro ao carregar o arquivo: {e}")
@@ -65,64 +149,94 @@ if uploaded_file is not None:
     else:
         st.sidebar.warning(f"Já existe uma ingestão em andamento: {st.session_state.ingestion_status.capitalize()}")
 
+def describe_progress(status):
+    """
+    Texto do progresso da ingestão (estágio, chunks e contagem de arquivos).
+    """
+    parts = [status.get("message") or status.get("status", "").capitalize()]
+    if status.get("chunks_total"):
+        parts.append(f"{status.get('chunks_written') or 0}/{status['chunks_total']} chunks gravados")
+    elif status.get("chunks_embedded"):
+        parts.append(f"{status['chunks_embedded']} chunks com embeddings")
+    if status.get("file_counts"):
+        parts.append("arquivos: " + ", ".join(f"{count} {name}" for name, count in status["file_counts"].items()))
+    return " · ".join(parts)
+
 if st.session_state.ingestion_task_id and st.session_state.ingestion_status not in ["completed", "failed"]:
-    st.sidebar.text(f"Status da Ingestão: {st.session_state.ingestion_status.capitalize()}...")
+    # Acompanha a ingestão pelo stream de progresso (SSE): uma única conexão
+    # aberta enquanto a tarefa roda, sem novas execuções do script a cada segundo.
+    progress_bar = st.sidebar.progress(0, text="Aguardando o início da ingestão...")
+    final_status = None
     try:
-        status_response = requests.get(f"{API_BASE_URL}/ingestion-status/{st.session_state.ingestion_task_id}")
-        status_response.raise_for_status()
-        current_status = status_response.json()
-
-        if current_status["status"] != st.session_state.ingestion_status:
-            st.session_state.ingestion_status = current_status["status"]
-            if st.session_state.ingestion_status == "completed":
-                st.sidebar.success(f"Ingestão concluída: {current_status.get('message', 'Documento processado.')}")
-                st.rerun()
-            elif st.session_state.ingestion_status == "failed":
-                st.sidebar.error(f"Ingestão falhou: {current_status.get('message', 'Verifique os logs do servidor.')}")
-            else:
-                st.sidebar.info(f"Status atual: {current_status.get('status')} - {current_status.get('message')}")
-
-    except requests.exceptions.RequestException as e:
-        st.sidebar.error(f"Erro ao verificar status da ingestão: {e}")
+        with http_session.get(f"{API_BASE_URL}/ingestion-status/{st.session_state.ingestion_task_id}/stream",
+                              stream=True, timeout=(5, 60)) as status_response:
+            status_response.raise_for_status()
+            status_response.encoding = "utf-8"
+            for event, data in iter_sse_events(status_response):
+                if event == "progress":
+                    percent = data.get("percent") or 0.0
+                    progress_bar.progress(min(int(percent), 100), text=describe_progress(data))
+                elif event == "done":
+                    final_status = data
+                    break
+                elif event == "error":
+                    raise RuntimeError(data.get("detail", "Erro desconhecido no progresso da ingestão."))
+    except (requests.exceptions.RequestException, RuntimeError) as e:
+        st.sidebar.error(f"Erro ao acompanhar a ingestão: {e}")
         st.session_state.ingestion_status = "failed"
-    time.sleep(1)
-    st.rerun()
+
+    if final_status is not None:
+        st.session_state.ingestion_status = final_status["status"]
+        if final_status["status"] == "completed":
+            st.sidebar.success(f"Ingestão concluída: {final_status.get('message', 'Documento processado.')}")
+        else:
+            st.sidebar.error(f"Ingestão falhou: {final_status.get('message', 'Verifique os logs do servidor.')}")
 
 if prompt := st.chat_input("Pergunte sobre seus documentos aqui..."):
     st.session_state.messages.append({"role": "user", "content": prompt})
     display_message("user", prompt)
 
-    with st.spinner("Pensando..."):
-        response = None
-        try:
-            response = requests.post(f"{API_BASE_URL}/chat/", json={"query": prompt})
+    response = None
+    try:
+        with st.spinner("Pensando..."):
+            response = http_session.post(f"{API_BASE_URL}/chat/stream", json={"query": prompt}, stream=True,
+                                         timeout=CHAT_TIMEOUT)
             response.raise_for_status()
+            response.encoding = "utf-8"
+
+        stream_state = {"source_documents": [], "response": None, "answer_id": None}
+        with st.chat_message("assistant"):
+            streamed_response = st.write_stream(stream_answer_tokens(response, stream_state))
+            if stream_state["answer_id"]:
+                with st.spinner("A resposta está demorando mais que o normal; aguardando o restante..."):
+                    stream_state["response"] = fetch_pending_answer(stream_state["answer_id"])
+                if stream_state["response"]:
+                    st.markdown(stream_state["response"])
+                else:
+                    st.info(f"{stream_state['pending_message']} (ID da resposta: {stream_state['answer_id']})")
+        assistant_response = stream_state["response"] or streamed_response or "Não foi possível obter uma resposta."
+        source_documents = stream_state["source_documents"]
+
+        st.session_state.messages.append({"role": "assistant", "content": assistant_response})
+
+        if source_documents:
+            with st.expander("Documentos de Origem Utilizados"):
+                for doc in source_documents:
+                    st.write(f"**Fonte:** {doc.get('source', 'Desconhecido')} - Página: {doc.get('page', 'N/A')}")
+                    st.code(doc.get('content', '')[:500] + '...' if len(doc.get('content', '')) > 500 else doc.get('content', ''))
 
-            api_response = response.json()
-            assistant_response = api_response.get("response", "Não foi possível obter uma resposta.")
-            source_documents = api_response.get("source_documents", [])
-
-            st.session_state.messages.append({"role": "assistant", "content": assistant_response})
-            display_message("assistant", assistant_response)
-
-            if source_documents:
-                with st.expander("Documentos de Origem Utilizados"):
-                    for doc in source_documents:
-                        st.write(f"**Fonte:** {doc.get('source', 'Desconhecido')} - Página: {doc.get('page', 'N/A')}")
-                        st.code(doc.get('content', '')[:500] + '...' if len(doc.get('content', '')) > 500 else doc.get('content', ''))
-
-        except requests.exceptions.RequestException as e:
-            error_message = f"Erro de comunicação com a API: {e}"
-            if response is not None:
-                try:
-                    error_detail = response.json().get("detail", "Nenhum detalhe adicional.")
-                    error_message = f"Erro da API: {error_detail}"
-                except ValueError:
-                    error_message = f"Erro da API: {response.text}"
-            st.error(error_message)
-            st.session_state.messages.append({"role": "assistant", "content": f"Ocorreu um erro: {error_message}"})
-            display_message("assistant", f"Ocorreu um erro: {error_message}")
-        except Exception as e:
-            st.error(f"Ocorreu um erro inesperado: {e}")
-            st.session_state.messages.append({"role": "assistant", "content": f"Ocorreu um erro inesperado: {e}"})
-            display_message("assistant", f"Ocorreu um erro inesperado: {e}")
\ No newline at end of file
+    except requests.exceptions.RequestException as e:
+        error_message = f"Erro de comunicação com a API: {e}"
+        if response is not None:
+            try:
+                error_detail = response.json().get("detail", "Nenhum detalhe adicional.")
+                error_message = f"Erro da API: {error_detail}"
+            except ValueError:
+                error_message = f"Erro da API: {response.text}"
+        st.error(error_message)
+        st.session_state.messages.append({"role": "assistant", "content": f"Ocorreu um erro: {error_message}"})
+        display_message("assistant", f"Ocorreu um erro: {error_message}")
+    except Exception as e:
+        st.error(f"Ocorreu um erro inesperado: {e}")
+        st.session_state.messages.append({"role": "assistant", "content": f"Ocorreu um erro inesperado: {e}"})
+        display_message("assistant", f"Ocorreu um erro inesperado: {e}")
\ No newline at end of file
@@ -1,15 +1,32 @@
 import os
 from dotenv import load_dotenv
 from langchain_community.document_loaders import PyPDFLoader, TextLoader, Docx2txtLoader
-from langchain_google_genai import GoogleGenerativeAIEmbeddings # Mantenha GoogleGenerativeAIEmbeddings se estiver usando Gemini para embeddings
 from langchain_chroma import Chroma
+from chromadb.api.shared_system_client import SharedSystemClient
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 import shutil # Para remover o diretório existente do ChromaDB (ainda útil para recriação manual)
 import sys # Nova importação para argumentos de linha de comando
+import time
+import logging
+import itertools
+import hashlib
+import pickle
+import tempfile
+import multiprocessing
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from embeddings_config import get_embeddings, get_embedding_cache_stats, check_collection_backend
+from ingest_manifest import IngestManifest, file_sha256, make_chunk_id, source_key
+from metrics import StageTimer
+from task_store import open_task_store
+from file_lock import FileLock
 
 # Carrega as variáveis de ambiente do arquivo .env
 load_dotenv()
 
+logger = logging.getLogger("klaros.ingest")
+
 # Define o diretório onde os documentos estão e onde o ChromaDB será salvo
 DOCUMENTS_PATH = os.getenv("DOCUMENTS_PATH")
 CHROMA_PERSIST_DIRECTORY = os.getenv("CHROMA_PERSIST_DIRECTORY", "./chroma_db")
@@ -20,49 +37,94 @@ if not DOCUMENTS_PATH:
 if not CHROMA_PERSIST_DIRECTORY:
     raise ValueError("CHROMA_PERSIST_DIRECTORY não está definido no arquivo .env")
 
+# Configuração do modo pipeline (python ingest.py --pipeline)
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 1)))
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "128"))
+
+# Parte do progresso (%) de uma ingestão atribuída ao cálculo dos embeddings;
+# o restante corresponde à gravação no índice vetorial.
+EMBED_PROGRESS_SHARE = 90.0
+
+# Tentativas de abrir o ChromaDB (ver open_vectorstore).
+OPEN_VECTORSTORE_ATTEMPTS = 3
+
+# Backend do índice vetorial: "chroma" (padrão) ou "mmap" (mmap_vectorstore.py,
+# vetores quantizados em arquivos mapeados em memória, dentro de
+# CHROMA_PERSIST_DIRECTORY para que o manifesto e o `clean` valham para ambos).
+VECTORSTORE_BACKEND = os.getenv("VECTORSTORE_BACKEND", "chroma").lower()
+VECTORSTORE_QUANTIZATION = os.getenv("VECTORSTORE_QUANTIZATION", "int8").lower()
+VECTORSTORE_RERANK_FACTOR = int(os.getenv("VECTORSTORE_RERANK_FACTOR", "4"))
+MMAP_INDEX_DIRECTORY = os.path.join(CHROMA_PERSIST_DIRECTORY, "mmap_index")
+
+# Lock de arquivo que serializa os escritores do índice vetorial e do manifesto
+# entre processos (workers da API e ingest.py). Fica fora de
+# CHROMA_PERSIST_DIRECTORY para sobreviver ao `python ingest.py clean`.
+INGEST_WRITE_LOCK_PATH = os.getenv("INGEST_WRITE_LOCK_PATH", "./task_store/ingest_write.lock")
+_write_lock_state = threading.local()
+
 # --- Configuração do Loader de Embeddings ---
-# Usando GoogleGenerativeAIEmbeddings como no seu main.py
-EMBEDDINGS = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
+# Mesmo modelo (e mesmo cache persistente de embeddings) usado pelo main.py
+EMBEDDINGS = get_embeddings()
+
+# Extensões de arquivo com loader (ver _get_loader).
+SUPPORTED_EXTENSIONS = (".pdf", ".txt", ".docx")
 
 # --- Funções Auxiliares ---
-def load_documents(directory_path: str, specific_file: str = None):
+def configure_logging():
     """
-    Carrega documentos do diretório especificado ou de um arquivo específico.
-    Suporta PDF, TXT e DOCX.
+    Configura os logs de quem executa a ingestão fora da API (terminal do
+    ingest.py e processos dos pools), no nível de LOG_LEVEL.
+    """
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(),
+                        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+def _get_loader(file_path: str):
+    """
+    Retorna o loader adequado para o tipo do arquivo, ou None se não for suportado.
+    """
+    lower_path = file_path.lower()
+    if lower_path.endswith(".pdf"):
+        return PyPDFLoader(file_path)
+    elif lower_path.endswith(".txt"):
+        return TextLoader(file_path)
+    elif lower_path.endswith(".docx"):
+        return Docx2txtLoader(file_path)
+    return None
+
+def _list_files(directory_path: str, specific_file: str = None):
+    """
+    Lista os arquivos suportados do diretório especificado ou o arquivo específico.
     """
-    documents = []
     if specific_file:
         file_path = os.path.join(directory_path, specific_file)
         if not os.path.exists(file_path):
-            print(f"Erro: Arquivo '{file_path}' não encontrado.")
-            return []
-        print(f"Carregando documento específico: {file_path}")
-        if file_path.lower().endswith(".pdf"):
-            loader = PyPDFLoader(file_path)
-        elif file_path.lower().endswith(".txt"):
-            loader = TextLoader(file_path)
-        elif file_path.lower().endswith(".docx"):
-            loader = Docx2txtLoader(file_path)
-        else:
-            print(f"Tipo de arquivo não suportado para {file_path}. Ignorando.")
+            logger.error("Arquivo '%s' não encontrado.", file_path)
             return []
-        documents.extend(loader.load())
+        candidates = [file_path]
     else:
-        print(f"Carregando documentos do diretório: {directory_path}")
+        logger.info("Listando documentos do diretório: %s", directory_path)
+        candidates = []
         for root, _, files in os.walk(directory_path):
-            for file_name in files:
-                file_path = os.path.join(root, file_name)
-                print(f"Carregando: {file_path}")
-                if file_name.lower().endswith(".pdf"):
-                    loader = PyPDFLoader(file_path)
-                elif file_name.lower().endswith(".txt"):
-                    loader = TextLoader(file_path)
-                elif file_name.lower().endswith(".docx"):
-                    loader = Docx2txtLoader(file_path)
-                else:
-                    print(f"Tipo de arquivo não suportado para {file_name}. Ignorando.")
-                    continue
-                documents.extend(loader.load())
+            for file_name in sorted(files):
+                candidates.append(os.path.join(root, file_name))
+
+    file_paths = []
+    for file_path in candidates:
+        if _get_loader(file_path) is None:
+            logger.warning("Tipo de arquivo não suportado para %s. Ignorando.", file_path)
+            continue
+        file_paths.append(file_path)
+    return file_paths
+
+def load_documents(directory_path: str, specific_file: str = None):
+    """
+    Carrega documentos do diretório especificado ou de um arquivo específico.
+    Suporta PDF, TXT e DOCX.
+    """
+    documents = []
+    for file_path in _list_files(directory_path, specific_file=specific_file):
+        logger.info("Carregando: %s", file_path)
+        documents.extend(_get_loader(file_path).load())
     return documents
 
 def split_documents(documents):
@@ -74,68 +136,727 @@ def split_documents(documents):
         chunk_overlap=200,
         length_function=len,
         is_separator_regex=False,
+        # Posição do chunk na página: permite juntar chunks vizinhos no contexto do chat.
+        add_start_index=True,
     )
     return text_splitter.split_documents(documents)
 
-def process_documents_and_add_to_vectorstore(specific_file: str = None):
+def assign_chunk_ids(texts, source: str):
     """
-    Carrega, divide em chunks e adiciona documentos ao ChromaDB.
-    Se specific_file for fornecido, processa apenas esse arquivo.
-    Caso contrário, processa todos os documentos no DOCUMENTS_PATH.
+    Atribui IDs determinísticos (fonte + página + hash do conteúdo) aos chunks.
+    Chunks idênticos na mesma página são descartados, pois teriam o mesmo ID.
+    Retorna as listas (ids, chunks) alinhadas.
     """
-    # 1. Carrega os documentos
-    documents = load_documents(DOCUMENTS_PATH, specific_file=specific_file)
-    print(f"Total de documentos carregados: {len(documents)}")
+    ids = []
+    unique_texts = []
+    seen = set()
+    for text in texts:
+        chunk_id = make_chunk_id(source, text.metadata.get("page"), text.page_content)
+        if chunk_id in seen:
+            continue
+        seen.add(chunk_id)
+        text.metadata["chunk_id"] = chunk_id
+        ids.append(chunk_id)
+        unique_texts.append(text)
+    return ids, unique_texts
 
-    if not documents:
-        print("Nenhum documento encontrado ou carregado para ingestão. Verifique o caminho/arquivo e os tipos de arquivo suportados.")
+@contextmanager
+def write_lock():
+    """
+    Exclusão mútua entre todos os processos que escrevem no índice vetorial e
+    no manifesto (leitura-modificação-escrita). Reentrante na mesma thread.
+    """
+    depth = getattr(_write_lock_state, "depth", 0)
+    if depth:
+        _write_lock_state.depth = depth + 1
+        try:
+            yield
+        finally:
+            _write_lock_state.depth = depth
         return
+    with FileLock(INGEST_WRITE_LOCK_PATH):
+        _write_lock_state.depth = 1
+        try:
+            yield
+        finally:
+            _write_lock_state.depth = 0
 
-    # 2. Divide em chunks
-    print("Documentos divididos em chunks...")
-    texts = split_documents(documents)
-    print(f"Total de chunks criados: {len(texts)}")
+def open_vectorstore(fresh: bool = False):
+    """
+    Abre (ou cria, se ainda não existir) o índice vetorial persistente do
+    backend configurado em VECTORSTORE_BACKEND.
+    Com fresh=True, o ChromaDB é aberto com um cliente novo, que lê do disco o
+    que outros processos gravaram (o cliente em cache no processo mantém o
+    índice HNSW já carregado em memória e não enxerga essas escritas).
+    """
+    if VECTORSTORE_BACKEND == "mmap":
+        vectorstore = _open_mmap_vectorstore()
+    elif VECTORSTORE_BACKEND == "chroma":
+        if fresh:
+            # Handles já abertos mantêm o cliente antigo até serem descartados.
+            SharedSystemClient.clear_system_cache()
+        vectorstore = _open_chroma()
+    else:
+        raise ValueError(f"VECTORSTORE_BACKEND desconhecido: {VECTORSTORE_BACKEND}. Use 'chroma' ou 'mmap'.")
+    # Detecta bases criadas com outro provedor/modelo de embeddings.
+    check_collection_backend(vectorstore)
+    return vectorstore
 
-    # 3. Inicializa ou carrega o ChromaDB
+def _open_mmap_vectorstore():
+    from mmap_vectorstore import MmapVectorStore
+    logger.info("Carregando índice mmap (%s) de: %s", VECTORSTORE_QUANTIZATION, MMAP_INDEX_DIRECTORY)
+    vectorstore = MmapVectorStore(
+        persist_directory=MMAP_INDEX_DIRECTORY,
+        embedding_function=EMBEDDINGS,
+        quantization=VECTORSTORE_QUANTIZATION,
+        rerank_factor=VECTORSTORE_RERANK_FACTOR,
+    )
+    if vectorstore.count() == 0 and IngestManifest(CHROMA_PERSIST_DIRECTORY).sources():
+        logger.warning("O índice mmap está vazio, mas o manifesto registra documentos ingeridos "
+                       "(provavelmente com outro backend). Execute 'python ingest.py clean' e reingira os documentos.")
+    return vectorstore
+
+def _open_chroma():
     # Verifica se o diretório ChromaDB existe e contém dados válidos
     chroma_db_files_exist = os.path.exists(CHROMA_PERSIST_DIRECTORY) and \
                             os.path.exists(os.path.join(CHROMA_PERSIST_DIRECTORY, "chroma.sqlite3"))
-
     if not chroma_db_files_exist:
-        print(f"Diretório ChromaDB ({CHROMA_PERSIST_DIRECTORY}) está vazio ou não existe completamente. Criando um novo ChromaDB.")
-        vectorstore = Chroma.from_documents(
-            documents=texts,
-            embedding=EMBEDDINGS,
-            persist_directory=CHROMA_PERSIST_DIRECTORY
-        )
-        print("Novo ChromaDB criado e documentos adicionados.")
+        logger.info("Diretório ChromaDB (%s) está vazio ou não existe completamente. Criando um novo ChromaDB.", CHROMA_PERSIST_DIRECTORY)
     else:
-        print(f"Carregando ChromaDB existente de: {CHROMA_PERSIST_DIRECTORY}")
-        vectorstore = Chroma(
-            persist_directory=CHROMA_PERSIST_DIRECTORY,
-            embedding_function=EMBEDDINGS
+        logger.info("Carregando ChromaDB existente de: %s", CHROMA_PERSIST_DIRECTORY)
+    for attempt in range(OPEN_VECTORSTORE_ATTEMPTS):
+        try:
+            vectorstore = Chroma(
+                persist_directory=CHROMA_PERSIST_DIRECTORY,
+                embedding_function=EMBEDDINGS
+            )
+            break
+        except Exception as e:
+            # Vários processos criando a mesma base ao mesmo tempo (ex.: workers
+            # da API) podem colidir na criação das tabelas. O cliente com falha
+            # fica no cache do chromadb e precisa ser descartado antes de tentar de novo.
+            SharedSystemClient.clear_system_cache()
+            if attempt == OPEN_VECTORSTORE_ATTEMPTS - 1:
+                raise
+            logger.warning("Falha ao abrir o ChromaDB (%s); tentando novamente...", e)
+            time.sleep(0.5 * (attempt + 1))
+    return vectorstore
+
+def collection_of(vectorstore):
+    """
+    Objeto com a interface de coleção do ChromaDB (upsert, count, metadata,
+    modify): a coleção do Chroma ou o próprio MmapVectorStore.
+    """
+    return getattr(vectorstore, "_collection", vectorstore)
+
+def _check_unchanged(file_path: str):
+    """
+    Compara o arquivo com o manifesto (mtime e, se necessário, hash).
+    Retorna o dict base do arquivo, com "status" igual a "unchanged"/"touched"
+    quando ele não mudou, e a entrada atual do manifesto.
+    """
+    source = source_key(file_path, DOCUMENTS_PATH)
+    mtime = os.path.getmtime(file_path)
+    entry = IngestManifest(CHROMA_PERSIST_DIRECTORY).get(source)
+    prepared = {"source": source, "file_path": file_path, "mtime": mtime}
+
+    if entry and entry.get("mtime") == mtime:
+        logger.info("Arquivo inalterado (mtime), ignorando: %s", source)
+        return {**prepared, "status": "unchanged"}, entry
+
+    prepared["hash"] = file_sha256(file_path)
+    if entry and entry.get("hash") == prepared["hash"]:
+        logger.info("Arquivo inalterado (hash), ignorando: %s", source)
+        return {**prepared, "status": "touched"}, entry
+
+    return {**prepared, "status": "changed"}, entry
+
+def iter_file_chunks(file_path: str, source: str, timer: StageTimer = None, on_page=None):
+    """
+    Lê o arquivo página a página (lazy_load), divide cada página em chunks
+    assim que é lida e gera pares (chunk_id, chunk) com IDs determinísticos.
+    O uso de memória não depende do tamanho do documento.
+    Se timer for informado, acumula nele o tempo dos estágios "load" e "split".
+    on_page, se informado, recebe o número de chunks de cada página dividida.
+    """
+    timer = timer or StageTimer()
+    seen = set()
+    pages = _get_loader(file_path).lazy_load()
+    while True:
+        with timer.stage("load"):
+            page = next(pages, None)
+        if page is None:
+            break
+        with timer.stage("split"):
+            ids, texts = assign_chunk_ids(split_documents([page]), source)
+        if on_page is not None:
+            on_page(len(ids))
+        for chunk_id, text in zip(ids, texts):
+            if chunk_id in seen:
+                continue
+            seen.add(chunk_id)
+            yield chunk_id, text
+
+def _spool_path(source: str, file_hash: str) -> str:
+    """
+    Cria um arquivo de spool exclusivo para uma preparação: dois uploads do
+    mesmo arquivo preparados ao mesmo tempo não podem compartilhar o spool.
+    """
+    spool_directory = os.path.join(CHROMA_PERSIST_DIRECTORY, "ingest_spool")
+    os.makedirs(spool_directory, exist_ok=True)
+    source_hash = hashlib.sha256(source.encode("utf-8")).hexdigest()[:16]
+    fd, spool_path = tempfile.mkstemp(prefix=f"{source_hash}-{file_hash[:16]}-", suffix=".pkl", dir=spool_directory)
+    os.close(fd)
+    return spool_path
+
+def _remove_spool(spool_path: str):
+    if os.path.exists(spool_path):
+        os.remove(spool_path)
+
+def _iter_spool(spool_path: str):
+    with open(spool_path, "rb") as spool_file:
+        while True:
+            try:
+                yield pickle.load(spool_file)
+            except EOFError:
+                return
+
+def _page_count(file_path: str):
+    """
+    Número de páginas do arquivo (usado no progresso), ou None se não for
+    possível obtê-lo sem ler o documento inteiro.
+    """
+    if not file_path.lower().endswith(".pdf"):
+        return 1
+    try:
+        from pypdf import PdfReader
+        return len(PdfReader(file_path).pages)
+    except Exception:
+        return None
+
+def prepare_file(file_path: str, progress=None):
+    """
+    Fase paralelizável da ingestão de um arquivo: verifica o manifesto, lê e
+    divide o arquivo em streaming e calcula os embeddings dos chunks novos em
+    lotes de INGEST_BATCH_SIZE, gravando-os em um arquivo de spool em disco.
+    Não escreve no ChromaDB nem no manifesto (ver commit_prepared_file), então
+    pode rodar em vários processos ao mesmo tempo.
+    Retorna um dict serializável (e pequeno) com o resultado, incluindo o tempo
+    gasto em cada estágio ("timings": load, split e embed, em segundos).
+    progress, se fornecido, é chamado com stage, percent e chunks_embedded a
+    cada lote (ex.: task_store.TaskProgress); o percentual segue as páginas lidas.
+    """
+    prepared, entry = _check_unchanged(file_path)
+    if prepared["status"] != "changed":
+        return prepared
+
+    source, file_hash = prepared["source"], prepared["hash"]
+    manifest = IngestManifest(CHROMA_PERSIST_DIRECTORY)
+    # Chunks já gravados (ingestão anterior ou ingestão interrompida) não são
+    # recalculados: é isso que permite retomar um arquivo grande.
+    known_ids = set(entry.get("chunk_ids", [])) if entry else set()
+    known_ids |= manifest.get_partial(source, file_hash)
+
+    logger.info("Carregando: %s", file_path)
+    timer = StageTimer()
+    chunk_ids, new_count = [], 0
+    batch_ids, batch_texts = [], []
+    pages_total = _page_count(file_path) if progress else None
+    # Chunks das páginas já divididas: base do percentual quando os chunks não
+    # têm página (TXT, DOCX, lidos como uma única página).
+    chunks_split = 0
+
+    def count_page(chunk_count):
+        nonlocal chunks_split
+        chunks_split += chunk_count
+
+    spool_path = _spool_path(source, file_hash)
+    try:
+        with open(spool_path, "wb") as spool_file:
+            def flush():
+                with timer.stage("embed"):
+                    vectors = EMBEDDINGS.embed_documents([text.page_content for text in batch_texts])
+                pickle.dump((list(batch_ids), list(batch_texts), vectors), spool_file, protocol=pickle.HIGHEST_PROTOCOL)
+                if progress is not None:
+                    # Percentual pelas páginas lidas ou, sem página, pelos chunks
+                    # lidos; se nenhum for conhecido, não é enviado (um None
+                    # sobrescreveria o último valor no task store).
+                    page = batch_texts[-1].metadata.get("page")
+                    fields = {"stage": "embedding", "chunks_embedded": new_count}
+                    if pages_total and isinstance(page, int):
+                        fields["percent"] = round(EMBED_PROGRESS_SHARE * min(page + 1, pages_total) / pages_total, 1)
+                    elif chunks_split:
+                        fields["percent"] = round(EMBED_PROGRESS_SHARE * min(len(chunk_ids) / chunks_split, 1.0), 1)
+                    progress(**fields)
+                batch_ids.clear()
+                batch_texts.clear()
+
+            for chunk_id, text in iter_file_chunks(file_path, source, timer,
+                                                   on_page=count_page if progress else None):
+                chunk_ids.append(chunk_id)
+                if chunk_id in known_ids:
+                    continue
+                batch_ids.append(chunk_id)
+                batch_texts.append(text)
+                new_count += 1
+                if len(batch_ids) >= INGEST_BATCH_SIZE:
+                    flush()
+            if batch_ids:
+                flush()
+    except BaseException:
+        # Um spool incompleto nunca é gravado no índice; não o deixa para trás.
+        _remove_spool(spool_path)
+        raise
+
+    return {**prepared, "chunk_ids": chunk_ids, "new_count": new_count, "spool_path": spool_path,
+            "timings": timer.as_dict()}
+
+def prepare_files(file_paths, progress=None):
+    """
+    Variante de prepare_file para vários arquivos (upload em lote): os chunks
+    novos de todos os arquivos são agrupados nos mesmos lotes de
+    INGEST_BATCH_SIZE antes do cálculo dos embeddings, então arquivos pequenos
+    não geram lotes parciais. Cada arquivo continua com o próprio spool e é
+    gravado com commit_prepared_file.
+    Retorna {"files": [resultado de cada arquivo, na ordem de file_paths],
+    "timings": tempo total de cada estágio}. Um arquivo com erro recebe
+    status "failed" e a mensagem em "error", sem interromper os demais.
+    progress, se fornecido, recebe stage, percent (pelos arquivos lidos) e
+    chunks_embedded a cada lote e a cada arquivo.
+    """
+    timer = StageTimer()
+    results = []
+    spool_files = {}
+    spool_paths = {}
+    batch = []  # (índice do arquivo, chunk_id, chunk)
+    embedded = 0
+
+    def report():
+        if progress is not None:
+            # Arquivos cujos chunks já foram todos lidos (index = arquivo atual).
+            percent = round(EMBED_PROGRESS_SHARE * (len(results) - 1) / len(file_paths), 1)
+            progress(stage="embedding", percent=percent, chunks_embedded=embedded)
+
+    def close_spool(index):
+        spool_file = spool_files.pop(index, None)
+        if spool_file is not None:
+            spool_file.close()
+
+    def flush():
+        nonlocal embedded
+        with timer.stage("embed"):
+            vectors = EMBEDDINGS.embed_documents([text.page_content for _, _, text in batch])
+        # Redistribui os vetores do lote entre os spools dos arquivos.
+        per_file = {}
+        for (index, chunk_id, text), vector in zip(batch, vectors):
+            ids, texts, file_vectors = per_file.setdefault(index, ([], [], []))
+            ids.append(chunk_id)
+            texts.append(text)
+            file_vectors.append(vector)
+        for index, record in per_file.items():
+            pickle.dump(record, spool_files[index], protocol=pickle.HIGHEST_PROTOCOL)
+        embedded += len(batch)
+        batch.clear()
+        report()
+
+    try:
+        for index, file_path in enumerate(file_paths):
+            results.append({"file_path": file_path, "source": source_key(file_path, DOCUMENTS_PATH)})
+            report()
+            try:
+                prepared, entry = _check_unchanged(file_path)
+                results[index] = prepared
+                if prepared["status"] != "changed":
+                    continue
+
+                source, file_hash = prepared["source"], prepared["hash"]
+                known_ids = set(entry.get("chunk_ids", [])) if entry else set()
+                known_ids |= IngestManifest(CHROMA_PERSIST_DIRECTORY).get_partial(source, file_hash)
+
+                logger.info("Carregando: %s", file_path)
+                spool_path = _spool_path(source, file_hash)
+                spool_paths[index] = spool_path
+                spool_files[index] = open(spool_path, "wb")
+                chunk_ids, new_count = [], 0
+                for chunk_id, text in iter_file_chunks(file_path, source, timer):
+                    chunk_ids.append(chunk_id)
+                    if chunk_id in known_ids:
+                        continue
+                    batch.append((index, chunk_id, text))
+                    new_count += 1
+                    if len(batch) >= INGEST_BATCH_SIZE:
+                        flush()
+                prepared.update(chunk_ids=chunk_ids, new_count=new_count, spool_path=spool_path)
+            except Exception as e:
+                logger.error("Erro ao processar %s: %s", file_path, e)
+                # Descarta os chunks do arquivo que ainda não foram para um lote.
+                batch[:] = [item for item in batch if item[0] != index]
+                close_spool(index)
+                if index in spool_paths:
+                    _remove_spool(spool_paths.pop(index))
+                results[index] = {**results[index], "status": "failed", "error": str(e)}
+        if batch:
+            flush()
+    except BaseException:
+        # Falha geral (ex.: no último lote): nenhum spool será gravado.
+        for index in list(spool_files):
+            close_spool(index)
+        for spool_path in spool_paths.values():
+            _remove_spool(spool_path)
+        raise
+    finally:
+        for index in list(spool_files):
+            close_spool(index)
+
+    return {"files": results, "timings": timer.as_dict()}
+
+def max_batch_size(vectorstore) -> int:
+    """
+    Tamanho máximo de lote aceito pelo ChromaDB em uma única escrita.
+    """
+    client = getattr(vectorstore, "_client", None)
+    getter = getattr(client, "get_max_batch_size", None)
+    if callable(getter):
+        return getter()
+    return getattr(client, "max_batch_size", None) or 5000
+
+def _add_embedded_documents(vectorstore, ids, documents, vectors):
+    """
+    Adiciona ao índice vetorial chunks cujos embeddings já foram calculados,
+    respeitando o tamanho máximo de lote do ChromaDB.
+    """
+    step = max_batch_size(vectorstore)
+    for start in range(0, len(ids), step):
+        collection_of(vectorstore).upsert(
+            ids=ids[start:start + step],
+            embeddings=vectors[start:start + step],
+            metadatas=[document.metadata for document in documents[start:start + step]],
+            documents=[document.page_content for document in documents[start:start + step]],
         )
-        print(f"Adicionando {len(texts)} chunks ao ChromaDB existente.")
-        # Adiciona os novos chunks. ChromaDB irá lidar com a idempotência e os IDs.
-        # Ele gerencia automaticamente o batching interno para adição de documentos.
-        vectorstore.add_documents(texts)
-        print("Chunks adicionados com sucesso ao ChromaDB existente.")
+
+def _delete_chunks(vectorstore, ids):
+    """
+    Remove chunks do ChromaDB respeitando o tamanho máximo de lote.
+    """
+    step = max_batch_size(vectorstore)
+    for start in range(0, len(ids), step):
+        vectorstore.delete(ids=ids[start:start + step])
+
+def _finalize_file(source: str, file_hash: str, mtime: float, chunk_ids, vectorstore):
+    """
+    Remove os chunks obsoletos do arquivo e grava sua nova entrada no manifesto.
+    Deve ser chamada depois que todos os chunks novos do arquivo foram gravados.
+    Retorna o número de chunks removidos.
+    """
+    with write_lock():
+        # Relê o manifesto: outro arquivo pode ter sido gravado nesse meio tempo.
+        manifest = IngestManifest(CHROMA_PERSIST_DIRECTORY)
+        stale_ids = sorted(manifest.tracked_ids(source) - set(chunk_ids))
+        _delete_chunks(vectorstore, stale_ids)
+        manifest.set(source, file_hash, mtime, chunk_ids)
+        manifest.save()
+    return len(stale_ids)
+
+def _touch_file(source: str, mtime: float):
+    with write_lock():
+        manifest = IngestManifest(CHROMA_PERSIST_DIRECTORY)
+        manifest.touch(source, mtime)
+        manifest.save()
+
+def commit_prepared_file(prepared, vectorstore, progress=None):
+    """
+    Fase de escrita da ingestão de um arquivo: grava os chunks novos do spool em
+    lotes do tamanho máximo do ChromaDB, remove os obsoletos e atualiza o
+    manifesto. Cada lote gravado é registrado no manifesto, então uma ingestão
+    interrompida pode ser retomada. Roda sob write_lock(), exclusivo entre processos.
+    progress, se fornecido, recebe stage, percent, chunks_written e
+    chunks_total a cada lote gravado.
+    Retorna o número de chunks adicionados.
+    """
+    with write_lock():
+        return _commit_prepared_file(prepared, vectorstore, progress)
+
+def _commit_prepared_file(prepared, vectorstore, progress):
+    if prepared["status"] == "unchanged":
+        return 0
+    if prepared["status"] == "touched":
+        _touch_file(prepared["source"], prepared["mtime"])
+        return 0
+
+    source, file_hash = prepared["source"], prepared["hash"]
+    step = max_batch_size(vectorstore)
+    written = 0
+    batch_ids, batch_texts, batch_vectors = [], [], []
+
+    def flush():
+        nonlocal written
+        _add_embedded_documents(vectorstore, batch_ids, batch_texts, batch_vectors)
+        manifest = IngestManifest(CHROMA_PERSIST_DIRECTORY)
+        manifest.add_partial(source, file_hash, batch_ids)
+        manifest.save()
+        written += len(batch_ids)
+        logger.debug("%s: %s/%s chunks novos gravados.", source, written, prepared["new_count"])
+        if progress is not None:
+            share = 100.0 - EMBED_PROGRESS_SHARE
+            percent = round(EMBED_PROGRESS_SHARE + share * written / max(prepared["new_count"], 1), 1)
+            progress(stage="storing", percent=percent, chunks_written=written, chunks_total=prepared["new_count"])
+        batch_ids.clear()
+        batch_texts.clear()
+        batch_vectors.clear()
+
+    for ids, texts, vectors in _iter_spool(prepared["spool_path"]):
+        batch_ids.extend(ids)
+        batch_texts.extend(texts)
+        batch_vectors.extend(vectors)
+        if len(batch_ids) >= step:
+            flush()
+    if batch_ids:
+        flush()
+
+    removed = _finalize_file(source, file_hash, prepared["mtime"], prepared["chunk_ids"], vectorstore)
+    os.remove(prepared["spool_path"])
+    logger.info("%s: %s chunks, %s novos, %s obsoletos.", source, len(prepared["chunk_ids"]), written, removed)
+    return written
+
+def remove_missing_sources(file_paths, vectorstore):
+    """
+    Remove do ChromaDB e do manifesto os arquivos que não existem mais no diretório.
+    """
+    with write_lock():
+        manifest = IngestManifest(CHROMA_PERSIST_DIRECTORY)
+        current_sources = {source_key(file_path, DOCUMENTS_PATH) for file_path in file_paths}
+        for source in manifest.sources():
+            if source not in current_sources:
+                stale_ids = sorted(manifest.tracked_ids(source))
+                manifest.remove(source)
+                if stale_ids:
+                    logger.info("Removendo %s chunks de arquivo removido: %s", len(stale_ids), source)
+                    _delete_chunks(vectorstore, stale_ids)
+        manifest.save()
+
+def delete_source(source: str, vectorstore):
+    """
+    Remove um documento do índice: apaga do ChromaDB exatamente os chunks
+    rastreados para a fonte no manifesto, remove a entrada do manifesto e o
+    arquivo de DOCUMENTS_PATH (para que uma ingestão completa não o traga de
+    volta). Roda sob write_lock(), exclusivo entre processos.
+    Retorna o número de chunks removidos, ou None se a fonte não for conhecida.
+    """
+    with write_lock():
+        manifest = IngestManifest(CHROMA_PERSIST_DIRECTORY)
+        if not manifest.is_known(source):
+            return None
+        stale_ids = sorted(manifest.tracked_ids(source))
+        _delete_chunks(vectorstore, stale_ids)
+        manifest.remove(source)
+        manifest.save()
+    file_path = os.path.join(DOCUMENTS_PATH, *source.split("/"))
+    if os.path.isfile(file_path):
+        os.remove(file_path)
+    logger.info("%s: documento removido (%s chunks).", source, len(stale_ids))
+    return len(stale_ids)
+
+def process_documents_and_add_to_vectorstore(specific_file: str = None):
+    """
+    Carrega, divide em chunks e adiciona documentos ao ChromaDB.
+    Se specific_file for fornecido, processa apenas esse arquivo.
+    Caso contrário, processa todos os documentos no DOCUMENTS_PATH.
+    A ingestão é incremental, guiada pelo manifesto de ingestão.
+    Retorna o número de chunks novos adicionados.
+    """
+    file_paths = _list_files(DOCUMENTS_PATH, specific_file=specific_file)
+    logger.info("Total de arquivos encontrados: %s", len(file_paths))
+
+    if not file_paths:
+        logger.info("Nenhum documento encontrado ou carregado para ingestão. Verifique o caminho/arquivo e os tipos de arquivo suportados.")
+        return 0
+
+    vectorstore = open_vectorstore()
+
+    total_added = 0
+    for file_path in file_paths:
+        total_added += commit_prepared_file(prepare_file(file_path), vectorstore)
+
+    # Em uma execução completa, remove os chunks de arquivos que não existem mais.
+    if specific_file is None:
+        remove_missing_sources(file_paths, vectorstore)
+
+    logger.info("Total de chunks novos adicionados ao ChromaDB: %s", total_added)
+    cache_stats = get_embedding_cache_stats()
+    if cache_stats:
+        logger.info("Cache de embeddings: %s acertos, %s erros (%s entradas).",
+                    cache_stats["hits"], cache_stats["misses"], cache_stats["entries"])
+    return total_added
+
+# --- Ingestão em pipeline (diretório completo) ---
+def _load_file_for_pipeline(file_path: str):
+    """
+    Executado nos processos do pool: verifica o manifesto e faz o parsing do arquivo.
+    """
+    try:
+        prepared, entry = _check_unchanged(file_path)
+        if prepared["status"] == "changed":
+            prepared["pages"] = _get_loader(file_path).load()
+            prepared["previous_ids"] = entry.get("chunk_ids", []) if entry else []
+        return prepared
+    except Exception as e:
+        return {"file_path": file_path, "status": "failed", "error": str(e)}
+
+def _parse_stage(file_paths, workers: int):
+    """
+    Estágio 1: parsing dos arquivos em um pool de processos. Gera os arquivos à
+    medida que ficam prontos, com no máximo 2 * workers arquivos em voo para
+    limitar o uso de memória.
+    """
+    paths = iter(file_paths)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=configure_logging) as executor:
+        pending = {executor.submit(_load_file_for_pipeline, file_path) for file_path in itertools.islice(paths, workers * 2)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                next_path = next(paths, None)
+                if next_path is not None:
+                    pending.add(executor.submit(_load_file_for_pipeline, next_path))
+                yield future.result()
+
+def _split_stage(parsed_files):
+    """
+    Estágio 2: divide cada arquivo parseado em chunks e gera (arquivo, chunks novos).
+    """
+    for prepared in parsed_files:
+        if prepared["status"] != "changed":
+            yield prepared, []
+            continue
+        texts = split_documents(prepared.pop("pages"))
+        ids, texts = assign_chunk_ids(texts, prepared["source"])
+        prepared["chunk_ids"] = ids
+        previous_ids = set(prepared.pop("previous_ids"))
+        yield prepared, [(chunk_id, text) for chunk_id, text in zip(ids, texts) if chunk_id not in previous_ids]
+
+class _PipelineProgress:
+    """
+    Relatório periódico de progresso (arquivos/s e chunks/s) do modo pipeline.
+    """
+
+    def __init__(self, total_files: int, interval: float = 2.0):
+        self.total_files = total_files
+        self.interval = interval
+        self.files = 0
+        self.chunks = 0
+        self.started_at = time.monotonic()
+        self._last_report = 0.0
+
+    def report(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._last_report < self.interval:
+            return
+        self._last_report = now
+        elapsed = max(now - self.started_at, 1e-9)
+        logger.info("[pipeline] %s/%s arquivos (%.1f arquivos/s), %s chunks gravados (%.1f chunks/s)",
+                    self.files, self.total_files, self.files / elapsed, self.chunks, self.chunks / elapsed)
+
+def process_directory_pipelined(workers: int = INGEST_WORKERS, batch_size: int = INGEST_BATCH_SIZE):
+    """
+    Ingestão incremental de todo o DOCUMENTS_PATH em pipeline: o parsing roda em
+    um pool de processos, a divisão em chunks é um estágio gerador e os embeddings
+    e a gravação no ChromaDB consomem lotes de tamanho fixo à medida que ficam
+    prontos, sem acumular todos os documentos em memória.
+    Retorna o número de chunks novos adicionados.
+    """
+    file_paths = _list_files(DOCUMENTS_PATH)
+    logger.info("Total de arquivos encontrados: %s (workers: %s, lote: %s)", len(file_paths), workers, batch_size)
+    if not file_paths:
+        logger.info("Nenhum documento encontrado ou carregado para ingestão. Verifique o caminho/arquivo e os tipos de arquivo suportados.")
+        return 0
+
+    vectorstore = open_vectorstore()
+    progress = _PipelineProgress(len(file_paths))
+    batch_ids, batch_documents = [], []
+    # Arquivos cujos chunks já estão todos no lote atual: o manifesto só é
+    # atualizado depois que esse lote for gravado.
+    awaiting_flush = []
+
+    def finalize(prepared):
+        _finalize_file(prepared["source"], prepared["hash"], prepared["mtime"], prepared["chunk_ids"], vectorstore)
+        progress.files += 1
+
+    def flush():
+        if batch_ids:
+            vectors = EMBEDDINGS.embed_documents([document.page_content for document in batch_documents])
+            with write_lock():
+                _add_embedded_documents(vectorstore, list(batch_ids), list(batch_documents), vectors)
+            progress.chunks += len(batch_ids)
+            batch_ids.clear()
+            batch_documents.clear()
+        for prepared in awaiting_flush:
+            finalize(prepared)
+        awaiting_flush.clear()
+        progress.report()
+
+    for prepared, new_chunks in _split_stage(_parse_stage(file_paths, workers)):
+        if prepared["status"] == "failed":
+            logger.error("Erro ao processar %s: %s", prepared["file_path"], prepared["error"])
+            progress.files += 1
+            continue
+        if prepared["status"] != "changed":
+            if prepared["status"] == "touched":
+                _touch_file(prepared["source"], prepared["mtime"])
+            progress.files += 1
+            progress.report()
+            continue
+
+        for chunk_id, text in new_chunks:
+            batch_ids.append(chunk_id)
+            batch_documents.append(text)
+            if len(batch_ids) >= batch_size:
+                flush()
+        if batch_ids:
+            awaiting_flush.append(prepared)
+        else:
+            finalize(prepared)
+
+    flush()
+    remove_missing_sources(file_paths, vectorstore)
+    progress.report(force=True)
+
+    cache_stats = get_embedding_cache_stats()
+    if cache_stats:
+        logger.info("Cache de embeddings: %s acertos, %s erros (%s entradas).",
+                    cache_stats["hits"], cache_stats["misses"], cache_stats["entries"])
+    return progress.chunks
 
 # --- Execução Principal ---
+def publish_index_version():
+    """
+    Publica uma nova versão do índice no task store: os workers da API em
+    execução recarregam o ChromaDB sem precisar ser reiniciados.
+    """
+    version = open_task_store().bump_index_version()
+    logger.info("Versão do índice publicada para a API: %s", version)
+
 if __name__ == "__main__":
+    configure_logging()
     # Remove o diretório persistente do ChromaDB se for o primeiro argumento 'clean'
     # Use isso para recriar o DB do zero manualmente: python ingest.py clean
     if len(sys.argv) > 1 and sys.argv[1] == "clean":
         if os.path.exists(CHROMA_PERSIST_DIRECTORY):
-            print(f"Removendo diretório ChromaDB existente: {CHROMA_PERSIST_DIRECTORY}")
-            shutil.rmtree(CHROMA_PERSIST_DIRECTORY)
-            print("Diretório ChromaDB limpo.")
+            logger.info("Removendo diretório ChromaDB existente: %s", CHROMA_PERSIST_DIRECTORY)
+            with write_lock():
+                shutil.rmtree(CHROMA_PERSIST_DIRECTORY)
+            logger.info("Diretório ChromaDB limpo.")
+            publish_index_version()
         else:
-            print("Diretório ChromaDB não encontrado para limpeza.")
+            logger.info("Diretório ChromaDB não encontrado para limpeza.")
         sys.exit(0) # Sai após a limpeza
 
-    # Se um caminho de arquivo específico for passado como argumento (do main.py)
-    if len(sys.argv) > 1:
+    # Modo pipeline para o diretório completo: python ingest.py --pipeline
+    # (workers e tamanho do lote via INGEST_WORKERS e INGEST_BATCH_SIZE)
+    if len(sys.argv) > 1 and sys.argv[1] == "--pipeline":
+        logger.info("Iniciando ingestão em pipeline de TODOS os documentos no diretório de dados.")
+        process_directory_pipelined()
+    # Se um caminho de arquivo específico for passado como argumento
+    elif len(sys.argv) > 1:
         # sys.argv[1] será o caminho completo do arquivo, ex: ./data/CPC.pdf
         # Precisamos extrair apenas o nome do arquivo.
         file_path_arg = sys.argv[1]
@@ -143,7 +864,8 @@ if __name__ == "__main__":
         process_documents_and_add_to_vectorstore(specific_file=file_name)
     else:
         # Se nenhum argumento for passado (execução manual), processa todos os documentos
-        print("Iniciando ingestão de TODOS os documentos no diretório de dados (nenhum arquivo específico fornecido).")
+        logger.info("Iniciando ingestão de TODOS os documentos no diretório de dados (nenhum arquivo específico fornecido).")
         process_documents_and_add_to_vectorstore()
 
-    print("Processo de ingestão concluído.")
\ No newline at end of file
+    publish_index_version()
+    logger.info("Processo de ingestão concluído.")
\ No newline at end of file
@@ -0,0 +1,205 @@
+import os
+import json
+import hashlib
+import logging
+import sqlite3
+import time
+
+logger = logging.getLogger("klaros.ingest_manifest")
+
+# Nome do manifesto (SQLite), salvo dentro do diretório do ChromaDB para que
+# `python ingest.py clean` remova o manifesto junto com os vetores.
+MANIFEST_FILE_NAME = "ingest_manifest.sqlite3"
+# Manifesto em JSON de versões anteriores, importado na primeira abertura.
+LEGACY_MANIFEST_FILE_NAME = "ingest_manifest.json"
+
+
+def file_sha256(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    """
+    Calcula o hash SHA-256 do conteúdo de um arquivo, lendo-o em blocos.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file_object:
+        for block in iter(lambda: file_object.read(chunk_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def make_chunk_id(source: str, page, content: str) -> str:
+    """
+    Gera um ID determinístico para um chunk a partir da fonte, da página e
+    do hash do conteúdo. O mesmo texto na mesma página sempre gera o mesmo ID.
+    """
+    content_hash = hashlib.sha256(content.encode("utf-8")).hexdigest()
+    key = f"{source}\x00{page}\x00{content_hash}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def source_key(file_path: str, documents_path: str) -> str:
+    """
+    Normaliza o caminho de um arquivo para a chave usada no manifesto
+    (caminho relativo ao DOCUMENTS_PATH, sempre com '/').
+    """
+    relative_path = os.path.relpath(os.path.abspath(file_path), os.path.abspath(documents_path))
+    return relative_path.replace(os.sep, "/")
+
+
+class IngestManifest:
+    """
+    Manifesto por arquivo com o hash, o mtime e os IDs dos chunks já ingeridos.
+    Permite pular arquivos inalterados e remover chunks obsoletos.
+    Fica em SQLite (modo WAL): cada consulta lê só a entrada pedida e cada
+    gravação altera só as linhas do arquivo, então o custo não cresce com o
+    número de documentos. As alterações ficam em uma transação até save().
+    """
+
+    def __init__(self, persist_directory: str):
+        self.path = os.path.join(persist_directory, MANIFEST_FILE_NAME)
+        os.makedirs(persist_directory, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "source TEXT PRIMARY KEY, hash TEXT NOT NULL, mtime REAL, chunk_ids TEXT NOT NULL, ingested_at REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_files_hash ON files(hash)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS partial ("
+            "source TEXT PRIMARY KEY, hash TEXT NOT NULL, written_ids TEXT NOT NULL, orphan_ids TEXT NOT NULL)"
+        )
+        self._conn.commit()
+        self._import_legacy(os.path.join(persist_directory, LEGACY_MANIFEST_FILE_NAME))
+
+    def _import_legacy(self, legacy_path: str):
+        if not os.path.exists(legacy_path):
+            return
+        with self._conn:
+            # Transação de escrita: só um processo importa o arquivo.
+            self._conn.execute("BEGIN IMMEDIATE")
+            if not os.path.exists(legacy_path):
+                return
+            try:
+                with open(legacy_path, "r", encoding="utf-8") as manifest_file:
+                    data = json.load(manifest_file)
+            except (OSError, ValueError) as e:
+                logger.warning("Manifesto de ingestão inválido (%s): %s. Ignorando.", legacy_path, e)
+                data = {}
+            for source, entry in data.get("files", {}).items():
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO files (source, hash, mtime, chunk_ids, ingested_at) VALUES (?, ?, ?, ?, ?)",
+                    (source, entry.get("hash", ""), entry.get("mtime"), json.dumps(entry.get("chunk_ids", [])),
+                     entry.get("ingested_at")),
+                )
+            for source, partial in data.get("partial", {}).items():
+                self._write_partial(source, partial.get("hash", ""), partial.get("written_ids", []),
+                                    partial.get("orphan_ids", []))
+        try:
+            os.replace(legacy_path, legacy_path + ".migrated")
+        except FileNotFoundError:
+            pass  # Outro processo importou (e renomeou) ao mesmo tempo; a importação é idempotente.
+
+    def get(self, source: str):
+        row = self._conn.execute(
+            "SELECT hash, mtime, chunk_ids, ingested_at FROM files WHERE source = ?", (source,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {"hash": row[0], "mtime": row[1], "chunk_ids": json.loads(row[2]), "ingested_at": row[3]}
+
+    def sources(self):
+        return [row[0] for row in self._conn.execute("SELECT source FROM files ORDER BY rowid")]
+
+    def find_by_hash(self, file_hash: str):
+        """
+        Retorna a fonte já ingerida com este hash de conteúdo, ou None.
+        """
+        row = self._conn.execute(
+            "SELECT source FROM files WHERE hash = ? ORDER BY rowid LIMIT 1", (file_hash,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def is_known(self, source: str) -> bool:
+        """
+        Indica se o arquivo tem uma ingestão concluída ou interrompida no manifesto.
+        """
+        return self.get(source) is not None or self._get_partial_row(source) is not None
+
+    def set(self, source: str, file_hash: str, mtime: float, chunk_ids):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO files (source, hash, mtime, chunk_ids, ingested_at) VALUES (?, ?, ?, ?, ?)",
+            (source, file_hash, mtime, json.dumps(list(chunk_ids)), time.time()),
+        )
+        self._conn.execute("DELETE FROM partial WHERE source = ?", (source,))
+
+    def _get_partial_row(self, source: str):
+        row = self._conn.execute(
+            "SELECT hash, written_ids, orphan_ids FROM partial WHERE source = ?", (source,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {"hash": row[0], "written_ids": json.loads(row[1]), "orphan_ids": json.loads(row[2])}
+
+    def _write_partial(self, source: str, file_hash: str, written_ids, orphan_ids):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO partial (source, hash, written_ids, orphan_ids) VALUES (?, ?, ?, ?)",
+            (source, file_hash, json.dumps(list(written_ids)), json.dumps(list(orphan_ids))),
+        )
+
+    def get_partial(self, source: str, file_hash: str):
+        """
+        Retorna os IDs dos chunks já gravados de uma ingestão interrompida do
+        arquivo com este hash (ou um conjunto vazio).
+        """
+        partial = self._get_partial_row(source)
+        if partial and partial["hash"] == file_hash:
+            return set(partial["written_ids"])
+        return set()
+
+    def add_partial(self, source: str, file_hash: str, written_ids):
+        """
+        Registra chunks gravados de uma ingestão ainda em andamento, para que
+        ela possa ser retomada se for interrompida.
+        """
+        partial = self._get_partial_row(source)
+        if not partial or partial["hash"] != file_hash:
+            # Chunks de uma ingestão interrompida de outra versão do arquivo
+            # continuam rastreados até serem removidos do ChromaDB.
+            orphan_ids = []
+            if partial:
+                orphan_ids = partial["orphan_ids"] + partial["written_ids"]
+            partial = {"hash": file_hash, "written_ids": [], "orphan_ids": orphan_ids}
+        self._write_partial(source, file_hash, partial["written_ids"] + list(written_ids), partial["orphan_ids"])
+
+    def tracked_ids(self, source: str):
+        """
+        Retorna todos os IDs de chunks do arquivo que podem estar no ChromaDB:
+        os da última ingestão concluída e os de ingestões interrompidas.
+        """
+        ids = set()
+        entry = self.get(source)
+        if entry:
+            ids.update(entry["chunk_ids"])
+        partial = self._get_partial_row(source)
+        if partial:
+            ids.update(partial["written_ids"])
+            ids.update(partial["orphan_ids"])
+        return ids
+
+    def touch(self, source: str, mtime: float):
+        """
+        Atualiza apenas o mtime de uma entrada cujo conteúdo não mudou.
+        """
+        self._conn.execute("UPDATE files SET mtime = ? WHERE source = ?", (mtime, source))
+
+    def remove(self, source: str):
+        entry = self.get(source)
+        self._conn.execute("DELETE FROM partial WHERE source = ?", (source,))
+        self._conn.execute("DELETE FROM files WHERE source = ?", (source,))
+        return entry
+
+    def save(self):
+        """
+        Grava as alterações feitas desde o último save() (uma transação).
+        """
+        self._conn.commit()
@@ -0,0 +1,160 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+
+
+class IngestionQueueFull(Exception):
+    """
+    Levantada quando a fila de ingestão atingiu o limite de tarefas pendentes.
+    """
+
+
+def _init_worker():
+    """
+    Inicializador de cada processo do pool: importa o ingest.py uma única vez,
+    carregando LangChain, loaders, o cliente de embeddings e o cache, e
+    configura os logs do processo (LOG_LEVEL).
+    """
+    import ingest
+    ingest.configure_logging()
+
+
+def _warm_up():
+    return multiprocessing.current_process().name
+
+
+_task_store = None
+
+
+def _progress(task_id: str):
+    """
+    Callback de progresso da tarefa, gravado diretamente no task store
+    compartilhado (a API o lê para o /ingestion-status/{task_id}/stream).
+    """
+    global _task_store
+    from task_store import TaskProgress, open_task_store
+    if _task_store is None:
+        _task_store = open_task_store()
+    return TaskProgress(_task_store, task_id)
+
+
+def _prepare_file(task_id: str, file_path: str):
+    import ingest
+    return ingest.prepare_file(file_path, progress=_progress(task_id))
+
+
+def _prepare_files(task_id: str, file_paths: List[str]):
+    import ingest
+    return ingest.prepare_files(file_paths, progress=_progress(task_id))
+
+
+class IngestionPool:
+    """
+    Fila limitada de tarefas de ingestão servida por um pool fixo de processos
+    "quentes" (com imports e clientes já carregados).
+    Os workers só executam a fase paralelizável (carregar, dividir, gerar
+    embeddings); a escrita no vector store fica a cargo do chamador, serializada
+    pelo write_lock.
+    """
+
+    def __init__(self, max_workers: int = 2, max_pending: int = 20):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = None
+        self._slots = None
+        self._waiting: List[str] = []
+        self._running = set()
+        self.write_lock = None
+
+    def start(self):
+        """
+        Cria o pool de processos e dispara o aquecimento de todos os workers.
+        Deve ser chamado dentro do event loop (ex.: no startup da API).
+        """
+        # "spawn" funciona igual em Windows e Linux e evita herdar o estado
+        # (threads, conexões) do processo da API.
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+        self._slots = asyncio.Semaphore(self.max_workers)
+        self.write_lock = asyncio.Lock()
+        for _ in range(self.max_workers):
+            self._executor.submit(_warm_up)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def is_full(self) -> bool:
+        return len(self._waiting) + len(self._running) >= self.max_pending
+
+    def reserve(self, task_id: str):
+        """
+        Reserva um lugar na fila para a tarefa. Levanta IngestionQueueFull se
+        o limite de tarefas pendentes foi atingido.
+        """
+        if self.is_full():
+            raise IngestionQueueFull(
+                f"Fila de ingestão cheia ({self.max_pending} tarefas pendentes)."
+            )
+        self._waiting.append(task_id)
+
+    def release(self, task_id: str):
+        """
+        Libera o lugar reservado por uma tarefa que não chegou a ser executada.
+        """
+        if task_id in self._waiting:
+            self._waiting.remove(task_id)
+
+    def queue_position(self, task_id: str):
+        """
+        Posição (1 = próxima a executar) da tarefa na fila, ou None se ela
+        já estiver em execução ou não estiver na fila.
+        """
+        try:
+            return self._waiting.index(task_id) + 1
+        except ValueError:
+            return None
+
+    def stats(self):
+        return {
+            "workers": self.max_workers,
+            "running": len(self._running),
+            "waiting": len(self._waiting),
+            "max_pending": self.max_pending,
+        }
+
+    async def prepare_file(self, task_id: str, file_path: str, on_start=None):
+        """
+        Aguarda um worker livre (em ordem de chegada) e executa a fase de
+        preparação do arquivo nele. on_start, se fornecido, é uma função
+        assíncrona aguardada quando a tarefa sai da fila e começa a executar.
+        """
+        return await self._run(task_id, _prepare_file, file_path, on_start)
+
+    async def prepare_files(self, task_id: str, file_paths: List[str], on_start=None):
+        """
+        Como prepare_file, para um lote de arquivos preparado em um único worker,
+        com os embeddings de todos os arquivos agrupados nos mesmos lotes.
+        """
+        return await self._run(task_id, _prepare_files, file_paths, on_start)
+
+    async def _run(self, task_id: str, function, argument, on_start):
+        if task_id not in self._waiting:
+            self.reserve(task_id)
+        try:
+            async with self._slots:
+                self._waiting.remove(task_id)
+                self._running.add(task_id)
+                if on_start is not None:
+                    await on_start()
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._executor, function, task_id, argument)
+        finally:
+            if task_id in self._waiting:
+                self._waiting.remove(task_id)
+            self._running.discard(task_id)
@@ -7,14 +7,25 @@ def get_llm():
     """
     Retorna uma instância do Large Language Model (LLM) configurado.
     Por padrão, usa a API do Google Gemini.
+    Com LLM_PROVIDER=fake, retorna o LLM determinístico dos benchmarks.
     """
+    if os.getenv("LLM_PROVIDER", "google").lower() == "fake":
+        from benchmarks.fakes import FakeChatModel
+        return FakeChatModel(
+            latency_ms=float(os.getenv("FAKE_LLM_LATENCY_MS", "0")),
+            tokens_per_second=float(os.getenv("FAKE_LLM_TOKENS_PER_SECOND", "0")),
+        )
+
     # Para usar o Google Gemini, certifique-se de que GOOGLE_API_KEY está definida no seu .env
     # Troque para um dos modelos listados no seu testAPI.py que suporte 'generateContent'.
     # Usando o 'gemini-2.5-flash' para melhor performance e custo-benefício para assistentes.
     llm = ChatGoogleGenerativeAI(
         model="gemini-2.5-flash", # <--- Alterado para 'gemini-2.5-flash'
         google_api_key=os.getenv("GOOGLE_API_KEY"),
-        temperature=0.7 # Ajuste para controlar a criatividade da resposta (0.0 a 1.0)
+        temperature=0.7, # Ajuste para controlar a criatividade da resposta (0.0 a 1.0)
+        # Sem repetições internas: a API repete chamadas recusadas por limite de
+        # taxa no controle de admissão (admission.py), sem bloquear o event loop.
+        max_retries=1,
     )
     return llm
 
@@ -0,0 +1,88 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+
+# Modelo local padrão: multilíngue (os documentos são majoritariamente em português).
+DEFAULT_LOCAL_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+
+
+class QueryBatchingEmbeddings(Embeddings):
+    """
+    Agrupa chamadas concorrentes de embed_query em um único lote.
+    Cada chamada entra em uma fila; uma thread dedicada espera até
+    max_wait_ms pelo próximo pedido (ou até max_batch_size pedidos) e executa
+    todos em uma única chamada embed_documents do modelo local.
+    """
+
+    def __init__(self, underlying: Embeddings, max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self.underlying = underlying
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="query-embedding-batcher", daemon=True)
+        self._thread.start()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.underlying.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        future = Future()
+        self._queue.put((text, future))
+        return future.result()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                vectors = self.underlying.embed_documents([text for text, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+
+def build_local_embeddings(provider: str, model_name: str, threads: int, batch_size: int):
+    """
+    Cria um modelo de embeddings local (CPU) com sentence-transformers.
+    provider "huggingface" usa PyTorch; provider "onnx" usa o backend ONNX
+    Runtime do sentence-transformers.
+    """
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    model_kwargs = {"device": "cpu"}
+    if provider == "onnx":
+        import onnxruntime
+
+        session_options = onnxruntime.SessionOptions()
+        if threads > 0:
+            session_options.intra_op_num_threads = threads
+        model_kwargs["backend"] = "onnx"
+        model_kwargs["model_kwargs"] = {
+            "provider": "CPUExecutionProvider",
+            "session_options": session_options,
+        }
+    elif threads > 0:
+        import torch
+
+        torch.set_num_threads(threads)
+
+    return HuggingFaceEmbeddings(
+        model_name=model_name,
+        model_kwargs=model_kwargs,
+        encode_kwargs={"batch_size": batch_size, "normalize_embeddings": True},
+    )
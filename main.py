@@ -1,27 +1,48 @@
+import time
+# Início da importação do módulo, para medir o tempo de inicialização.
+_MODULE_STARTED = time.perf_counter()
+
 import os
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException, UploadFile, File, \
-    BackgroundTasks
+    BackgroundTasks, Request
+from fastapi.responses import StreamingResponse, Response
 from pydantic import BaseModel
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain_chroma import Chroma
-from langchain.chains import RetrievalQA
-from langchain.prompts import PromptTemplate
-from llm_config import get_llm
+from ingestion_pool import IngestionPool, IngestionQueueFull
+from query_cache import TTLLRUCache, normalize_query
+from context_assembly import assemble_context
+from admission import AdmissionRejected, LLMAdmission, SingleFlight, call_with_backoff
+from ingest_manifest import IngestManifest
+from task_store import FINISHED_STATUSES, TaskProgress, open_task_store
+import metrics
 
 import asyncio
-import sys
-import traceback
+import contextlib
+import json
+import hashlib
+import importlib
+import tempfile
+import logging
 import platform
 import uuid
-from typing import Dict
-import locale
+import zipfile
+from typing import TYPE_CHECKING, Dict, List, Optional
+from dataclasses import dataclass
+
+if TYPE_CHECKING:
+    from langchain_core.vectorstores import VectorStore
 
 load_dotenv()
 
+# LOG_LEVEL=DEBUG habilita os dumps de depuração (ex.: trechos dos documentos
+# recuperados); em produção (INFO) eles não são nem formatados.
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(),
+                    format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger("klaros")
+
 if platform.system() == "Windows":
     asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
-    print("DEBUG: Política de loop de eventos definida para WindowsProactorEventLoopPolicy.")
+    logger.debug("Política de loop de eventos definida para WindowsProactorEventLoopPolicy.")
 
 app = FastAPI(
     title="KlarosAI - Assistente de Conhecimento Interno",
@@ -39,211 +60,1549 @@ if not CHROMA_PERSIST_DIRECTORY:
 
 class ChatRequest(BaseModel):
     query: str
+    # Prazo da requisição em /chat/ (ms); padrão CHAT_DEADLINE_SECONDS.
+    deadline_ms: Optional[int] = None
+
+
+class ChatBatchRequest(BaseModel):
+    queries: List[str]
+
+
+class FileIngestionStatus(BaseModel):
+    task_id: str
+    file_name: str
+    status: str
+    message: str = None
 
 
 class IngestionStatusResponse(BaseModel):
     task_id: str
     status: str
     message: str = None
+    queue_position: Optional[int] = None
+    # Progresso: estágio (queued, embedding, storing, completed, failed),
+    # percentual e chunks com embeddings calculados / gravados.
+    stage: Optional[str] = None
+    percent: Optional[float] = None
+    chunks_embedded: Optional[int] = None
+    chunks_written: Optional[int] = None
+    chunks_total: Optional[int] = None
+    # Apenas em uploads em lote: status de cada arquivo e contagem por status.
+    files: Optional[List[FileIngestionStatus]] = None
+    file_counts: Optional[Dict[str, int]] = None
+
+@dataclass(frozen=True)
+class IndexHandle:
+    """
+    Versão imutável do índice (vector store consultado pelo chat).
+    O endpoint de chat lê a referência global uma única vez, então requisições
+    em andamento terminam na versão em que começaram.
+    """
+    version: int
+    vectorstore: "VectorStore"
 
-qa_chain = None
-ingestion_tasks: Dict[str, Dict] = {}
+# LLM e embeddings são criados uma única vez; apenas o índice é atualizado.
+llm = None
+embeddings = None
+QA_CHAIN_PROMPT = None
+# Os módulos pesados (LangChain, loaders, ChromaDB e os clientes do LLM) não
+# são importados com o main.py: o aquecimento em segundo plano os carrega
+# depois que a API já está respondendo (/healthz, /readyz).
+ingest = None
+_warmup_task: Optional[asyncio.Task] = None
+_warmup_error: Optional[str] = None
+# Intervalo entre novas tentativas de aquecimento quando a última falhou.
+WARMUP_RETRY_SECONDS = float(os.getenv("WARMUP_RETRY_SECONDS", "30"))
+index_handle: Optional[IndexHandle] = None
+_index_refresh_lock = asyncio.Lock()
+
+# Estado compartilhado entre os workers (uvicorn --workers N): tarefas de
+# ingestão e versão publicada do índice. Cada worker verifica a versão a cada
+# INDEX_POLL_SECONDS e recarrega o índice quando outro processo o alterou.
+task_store = open_task_store()
+INDEX_POLL_SECONDS = float(os.getenv("INDEX_POLL_SECONDS", "2"))
+# Intervalo entre as limpezas de tarefas expiradas no task store.
+TASK_EVICTION_INTERVAL_SECONDS = 60
+_index_watcher: Optional[asyncio.Task] = None
+
+# Cache de dois níveis do /chat/, invalidado a cada nova versão do índice:
+# 1) pergunta normalizada -> IDs dos chunks recuperados;
+# 2) pergunta normalizada + IDs dos chunks -> resposta e documentos de origem.
+retrieval_cache = TTLLRUCache(
+    max_entries=int(os.getenv("RETRIEVAL_CACHE_MAX_ENTRIES", "2000")),
+    ttl_seconds=float(os.getenv("RETRIEVAL_CACHE_TTL_SECONDS", "3600")),
+)
+answer_cache = TTLLRUCache(
+    max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000")),
+    ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600")),
+)
+
+# Pool de processos "quentes" para a ingestão. Os workers carregam, dividem e
+# geram embeddings; a escrita no ChromaDB é feita apenas por este processo.
+ingestion_pool = IngestionPool(
+    max_workers=int(os.getenv("INGESTION_WORKERS", "2")),
+    max_pending=int(os.getenv("INGESTION_MAX_PENDING", "20")),
+)
+write_vectorstore = None
+# Versão do índice quando write_vectorstore foi aberto (ver _get_write_vectorstore).
+_write_vectorstore_version: Optional[int] = None
+
+# Métricas expostas em /metrics (formato Prometheus).
+CHAT_STAGE_SECONDS = metrics.histogram(
+    "klaros_chat_stage_seconds", "Duração de cada estágio do chat.", ["stage"])
+CHAT_REQUEST_SECONDS = metrics.histogram(
+    "klaros_chat_request_seconds", "Duração total das requisições de chat.", ["endpoint"])
+CHAT_REQUESTS = metrics.counter(
+    "klaros_chat_requests_total", "Requisições de chat por resultado.", ["endpoint", "outcome"])
+INGEST_STAGE_SECONDS = metrics.histogram(
+    "klaros_ingest_stage_seconds", "Duração de cada estágio da ingestão de um arquivo.", ["stage"])
+INGEST_FILES = metrics.counter(
+    "klaros_ingest_files_total", "Arquivos processados pela ingestão por resultado.", ["outcome"])
+INGEST_CHUNKS = metrics.counter(
+    "klaros_ingest_chunks_added_total", "Chunks novos gravados no ChromaDB.")
+CACHE_REQUESTS = metrics.counter(
+    "klaros_cache_requests_total", "Acertos e erros acumulados de cada cache.", ["cache", "result"])
+CACHE_ENTRIES = metrics.gauge(
+    "klaros_cache_entries", "Entradas atuais de cada cache.", ["cache"])
+INGESTION_QUEUE = metrics.gauge(
+    "klaros_ingestion_queue", "Tarefas no pool de ingestão por estado.", ["state"])
+CONTEXT_TOKENS = metrics.counter(
+    "klaros_context_tokens_total", "Tokens estimados de contexto: sem tratamento (baseline) e enviados ao LLM (sent).", ["kind"])
+LLM_RETRIES = metrics.counter(
+    "klaros_llm_retries_total", "Chamadas ao LLM repetidas após recusa por limite de taxa.")
+LLM_ADMISSION = metrics.gauge(
+    "klaros_llm_admission", "Chamadas ao LLM em execução e na fila.", ["state"])
+LLM_ADMISSIONS = metrics.counter(
+    "klaros_llm_admissions_total", "Chamadas ao LLM admitidas e recusadas pelo controle de admissão.", ["result"])
+CHAT_SINGLE_FLIGHT = metrics.gauge(
+    "klaros_chat_single_flight", "Gerações de resposta em andamento.")
+CHAT_SINGLE_FLIGHT_CALLS = metrics.counter(
+    "klaros_chat_single_flight_total", "Gerações executadas e perguntas agrupadas em uma geração existente.", ["result"])
+INDEX_VERSION = metrics.gauge(
+    "klaros_index_version", "Versão atual do índice publicado.")
+STARTUP_SECONDS = metrics.gauge(
+    "klaros_startup_seconds",
+    "Tempo de inicialização: importação do main.py (import), até aceitar requisições (serving), "
+    "aquecimento em segundo plano (warmup) e até ficar pronto (ready).", ["stage"])
+
+# Controle de admissão do LLM: chamadas simultâneas, fila (FIFO) e espera
+# máxima por uma vaga; acima disso o chat responde 503 com Retry-After.
+# Recusas por limite de taxa (429) são repetidas com backoff.
+llm_admission = LLMAdmission(
+    max_concurrent=int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+    max_queue=int(os.getenv("LLM_MAX_QUEUE", "32")),
+    max_wait_seconds=float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "10")),
+)
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", "1"))
+LLM_RETRY_MAX_SECONDS = float(os.getenv("LLM_RETRY_MAX_SECONDS", "30"))
+# Perguntas idênticas (mesmos chunks, mesma versão do índice) em andamento
+# compartilham uma única geração.
+chat_single_flight = SingleFlight()
+
+# /chat/batch: máximo de perguntas por requisição e de gerações simultâneas no
+# LLM (compartilhado por todos os lotes em andamento).
+CHAT_BATCH_MAX_QUERIES = int(os.getenv("CHAT_BATCH_MAX_QUERIES", "100"))
+CHAT_BATCH_CONCURRENCY = int(os.getenv("CHAT_BATCH_CONCURRENCY", "4"))
+batch_llm_slots = asyncio.Semaphore(CHAT_BATCH_CONCURRENCY)
+
+# Prazo do /chat/: padrão, máximo aceito do cliente e fração reservada à
+# recuperação (o restante é da geração). Se a geração não terminar no prazo, a
+# resposta traz os documentos recuperados e um answer_id para /chat/answer/.
+CHAT_DEADLINE_SECONDS = float(os.getenv("CHAT_DEADLINE_SECONDS", "30"))
+CHAT_MAX_DEADLINE_SECONDS = float(os.getenv("CHAT_MAX_DEADLINE_SECONDS", "120"))
+CHAT_RETRIEVAL_BUDGET_FRACTION = float(os.getenv("CHAT_RETRIEVAL_BUDGET_FRACTION", "0.3"))
+# Espera máxima de uma consulta a /chat/answer/{answer_id} (wait_ms).
+CHAT_ANSWER_MAX_WAIT_SECONDS = 30
+# Uma resposta pendente há mais tempo que isso (ex.: o worker que a gerava foi
+# encerrado) passa a ser reportada como falha em /chat/answer/{answer_id}.
+CHAT_PENDING_ANSWER_TIMEOUT_SECONDS = float(os.getenv("CHAT_PENDING_ANSWER_TIMEOUT_SECONDS", "300"))
+CHAT_ANSWER_EXPIRED_MESSAGE = "A geração da resposta não terminou a tempo. Faça a pergunta novamente."
+CHAT_PENDING_MESSAGE = "A resposta ainda está sendo gerada. Consulte os documentos de origem abaixo ou tente novamente em instantes."
+
+# Número de chunks recuperados por pergunta (antes da montagem do contexto).
+RETRIEVER_K = int(os.getenv("RETRIEVER_K", "10"))
+
+# Upload em streaming: tamanho do bloco de cópia e tamanho máximo aceito.
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(200 * 1024 * 1024)))
+# /ingestion-status/{task_id}/stream: intervalo de leitura do task store e de
+# envio de keep-alive quando não há mudanças.
+INGESTION_STREAM_POLL_SECONDS = float(os.getenv("INGESTION_STREAM_POLL_SECONDS", "0.5"))
+INGESTION_STREAM_KEEPALIVE_SECONDS = 15
+# Upload em lote (/uploadfiles/): máximo de documentos por requisição,
+# contando os extraídos de arquivos .zip.
+BULK_UPLOAD_MAX_FILES = int(os.getenv("BULK_UPLOAD_MAX_FILES", "100"))
+# Tamanho total máximo dos documentos de um lote (extraídos ou não).
+BULK_UPLOAD_MAX_BYTES = int(os.getenv("BULK_UPLOAD_MAX_BYTES", str(1024 * 1024 * 1024)))
 
 PROMPT_TEMPLATE = """Use os seguintes trechos de contexto para responder à pergunta do usuário.
 Se você não souber a resposta, apenas diga que não sabe, não tente inventar uma resposta.
 Mantenha a resposta concisa e precisa, citando a página de onde a informação foi retirada, se possível.
+Cada trecho de contexto começa com a sua fonte e página entre colchetes.
 
 Contexto:
 {context}
 
 Pergunta: {question}
 """
-QA_CHAIN_PROMPT = PromptTemplate.from_template(PROMPT_TEMPLATE)
+
+async def _load_ingest():
+    """
+    Importa o ingest.py (loaders, ChromaDB, embeddings) fora do event loop,
+    na primeira vez em que for necessário.
+    """
+    global ingest
+    if ingest is None:
+        ingest = await asyncio.to_thread(importlib.import_module, "ingest")
+    return ingest
+
+def _load_models():
+    """
+    Importa a stack do LangChain e cria o LLM, o modelo de embeddings e o
+    template do prompt (executado em uma thread, no aquecimento).
+    """
+    from langchain.prompts import PromptTemplate
+    from llm_config import get_llm
+    from embeddings_config import get_embeddings
+
+    llm = get_llm()
+    logger.info("LLM carregado.")
+    embeddings = get_embeddings()
+    logger.info("Modelo de embeddings carregado.")
+    return llm, embeddings, PromptTemplate.from_template(PROMPT_TEMPLATE)
+
+def _open_index_vectorstore():
+    """
+    Abre o handle do índice vetorial (ChromaDB ou mmap) usado nas consultas.
+    """
+    if not os.path.exists(CHROMA_PERSIST_DIRECTORY):
+        logger.warning("Diretório ChromaDB não encontrado: %s. Certifique-se de ter executado ingest.py primeiro.",
+                       CHROMA_PERSIST_DIRECTORY)
+    vectorstore = ingest.open_vectorstore(fresh=True)
+    logger.info("Índice vetorial carregado (backend: %s).", ingest.VECTORSTORE_BACKEND)
+    return vectorstore
+
+async def _refresh_index(version: int):
+    """
+    Carrega a versão do índice publicada no task store: reabre apenas o handle
+    do vector store (com um cliente novo do ChromaDB, para enxergar o que outros
+    processos gravaram), reaproveitando o LLM já carregado, e invalida os caches do chat.
+    A troca é uma única atribuição, feita depois que a nova versão está pronta.
+    """
+    global index_handle
+    async with _index_refresh_lock:
+        if index_handle is not None and index_handle.version >= version:
+            # Outra atualização concorrente já carregou esta versão.
+            return
+        vectorstore = await asyncio.to_thread(_open_index_vectorstore)
+        index_handle = IndexHandle(version=version, vectorstore=vectorstore)
+        retrieval_cache.clear()
+        answer_cache.clear()
+        INDEX_VERSION.set(version)
+        logger.info("Índice atualizado para a versão %s.", version)
 
 async def _initialize_qa_chain():
     """
-    Inicializa a cadeia de QA (RetrievalQA) carregando o LLM, embeddings
-    e a base de dados ChromaDB.
+    Carrega o módulo de ingestão, o LLM, os embeddings e o prompt (uma única
+    vez) e publica o índice vetorial da versão atual em index_handle.
     """
-    global qa_chain
-    print("Tentando inicializar/re-inicializar a cadeia de QA...")
+    global llm, embeddings, index_handle, QA_CHAIN_PROMPT, _warmup_error
+    logger.info("Inicializando o LLM, os embeddings e o índice vetorial...")
     try:
-        llm = get_llm()
-        print("LLM carregado.")
+        await _load_ingest()
+        if llm is None:
+            llm, embeddings, QA_CHAIN_PROMPT = await asyncio.to_thread(_load_models)
 
-        embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
-        print("Modelo de embeddings carregado.")
+        await _refresh_index(await asyncio.to_thread(task_store.get_index_version))
+        _warmup_error = None
+        logger.info("LLM e índice vetorial inicializados com sucesso.")
+    except Exception as e:
+        logger.exception("Erro ao inicializar o LLM ou o índice vetorial: %s", e)
+        _warmup_error = str(e)
+        index_handle = None
 
+async def _warm_up():
+    """
+    Aquecimento em segundo plano: imports pesados, LLM, embeddings e índice.
+    Até terminar, /readyz responde 503 e o chat responde 503.
+    """
+    started = time.perf_counter()
+    await _initialize_qa_chain()
+    STARTUP_SECONDS.set(time.perf_counter() - started, stage="warmup")
+    if index_handle is not None:
+        STARTUP_SECONDS.set(time.perf_counter() - _MODULE_STARTED, stage="ready")
+        logger.info("API pronta em %.2fs.", time.perf_counter() - _MODULE_STARTED)
 
-        if not os.path.exists(CHROMA_PERSIST_DIRECTORY):
-            print(
-                f"Diretório ChromaDB não encontrado: {CHROMA_PERSIST_DIRECTORY}. Certifique-se de ter executado ingest.py primeiro.")
-            vectorstore = Chroma(
-                embedding_function=embeddings,
-                persist_directory=CHROMA_PERSIST_DIRECTORY
-            )
-        else:
-            vectorstore = Chroma(
-                persist_directory=CHROMA_PERSIST_DIRECTORY,
-                embedding_function=embeddings
-            )
-        print("ChromaDB carregado.")
-
-        qa_chain = RetrievalQA.from_chain_type(
-            llm=llm,
-            chain_type="stuff",
-            retriever=vectorstore.as_retriever(search_kwargs={"k": 10}),
-            return_source_documents=True,
-            chain_type_kwargs={"prompt": QA_CHAIN_PROMPT},
-            verbose=True
-        )
-        print("Cadeia de QA inicializada com sucesso.")
-    except Exception as e:
-        print(f"Erro ao inicializar a cadeia de QA: {e}")
-        traceback.print_exc()
-        qa_chain = None
+def _start_warm_up():
+    global _warmup_task
+    _warmup_task = asyncio.create_task(_warm_up())
 
 @app.on_event("startup")
 async def startup_event():
     """
     Executa durante a inicialização da aplicação FastAPI.
-    Inicializa a cadeia de QA.
+    Inicia o pool de ingestão, dispara o aquecimento (LLM, embeddings e índice) em
+    segundo plano (a API passa a responder imediatamente) e passa a acompanhar
+    a versão do índice publicada pelos demais workers.
     """
-    await _initialize_qa_chain()
+    global _index_watcher
+    STARTUP_SECONDS.set(time.perf_counter() - _MODULE_STARTED, stage="import")
+    ingestion_pool.start()
+    _start_warm_up()
+    _index_watcher = asyncio.create_task(_watch_index_version())
+    STARTUP_SECONDS.set(time.perf_counter() - _MODULE_STARTED, stage="serving")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """
+    Encerra o acompanhamento da versão do índice e os processos do pool de ingestão.
+    """
+    for task in (_index_watcher, _warmup_task):
+        if task is not None:
+            task.cancel()
+    ingestion_pool.shutdown()
+
+async def _publish_index_change():
+    """
+    Publica uma nova versão do índice para todos os workers (após uma escrita
+    no ChromaDB feita por este processo) e a carrega neste processo.
+    """
+    global _write_vectorstore_version
+    version = await asyncio.to_thread(task_store.bump_index_version)
+    if _write_vectorstore_version is not None and version == _write_vectorstore_version + 1:
+        # Só a escrita deste processo foi publicada: o handle de escrita continua atual.
+        _write_vectorstore_version = version
+    logger.info("Atualizando o índice para carregar os novos documentos...")
+    if llm is None:
+        await _initialize_qa_chain()
+    else:
+        await _refresh_index(version)
+
+async def _watch_index_version():
+    """
+    Recarrega o índice quando outro worker (ou o ingest.py) publica uma nova
+    versão, remove periodicamente as tarefas expiradas do task store e repete
+    o aquecimento a cada WARMUP_RETRY_SECONDS enquanto ele estiver falhando.
+    """
+    last_eviction = 0.0
+    last_warmup = time.monotonic()
+    while True:
+        await asyncio.sleep(INDEX_POLL_SECONDS)
+        try:
+            if index_handle is None and _warmup_task is not None and _warmup_task.done():
+                if time.monotonic() - last_warmup >= WARMUP_RETRY_SECONDS:
+                    last_warmup = time.monotonic()
+                    logger.info("Repetindo o aquecimento do LLM e do índice vetorial...")
+                    _start_warm_up()
+            version = await asyncio.to_thread(task_store.get_index_version)
+            handle = index_handle
+            if handle is not None and version > handle.version:
+                logger.info("Nova versão do índice publicada (%s); recarregando.", version)
+                await _refresh_index(version)
+            if time.monotonic() - last_eviction >= TASK_EVICTION_INTERVAL_SECONDS:
+                last_eviction = time.monotonic()
+                await asyncio.to_thread(task_store.evict_expired)
+        except Exception as e:
+            logger.exception("Erro ao verificar a versão do índice: %s", e)
+
+async def _get_write_vectorstore():
+    """
+    Handle de escrita deste worker. É reaberto (com um cliente novo do
+    ChromaDB) quando outro processo publicou uma versão do índice depois da
+    abertura, para não gravar sobre um estado desatualizado. As escritas em si
+    são serializadas entre processos por ingest.write_lock().
+    Chamado com ingestion_pool.write_lock adquirido.
+    """
+    global write_vectorstore, _write_vectorstore_version
+    version = await asyncio.to_thread(task_store.get_index_version)
+    if write_vectorstore is None or version != _write_vectorstore_version:
+        write_vectorstore = await asyncio.to_thread(ingest.open_vectorstore, True)
+        _write_vectorstore_version = version
+    return write_vectorstore
 
 async def _process_uploaded_file_background(task_id: str, file_path: str):
     """
-    Processa o arquivo uploaded em um processo separado para não bloquear a API.
+    Processa o arquivo uploaded no pool de ingestão para não bloquear a API.
     Atualiza o status da tarefa de ingestão.
     """
-    ingestion_tasks[task_id]["status"] = "processing"
-    ingestion_tasks[task_id]["message"] = "Iniciando processamento em segundo plano..."
-    print(f"Iniciando processamento em segundo plano para: {file_path}")
+    global write_vectorstore
+    logger.info("Iniciando processamento em segundo plano para: %s", file_path)
+    await _load_ingest()
+
+    async def _mark_processing():
+        await asyncio.to_thread(task_store.update, task_id, status="processing",
+                                message="Carregando, dividindo e gerando embeddings...",
+                                stage="embedding", percent=0.0)
 
     try:
-        python_executable = sys.executable
-        command_args = [python_executable, "ingest.py", file_path]
-        print(f"DEBUG: Comando completo a ser executado: {command_args}")
-
-        process = await asyncio.create_subprocess_exec(
-            *command_args,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
+        prepared = await ingestion_pool.prepare_file(task_id, file_path, on_start=_mark_processing)
 
-        stdout, stderr = await process.communicate()
+        await asyncio.to_thread(task_store.update, task_id, message="Gravando chunks no ChromaDB...",
+                                stage="storing", percent=ingest.EMBED_PROGRESS_SHARE)
+        # Escritas no ChromaDB são serializadas: um único escritor por vez.
+        async with ingestion_pool.write_lock:
+            write_vectorstore = await _get_write_vectorstore()
+            started = time.perf_counter()
+            added = await asyncio.to_thread(ingest.commit_prepared_file, prepared, write_vectorstore,
+                                            TaskProgress(task_store, task_id))
+            store_seconds = time.perf_counter() - started
 
-        system_encoding = locale.getpreferredencoding(False)
+        # Estágios medidos no worker (load, split, embed) e a escrita (store).
+        if prepared["status"] == "changed":
+            for stage, seconds in {**prepared.get("timings", {}), "store": store_seconds}.items():
+                INGEST_STAGE_SECONDS.observe(seconds, stage=stage)
+        INGEST_FILES.inc(outcome=prepared["status"])
+        INGEST_CHUNKS.inc(added)
 
-        stdout_decoded = stdout.decode(system_encoding, errors='ignore')
-        stderr_decoded = stderr.decode(system_encoding, errors='ignore')
+        logger.info("Ingestão em segundo plano concluída com sucesso para %s (%s chunks novos).", file_path, added)
+        if added or prepared["status"] == "changed":
+            await _publish_index_change()
+        await asyncio.to_thread(task_store.update, task_id, status="completed",
+                                message=f"Ingestão concluída com sucesso. {added} chunks novos.",
+                                stage="completed", percent=100.0)
+
+    except Exception as e:
+        message = f"Exceção durante a ingestão: {e}"
+        if "Batch size" in str(e):
+            message = "Erro de tamanho de batch do ChromaDB. O documento pode ser muito grande ou a configuração de chunks precisa ser ajustada."
+        await asyncio.to_thread(task_store.update, task_id, status="failed", message=message, stage="failed")
+        INGEST_FILES.inc(outcome="failed")
+        logger.exception("Exceção durante a ingestão em segundo plano para %s: %s", file_path, e)
 
-        if process.returncode == 0:
-            ingestion_tasks[task_id]["status"] = "completed"
-            ingestion_tasks[task_id]["message"] = "Ingestão concluída com sucesso."
-            print(f"Ingestão em segundo plano concluída com sucesso para {file_path}.")
-            print("Saída do ingest.py (stdout):\n", stdout_decoded)
-            print("Re-inicializando a cadeia de QA para carregar os novos documentos...")
-            await _initialize_qa_chain()
-            print("Cadeia de QA re-inicializada com sucesso.")
-        else:
-            ingestion_tasks[task_id]["status"] = "failed"
-            ingestion_tasks[task_id][
-                "message"] = f"Erro na ingestão. Código de saída: {process.returncode}. Erro: {stderr_decoded}"
-            print(f"Erro na ingestão em segundo plano para {file_path}. Código de saída: {process.returncode}")
-            print("Erro do ingest.py (stderr):\n", stderr_decoded)
-            if "Batch size" in stderr_decoded:
-                ingestion_tasks[task_id][
-                    "message"] = "Erro de tamanho de batch do ChromaDB. O documento pode ser muito grande ou a configuração de chunks precisa ser ajustada."
+
+async def _process_bulk_upload_background(task_id: str, files):
+    """
+    Processa um upload em lote (files: lista de (ID da subtarefa, caminho)) como
+    uma única tarefa do pool: os embeddings dos chunks de todos os arquivos são
+    calculados em lotes compartilhados, os arquivos são gravados em sequência e
+    o índice é atualizado uma única vez no final.
+    Atualiza o status da tarefa principal e o de cada arquivo.
+    """
+    global write_vectorstore
+    logger.info("Iniciando processamento em lote de %s arquivos (tarefa %s).", len(files), task_id)
+    await _load_ingest()
+
+    def _update_tasks(updates):
+        # Várias gravações no task store em uma única ida à thread.
+        for update_id, fields in updates:
+            task_store.update(update_id, **fields)
+
+    async def _mark_processing():
+        await asyncio.to_thread(_update_tasks, [
+            (task_id, {"status": "processing", "stage": "embedding", "percent": 0.0,
+                       "message": f"Carregando, dividindo e gerando embeddings de {len(files)} arquivos..."}),
+            *((subtask_id, {"status": "processing", "message": "Carregando, dividindo e gerando embeddings..."})
+              for subtask_id, _ in files),
+        ])
+
+    # Resultado de cada arquivo: (status, mensagem), gravado nas subtarefas só
+    # depois que o índice com os novos documentos for publicado.
+    outcomes = {}
+    try:
+        batch = await ingestion_pool.prepare_files(task_id, [file_path for _, file_path in files],
+                                                   on_start=_mark_processing)
+
+        await asyncio.to_thread(task_store.update, task_id, message="Gravando chunks no ChromaDB...",
+                                stage="storing", percent=ingest.EMBED_PROGRESS_SHARE)
+        total_added, index_changed = 0, False
+        async with ingestion_pool.write_lock:
+            write_vectorstore = await _get_write_vectorstore()
+            for position, ((subtask_id, file_path), prepared) in enumerate(zip(files, batch["files"])):
+                share = 100.0 - ingest.EMBED_PROGRESS_SHARE
+                await asyncio.to_thread(task_store.update, task_id,
+                                        percent=round(ingest.EMBED_PROGRESS_SHARE + share * position / len(files), 1),
+                                        chunks_written=total_added)
+                try:
+                    if prepared["status"] == "failed":
+                        raise RuntimeError(prepared["error"])
+                    started = time.perf_counter()
+                    added = await asyncio.to_thread(ingest.commit_prepared_file, prepared, write_vectorstore)
+                    if prepared["status"] == "changed":
+                        INGEST_STAGE_SECONDS.observe(time.perf_counter() - started, stage="store")
+                except Exception as e:
+                    outcomes[subtask_id] = ("failed", f"Exceção durante a ingestão: {e}")
+                    INGEST_FILES.inc(outcome="failed")
+                    logger.error("Falha na ingestão em lote de %s: %s", file_path, e)
+                    continue
+                INGEST_FILES.inc(outcome=prepared["status"])
+                INGEST_CHUNKS.inc(added)
+                total_added += added
+                index_changed = index_changed or bool(added) or prepared["status"] == "changed"
+                outcomes[subtask_id] = ("completed", f"Ingestão concluída com sucesso. {added} chunks novos.")
+
+        # Estágios do lote inteiro (load, split, embed), medidos no worker.
+        for stage, seconds in batch["timings"].items():
+            INGEST_STAGE_SECONDS.observe(seconds, stage=stage)
+        if index_changed:
+            await _publish_index_change()
+
+        await asyncio.to_thread(_update_tasks, [(subtask_id, {"status": status, "message": message})
+                                                for subtask_id, (status, message) in outcomes.items()])
+        failed = sum(1 for status, _ in outcomes.values() if status == "failed")
+        logger.info("Ingestão em lote concluída (tarefa %s): %s arquivos, %s com falha, %s chunks novos.",
+                    task_id, len(files) - failed, failed, total_added)
+        status = "failed" if failed == len(files) else "completed"
+        await asyncio.to_thread(task_store.update, task_id, status=status,
+                                message=f"Ingestão em lote concluída: {len(files) - failed} de {len(files)} arquivos "
+                                        f"processados, {total_added} chunks novos.",
+                                stage=status, percent=100.0, chunks_written=total_added)
 
     except Exception as e:
-        ingestion_tasks[task_id]["status"] = "failed"
-        ingestion_tasks[task_id]["message"] = f"Exceção durante a ingestão: {e}"
-        print(f"Exceção durante a ingestão em segundo plano para {file_path}: {e}")
-        traceback.print_exc()
+        message = f"Exceção durante a ingestão: {e}"
+        updates = []
+        for subtask_id, _ in files:
+            status, subtask_message = outcomes.get(subtask_id, ("failed", message))
+            updates.append((subtask_id, {"status": status, "message": subtask_message}))
+        updates.append((task_id, {"status": "failed", "message": message, "stage": "failed"}))
+        await asyncio.to_thread(_update_tasks, updates)
+        INGEST_FILES.inc(len(files) - len(outcomes), outcome="failed")
+        logger.exception("Exceção durante a ingestão em lote (tarefa %s): %s", task_id, e)
+
+
+async def _stream_upload_to_temp(file: UploadFile):
+    """
+    Copia o upload para um arquivo temporário em DOCUMENTS_PATH em blocos de
+    UPLOAD_CHUNK_SIZE, calculando o SHA-256 durante a cópia e respeitando
+    UPLOAD_MAX_BYTES. Retorna (caminho temporário, hash, tamanho).
+    """
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=DOCUMENTS_PATH, prefix=".upload-", suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as tmp_file:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > UPLOAD_MAX_BYTES:
+                    raise HTTPException(status_code=413,
+                                        detail=f"Arquivo excede o tamanho máximo permitido ({UPLOAD_MAX_BYTES} bytes).")
+                digest.update(chunk)
+                await asyncio.to_thread(tmp_file.write, chunk)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return tmp_path, digest.hexdigest(), size
+
+
+def _check_uploads(uploads):
+    """
+    Consulta o manifesto para todos os uploads de uma requisição (uploads:
+    lista de (nome, hash)). Retorna, para cada um, (fonte já ingerida com o
+    mesmo conteúdo ou None, se já existe documento ingerido com o nome).
+    Lê o manifesto do disco: deve rodar fora do event loop.
+    """
+    manifest = IngestManifest(CHROMA_PERSIST_DIRECTORY)
+    results = []
+    for file_name, file_hash in uploads:
+        duplicate_of = manifest.find_by_hash(file_hash)
+        if duplicate_of is not None:
+            logger.info("Arquivo %s ignorado: conteúdo idêntico a '%s', já ingerido.", file_name, duplicate_of)
+        results.append((duplicate_of, manifest.get(file_name) is not None))
+    return results
+
+
+def _move_upload(tmp_path: str, size: int, file_name: str) -> str:
+    """
+    Move atomicamente o arquivo temporário para DOCUMENTS_PATH. Retorna o caminho final.
+    """
+    file_location = os.path.join(DOCUMENTS_PATH, file_name)
+    # mkstemp cria o arquivo com permissão 0600; usa a permissão usual de arquivos.
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, file_location)
+    logger.info("Arquivo %s salvo em %s (%s bytes)", file_name, file_location, size)
+    return file_location
+
+
+def _is_supported_document(file_name: str) -> bool:
+    return file_name.lower().endswith(ingest.SUPPORTED_EXTENSIONS)
+
+
+def _extract_archive(archive_path: str, max_files: int, max_bytes: int):
+    """
+    Extrai os documentos suportados de um arquivo .zip para arquivos temporários
+    em DOCUMENTS_PATH, em blocos de UPLOAD_CHUNK_SIZE e respeitando
+    UPLOAD_MAX_BYTES para cada documento extraído. Antes de extrair qualquer
+    coisa, o arquivo é recusado se tiver mais de max_files documentos ou se os
+    tamanhos declarados somarem mais de max_bytes (a leitura de cada membro
+    para no tamanho declarado). Os diretórios internos são ignorados (só o
+    nome do arquivo é mantido).
+    Retorna (documentos extraídos como (nome, caminho temporário, hash, tamanho),
+    nomes ignorados por não serem suportados).
+    """
+    extracted, skipped = [], []
+    try:
+        with zipfile.ZipFile(archive_path) as archive:
+            members = [member for member in archive.infolist()
+                       if not member.is_dir() and _is_supported_document(os.path.basename(member.filename))]
+            # Os limites são o que resta do lote: a mensagem informa esse valor.
+            if len(members) > max_files:
+                raise HTTPException(status_code=400,
+                                    detail=f"O arquivo .zip tem {len(members)} documentos, mas o lote só comporta "
+                                           f"mais {max_files} (máximo de {BULK_UPLOAD_MAX_FILES} por lote).")
+            total_size = sum(member.file_size for member in members)
+            if total_size > max_bytes:
+                raise HTTPException(status_code=413,
+                                    detail=f"Os documentos do arquivo .zip somam {total_size} bytes, mas o lote só "
+                                           f"comporta mais {max_bytes} bytes (máximo de {BULK_UPLOAD_MAX_BYTES} por lote).")
+            for member in archive.infolist():
+                file_name = os.path.basename(member.filename)
+                if member.is_dir() or not file_name:
+                    continue
+                if not _is_supported_document(file_name):
+                    skipped.append(file_name)
+                    continue
+                digest = hashlib.sha256()
+                size = 0
+                fd, tmp_path = tempfile.mkstemp(dir=DOCUMENTS_PATH, prefix=".upload-", suffix=".part")
+                extracted.append((file_name, tmp_path, None, 0))
+                with os.fdopen(fd, "wb") as tmp_file, archive.open(member) as member_file:
+                    while True:
+                        chunk = member_file.read(UPLOAD_CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        size += len(chunk)
+                        if size > UPLOAD_MAX_BYTES:
+                            raise HTTPException(status_code=413,
+                                                detail=f"'{file_name}' excede o tamanho máximo permitido ({UPLOAD_MAX_BYTES} bytes).")
+                        digest.update(chunk)
+                        tmp_file.write(chunk)
+                extracted[-1] = (file_name, tmp_path, digest.hexdigest(), size)
+    except BaseException:
+        for _, tmp_path, _, _ in extracted:
+            os.remove(tmp_path)
+        raise
+    return extracted, skipped
 
 
 @app.post("/uploadfile/")
 async def upload_file(file: UploadFile, background_tasks: BackgroundTasks):
     """
     Recebe um arquivo, salva-o e inicia o processamento de ingestão em segundo plano.
+    O arquivo é gravado em streaming e movido atomicamente para DOCUMENTS_PATH;
+    conteúdo idêntico a um documento já ingerido é descartado sem criar tarefa.
     """
+    if ingestion_pool.is_full():
+        raise HTTPException(status_code=503,
+                            detail="A fila de ingestão está cheia. Tente novamente em instantes.",
+                            headers={"Retry-After": "30"})
+
     if not os.path.exists(DOCUMENTS_PATH):
         os.makedirs(DOCUMENTS_PATH)
 
-    file_location = os.path.join(DOCUMENTS_PATH, file.filename)
+    file_name = os.path.basename(file.filename)
+    tmp_path = None
     try:
-        with open(file_location, "wb+") as file_object:
-            file_object.write(await file.read())
-        print(f"Arquivo {file.filename} salvo em {file_location}")
+        tmp_path, file_hash, size = await _stream_upload_to_temp(file)
 
+        # Um documento com o mesmo nome é substituído: a ingestão remove os
+        # chunks da versão anterior que não existem na nova.
+        [(duplicate_of, replaced)] = await asyncio.to_thread(_check_uploads, [(file_name, file_hash)])
+        if duplicate_of is not None:
+            return {"message": f"O conteúdo de '{file_name}' já foi ingerido (como '{duplicate_of}'). Nenhum processamento necessário.",
+                    "task_id": None,
+                    "duplicate_of": duplicate_of}
+
+        # A vaga na fila é reservada antes de mover o arquivo para
+        # DOCUMENTS_PATH: com a fila cheia, nenhum documento fica lá sem tarefa.
         task_id = str(uuid.uuid4())
-        ingestion_tasks[task_id] = {"status": "pending", "message": "Fila para processamento..."}
+        ingestion_pool.reserve(task_id)
+        try:
+            await asyncio.to_thread(task_store.create, task_id, status="pending",
+                                    message="Fila para processamento...", stage="queued")
+            # Mover é o último passo que pode falhar: nada a desfazer em DOCUMENTS_PATH.
+            file_location = _move_upload(tmp_path, size, file_name)
+        except BaseException:
+            ingestion_pool.release(task_id)
+            await asyncio.to_thread(task_store.update, task_id, status="failed",
+                                    message="Falha ao registrar o upload.", stage="failed")
+            raise
         background_tasks.add_task(_process_uploaded_file_background, task_id, file_location)
 
-        return {"message": f"Arquivo '{file.filename}' carregado. O processamento foi iniciado em segundo plano.",
-                "task_id": task_id}
+        action = "substituído" if replaced else "carregado"
+        return {"message": f"Arquivo '{file_name}' {action}. O processamento foi iniciado em segundo plano.",
+                "task_id": task_id,
+                "replaced": replaced}
+    except HTTPException:
+        raise
+    except IngestionQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao carregar ou processar o arquivo: {e}")
+    finally:
+        # Temporário que não foi movido: duplicado, fila cheia ou erro.
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
 
 
-@app.get("/ingestion-status/{task_id}", response_model=IngestionStatusResponse)
-async def get_ingestion_status(task_id: str):
+def _create_bulk_tasks(task_id: str, subtasks):
     """
-    Verifica o status de uma tarefa de ingestão em segundo plano.
+    Registra no task store a tarefa de um upload em lote e suas subtarefas
+    (subtasks: lista de (ID da subtarefa, caminho em DOCUMENTS_PATH)).
     """
-    task_info = ingestion_tasks.get(task_id)
+    for subtask_id, file_location in subtasks:
+        task_store.create(subtask_id, status="pending", message="Fila para processamento...",
+                          kind="ingestion_file", parent_id=task_id, file_name=os.path.basename(file_location))
+    task_store.create(task_id, status="pending", message="Fila para processamento...",
+                      kind="bulk_ingestion", stage="queued", subtask_ids=[subtask_id for subtask_id, _ in subtasks])
+
+
+def _fail_bulk_tasks(task_id: str, subtasks):
+    # Só as tarefas já criadas existem no task store; update ignora as demais.
+    for failed_id in [task_id, *(subtask_id for subtask_id, _ in subtasks)]:
+        task_store.update(failed_id, status="failed", message="Falha ao registrar o upload.")
+
+
+@app.post("/uploadfiles/")
+async def upload_files(background_tasks: BackgroundTasks, files: List[UploadFile] = File(...)):
+    """
+    Recebe vários arquivos e/ou arquivos .zip (cujos documentos suportados são
+    extraídos) e inicia uma única tarefa de ingestão em segundo plano, com uma
+    subtarefa por documento. Documentos cujo conteúdo já foi ingerido (ou que
+    se repetem no próprio lote) são descartados sem criar subtarefa.
+    """
+    if ingestion_pool.is_full():
+        raise HTTPException(status_code=503,
+                            detail="A fila de ingestão está cheia. Tente novamente em instantes.",
+                            headers={"Retry-After": "30"})
+
+    if not os.path.exists(DOCUMENTS_PATH):
+        os.makedirs(DOCUMENTS_PATH)
+    await _load_ingest()
+
+    staged = []  # (nome, caminho temporário, hash, tamanho)
+    skipped, duplicates = [], []
+    try:
+        for file in files:
+            file_name = os.path.basename(file.filename)
+            tmp_path, file_hash, size = await _stream_upload_to_temp(file)
+            staged_bytes = sum(staged_size for _, _, _, staged_size in staged)
+            if file_name.lower().endswith(".zip"):
+                try:
+                    extracted, skipped_members = await asyncio.to_thread(
+                        _extract_archive, tmp_path, BULK_UPLOAD_MAX_FILES - len(staged),
+                        BULK_UPLOAD_MAX_BYTES - staged_bytes)
+                except zipfile.BadZipFile:
+                    raise HTTPException(status_code=400, detail=f"'{file_name}' não é um arquivo .zip válido.")
+                finally:
+                    os.remove(tmp_path)
+                staged.extend(extracted)
+                skipped.extend(f"{file_name}/{member}" for member in skipped_members)
+            elif _is_supported_document(file_name):
+                staged.append((file_name, tmp_path, file_hash, size))
+            else:
+                os.remove(tmp_path)
+                skipped.append(file_name)
+            if len(staged) > BULK_UPLOAD_MAX_FILES:
+                raise HTTPException(status_code=400,
+                                    detail=f"O lote excede o máximo de {BULK_UPLOAD_MAX_FILES} documentos.")
+            if sum(staged_size for _, _, _, staged_size in staged) > BULK_UPLOAD_MAX_BYTES:
+                raise HTTPException(status_code=413,
+                                    detail=f"O lote excede o tamanho total máximo ({BULK_UPLOAD_MAX_BYTES} bytes).")
+
+        to_process = []  # (nome, caminho temporário, tamanho)
+        seen_hashes, replaced = {}, {}
+        checks = await asyncio.to_thread(_check_uploads, [(file_name, file_hash)
+                                                          for file_name, _, file_hash, _ in staged])
+        for (file_name, tmp_path, file_hash, size), (ingested_as, ingested) in zip(staged, checks):
+            if file_name in seen_hashes.values():
+                # Outro documento do lote tem o mesmo nome (ex.: pastas diferentes do .zip).
+                skipped.append(file_name)
+                continue
+            duplicate_of = seen_hashes.get(file_hash) or ingested_as
+            if duplicate_of is not None:
+                duplicates.append({"file_name": file_name, "duplicate_of": duplicate_of})
+                continue
+            seen_hashes[file_hash] = file_name
+            replaced[file_name] = ingested
+            to_process.append((file_name, tmp_path, size))
+
+        if not to_process:
+            return {"message": "Nenhum documento novo para processar.",
+                    "task_id": None, "files": [], "duplicates": duplicates, "skipped": skipped}
+
+        # A vaga na fila é reservada antes de mover qualquer arquivo para
+        # DOCUMENTS_PATH: com a fila cheia, nenhum documento fica lá sem tarefa.
+        task_id = str(uuid.uuid4())
+        ingestion_pool.reserve(task_id)
+        subtasks, moved = [], []
+        try:
+            subtasks.extend((str(uuid.uuid4()), os.path.join(DOCUMENTS_PATH, file_name))
+                            for file_name, _, _ in to_process)
+            await asyncio.to_thread(_create_bulk_tasks, task_id, subtasks)
+            # Mover é o último passo: se falhar, os documentos já movidos que
+            # não substituíram um existente são removidos.
+            for file_name, tmp_path, size in to_process:
+                existed = os.path.exists(os.path.join(DOCUMENTS_PATH, file_name))
+                moved.append((_move_upload(tmp_path, size, file_name), existed))
+        except BaseException:
+            ingestion_pool.release(task_id)
+            for file_location, existed in moved:
+                if not existed:
+                    os.remove(file_location)
+            await asyncio.to_thread(_fail_bulk_tasks, task_id, subtasks)
+            raise
+        background_tasks.add_task(_process_bulk_upload_background, task_id, subtasks)
+
+        return {"message": f"{len(subtasks)} documentos carregados. O processamento foi iniciado em segundo plano.",
+                "task_id": task_id,
+                "files": [{"task_id": subtask_id, "file_name": file_name, "replaced": replaced[file_name]}
+                          for (subtask_id, _), (file_name, _, _) in zip(subtasks, to_process)],
+                "duplicates": duplicates,
+                "skipped": skipped}
+    except HTTPException:
+        raise
+    except IngestionQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao carregar ou processar os arquivos: {e}")
+    finally:
+        # Temporários que não foram movidos: ignorados, duplicados ou com erro.
+        for _, tmp_path, _, _ in staged:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+def _ingestion_status(task_id: str) -> Optional[IngestionStatusResponse]:
+    """
+    Monta o status da tarefa a partir do task store, ou None se ela não existir.
+    A tarefa pode ter sido criada por qualquer worker; a posição na fila só é
+    conhecida pelo worker que a recebeu.
+    """
+    task_info = task_store.get(task_id)
     if not task_info:
-        raise HTTPException(status_code=404, detail="ID da tarefa não encontrado.")
+        return None
+    queue_position = ingestion_pool.queue_position(task_id)
+    message = task_info.get("message")
+    if queue_position is not None:
+        message = f"Na fila de ingestão (posição {queue_position})."
+    files, file_counts = None, None
+    if task_info["kind"] == "bulk_ingestion":
+        files = []
+        for subtask_id in task_info.get("subtask_ids", []):
+            subtask = task_store.get(subtask_id)
+            if subtask is not None:
+                files.append(FileIngestionStatus(task_id=subtask_id, file_name=subtask.get("file_name", ""),
+                                                 status=subtask["status"], message=subtask.get("message")))
+        file_counts = {}
+        for file_status in files:
+            file_counts[file_status.status] = file_counts.get(file_status.status, 0) + 1
     return IngestionStatusResponse(
         task_id=task_id,
         status=task_info["status"],
-        message=task_info.get("message")
+        message=message,
+        queue_position=queue_position,
+        stage=task_info.get("stage"),
+        percent=task_info.get("percent"),
+        chunks_embedded=task_info.get("chunks_embedded"),
+        chunks_written=task_info.get("chunks_written"),
+        chunks_total=task_info.get("chunks_total"),
+        files=files,
+        file_counts=file_counts
+    )
+
+
+@app.get("/ingestion-status/{task_id}", response_model=IngestionStatusResponse)
+async def get_ingestion_status(task_id: str):
+    """
+    Verifica o status de uma tarefa de ingestão em segundo plano.
+    """
+    status = await asyncio.to_thread(_ingestion_status, task_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="ID da tarefa não encontrado.")
+    return status
+
+
+@app.get("/ingestion-status/{task_id}/stream")
+async def stream_ingestion_status(task_id: str, request: Request):
+    """
+    Acompanha uma tarefa de ingestão via Server-Sent Events: envia um evento
+    "progress" (mesmo formato de /ingestion-status/{task_id}) a cada mudança de
+    estágio ou percentual e um evento "done" quando a tarefa termina.
+    O progresso é lido do task store compartilhado, então funciona em qualquer
+    worker; o cliente mantém uma única conexão em vez de consultar o status.
+    """
+    if await asyncio.to_thread(_ingestion_status, task_id) is None:
+        raise HTTPException(status_code=404, detail="ID da tarefa não encontrado.")
+
+    async def event_stream():
+        last_payload, last_sent = None, time.monotonic()
+        while not await request.is_disconnected():
+            status = await asyncio.to_thread(_ingestion_status, task_id)
+            if status is None:
+                yield _sse_event("error", {"detail": "Tarefa removida do task store."})
+                return
+            payload = status.model_dump()
+            if payload != last_payload:
+                yield _sse_event("progress", payload)
+                last_payload, last_sent = payload, time.monotonic()
+            elif time.monotonic() - last_sent >= INGESTION_STREAM_KEEPALIVE_SECONDS:
+                # Comentário SSE: mantém a conexão aberta em proxies.
+                yield ": keep-alive\n\n"
+                last_sent = time.monotonic()
+            if status.status in FINISHED_STATUSES:
+                yield _sse_event("done", payload)
+                return
+            await asyncio.sleep(INGESTION_STREAM_POLL_SECONDS)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
 
 
+def _format_sources(source_documents):
+    """
+    Converte os documentos de origem para o formato retornado pela API.
+    """
+    debug = logger.isEnabledFor(logging.DEBUG)
+    formatted_sources = []
+    for doc in source_documents:
+        source_path = doc.metadata.get('source', 'Desconhecido')
+        source_name = os.path.basename(str(source_path))
+        if debug:
+            logger.debug("Documento recuperado: %s - Página: %s\nConteúdo (trecho): %s...",
+                         source_name, doc.metadata.get('page', 'N/A'), doc.page_content[:500])
+
+        formatted_sources.append({
+            "content": doc.page_content,
+            "source": source_name,
+            "page": doc.metadata.get('page', 'N/A')
+        })
+    return formatted_sources
+
+def _build_prompt(query: str, documents):
+    """
+    Monta o prompt final: os chunks recuperados passam pela montagem de
+    contexto (junção de sobreposições, remoção de quase duplicatas e orçamento
+    de tokens, com a fonte e a página de cada bloco).
+    Retorna (prompt, estatísticas do contexto).
+    """
+    assembled = assemble_context(documents)
+    CONTEXT_TOKENS.inc(assembled.baseline_tokens, kind="baseline")
+    CONTEXT_TOKENS.inc(assembled.tokens, kind="sent")
+    logger.debug("Contexto montado: %s", assembled.stats())
+    return QA_CHAIN_PROMPT.format(context=assembled.text, question=query), assembled.stats()
+
+def _sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def _chunk_id(doc):
+    return doc.metadata.get("chunk_id") or getattr(doc, "id", None)
+
+async def _retrieve_with_cache(handle: IndexHandle, query: str):
+    """
+    Nível 1 do cache: recupera os IDs dos chunks relevantes para a pergunta.
+    Retorna (chave normalizada, IDs dos chunks, documentos). Os documentos são
+    None quando os IDs vieram do cache (só são buscados se necessário).
+    """
+    normalized = normalize_query(query)
+    chunk_ids = retrieval_cache.get((handle.version, normalized))
+    if chunk_ids is not None:
+        return normalized, chunk_ids, None
+
+    with CHAT_STAGE_SECONDS.time(stage="query_embedding"):
+        query_vector = await embeddings.aembed_query(query)
+    with CHAT_STAGE_SECONDS.time(stage="vector_search"):
+        documents = await handle.vectorstore.asimilarity_search_by_vector(query_vector, k=RETRIEVER_K)
+    return normalized, _cache_retrieval(handle, normalized, documents), documents
+
+def _cache_retrieval(handle: IndexHandle, normalized: str, documents):
+    """
+    Grava no nível 1 do cache os IDs dos documentos recuperados e os retorna.
+    Bases antigas (sem IDs estáveis) não podem usar o cache: retorna None.
+    """
+    ids = [_chunk_id(doc) for doc in documents]
+    if not all(ids):
+        return None
+    chunk_ids = tuple(ids)
+    retrieval_cache.set((handle.version, normalized), chunk_ids)
+    return chunk_ids
+
+async def _retrieve_batch_with_cache(handle: IndexHandle, queries):
+    """
+    Versão em lote de _retrieve_with_cache: as perguntas fora do cache têm os
+    embeddings calculados em uma única chamada em lote e as buscas vetoriais
+    executadas em paralelo. Retorna uma tupla (chave normalizada, IDs, documentos)
+    por pergunta, na mesma ordem.
+    """
+    results = []
+    missing = {}
+    for index, query in enumerate(queries):
+        normalized = normalize_query(query)
+        chunk_ids = retrieval_cache.get((handle.version, normalized))
+        results.append((normalized, chunk_ids, None))
+        if chunk_ids is None:
+            # Perguntas repetidas no lote são buscadas uma única vez.
+            missing.setdefault(normalized, (query, []))[1].append(index)
+    if not missing:
+        return results
+
+    with CHAT_STAGE_SECONDS.time(stage="query_embedding"):
+        from embeddings_config import embed_queries
+        vectors = await asyncio.to_thread(embed_queries, [query for query, _ in missing.values()])
+    with CHAT_STAGE_SECONDS.time(stage="vector_search"):
+        found = await asyncio.gather(*(
+            handle.vectorstore.asimilarity_search_by_vector(vector, k=RETRIEVER_K) for vector in vectors
+        ))
+    for (normalized, (_, indexes)), documents in zip(missing.items(), found):
+        chunk_ids = _cache_retrieval(handle, normalized, documents)
+        for index in indexes:
+            results[index] = (normalized, chunk_ids, documents)
+    return results
+
+async def _load_documents(handle: IndexHandle, chunk_ids, documents):
+    """
+    Retorna os documentos recuperados, buscando-os pelos IDs quando vieram do cache.
+    """
+    if documents is not None:
+        return documents
+    with CHAT_STAGE_SECONDS.time(stage="document_fetch"):
+        found = await asyncio.to_thread(handle.vectorstore.get_by_ids, list(chunk_ids))
+    by_id = {_chunk_id(doc): doc for doc in found}
+    return [by_id[chunk_id] for chunk_id in chunk_ids if chunk_id in by_id]
+
+
+def _log_llm_retry(attempt: int, delay: float):
+    LLM_RETRIES.inc()
+    logger.warning("LLM recusou a chamada por limite de taxa; tentativa %s em %.1fs.", attempt, delay)
+
+async def _invoke_llm(prompt: str):
+    """
+    Chama o LLM dentro de uma vaga do controle de admissão, repetindo a
+    chamada em caso de limite de taxa. Levanta AdmissionRejected se saturado.
+    """
+    async with llm_admission.slot():
+        with CHAT_STAGE_SECONDS.time(stage="llm_call"):
+            return await call_with_backoff(
+                lambda: llm.ainvoke(prompt),
+                max_retries=LLM_MAX_RETRIES,
+                base_delay=LLM_RETRY_BASE_SECONDS,
+                max_delay=LLM_RETRY_MAX_SECONDS,
+                on_retry=_log_llm_retry,
+            )
+
+async def _open_llm_stream(prompt: str):
+    """
+    Inicia o streaming do LLM e aguarda o primeiro chunk (é nesse ponto que o
+    provedor recusa por limite de taxa). Retorna (primeiro chunk ou None, iterador).
+    """
+    iterator = llm.astream(prompt).__aiter__()
+    try:
+        return await iterator.__anext__(), iterator
+    except StopAsyncIteration:
+        return None, iterator
+
+def _rejected_response(error: AdmissionRejected):
+    return HTTPException(status_code=503,
+                         detail=f"{error} Tente novamente em {error.retry_after}s.",
+                         headers={"Retry-After": str(error.retry_after)})
+
+async def _answer_query(handle: IndexHandle, query: str, normalized: str, chunk_ids, documents, llm_slots=None):
+    """
+    Nível 2 do cache e geração: retorna a resposta para uma pergunta cujos
+    chunks já foram recuperados, como (resposta, veio_do_cache).
+    Perguntas idênticas em andamento aguardam a mesma geração.
+    llm_slots, se fornecido, limita quantas perguntas do chamador aguardam ao
+    mesmo tempo uma geração. A vaga é tomada fora do single-flight: a geração
+    compartilhada não fica presa ao semáforo de quem a iniciou.
+    """
+    answer_key = (normalized, chunk_ids)
+    cached = answer_cache.get(answer_key) if chunk_ids is not None else None
+    if cached is not None:
+        return cached, True
+
+    async with llm_slots or contextlib.nullcontext():
+        response = await chat_single_flight.do(
+            (handle.version, normalized, chunk_ids),
+            lambda: _generate_answer(handle, query, answer_key, documents),
+        )
+    return response, False
+
+async def _generate_answer(handle: IndexHandle, query: str, answer_key, documents):
+    normalized, chunk_ids = answer_key
+    source_documents = await _load_documents(handle, chunk_ids, documents)
+    logger.debug("Enviando a pergunta ao LLM (índice v%s): %s", handle.version, query)
+    with CHAT_STAGE_SECONDS.time(stage="prompt_assembly"):
+        prompt, context_stats = _build_prompt(query, source_documents)
+    result = await _invoke_llm(prompt)
+    answer = result.content or "Não foi possível gerar uma resposta para sua pergunta."
+
+    with CHAT_STAGE_SECONDS.time(stage="response_formatting"):
+        response = {
+            "response": answer,
+            "source_documents": _format_sources(source_documents),
+            "context_stats": context_stats
+        }
+    if chunk_ids is not None:
+        answer_cache.set(answer_key, response)
+    return response
+
+
+def _chat_deadline_seconds(deadline_ms: Optional[int]) -> float:
+    if deadline_ms is None or deadline_ms <= 0:
+        return CHAT_DEADLINE_SECONDS
+    return min(deadline_ms / 1000.0, CHAT_MAX_DEADLINE_SECONDS)
+
+async def _retrieve_sources(handle: IndexHandle, query: str):
+    """
+    Etapa de recuperação do /chat/ com prazo: inclui a busca dos documentos
+    quando os IDs vieram do cache e a resposta ainda não está em cache, para
+    que eles estejam disponíveis se a geração não terminar no prazo.
+    """
+    normalized, chunk_ids, documents = await _retrieve_with_cache(handle, query)
+    if documents is None and answer_cache.get((normalized, chunk_ids)) is None:
+        documents = await _load_documents(handle, chunk_ids, None)
+    return normalized, chunk_ids, documents
+
+# Gravações no task store disparadas por callbacks (referências mantidas até o fim).
+_background_writes = set()
+
+def _store_in_background(function, *args, **kwargs):
+    """
+    Executa uma gravação bloqueante no task store em uma thread, a partir de
+    código síncrono do event loop (ex.: callbacks de tarefas).
+    """
+    write = asyncio.ensure_future(asyncio.to_thread(function, *args, **kwargs))
+    _background_writes.add(write)
+    write.add_done_callback(_background_writes.discard)
+
+async def _register_pending_answer(query: str, generation: asyncio.Future, documents):
+    """
+    Registra no task store uma geração que não terminou no prazo. Ela continua
+    em segundo plano e o resultado fica disponível em /chat/answer/{answer_id}
+    (em qualquer worker) até expires_at. Retorna a resposta parcial do /chat/.
+    """
+    answer_id = str(uuid.uuid4())
+    await asyncio.to_thread(task_store.create, answer_id, status="pending", message=CHAT_PENDING_MESSAGE,
+                            kind="chat_answer", query=query,
+                            expires_at=time.time() + CHAT_PENDING_ANSWER_TIMEOUT_SECONDS)
+
+    def _store_result(task: asyncio.Future):
+        if task.cancelled():
+            _store_in_background(task_store.update, answer_id, status="failed",
+                                 message="A geração da resposta foi cancelada.")
+        elif task.exception() is not None:
+            _store_in_background(task_store.update, answer_id, status="failed",
+                                 message=f"Erro ao gerar a resposta: {task.exception()}")
+        else:
+            response, _ = task.result()
+            _store_in_background(task_store.update, answer_id, status="completed", **response)
+
+    generation.add_done_callback(_store_result)
+    return {
+        "query": query,
+        "status": "pending",
+        "answer_id": answer_id,
+        "response": CHAT_PENDING_MESSAGE,
+        "source_documents": _format_sources(documents or []),
+    }
+
 @app.post("/chat/")
 async def chat(request: ChatRequest):
     """
     Recebe uma query e retorna uma resposta da IA baseada nos documentos na base de conhecimento.
+    A requisição respeita um prazo (deadline_ms ou CHAT_DEADLINE_SECONDS),
+    dividido entre a recuperação e a geração. Se a geração não terminar no
+    prazo, retorna status "pending" com os documentos recuperados e um
+    answer_id para buscar a resposta em /chat/answer/{answer_id}.
     """
-    print(f"Received chat request with query: {request.query}")
-    if qa_chain is None:
+    logger.debug("Requisição de chat recebida: %s", request.query)
+    handle = index_handle
+    if handle is None:
+        CHAT_REQUESTS.inc(endpoint="chat", outcome="unavailable")
         raise HTTPException(status_code=503, detail="A IA ainda não foi inicializada. Tente novamente em instantes.")
 
+    started = time.perf_counter()
+    deadline = _chat_deadline_seconds(request.deadline_ms)
     try:
-        print(f"Input being sent to qa_chain.ainvoke: {{'query': '{request.query}'}}")
-        result = await qa_chain.ainvoke({"query": request.query})
-
-        answer = result.get("result", "Não foi possível gerar uma resposta para sua pergunta.")
-        source_documents = result.get("source_documents", [])
-
-        formatted_sources = []
-        for doc in source_documents:
-            source_path = doc.metadata.get('source', 'Desconhecido')
-            source_name = os.path.basename(str(source_path))
-            print("--- Documentos de Origem Recuperados (para depuração) ---")
-            print(f"Documento: {source_name} - Página: {doc.metadata.get('page', 'N/A')}")
-            print(f"Conteúdo (trecho): {doc.page_content[:500]}...")
-            print("--------------------")
-
-            formatted_sources.append({
-                "content": doc.page_content,
-                "source": source_name,
-                "page": doc.metadata.get('page', 'N/A')
-            })
-
-        return {
-            "query": request.query,
-            "response": answer,
-            "source_documents": formatted_sources
-        }
+        try:
+            normalized, chunk_ids, documents = await asyncio.wait_for(
+                _retrieve_sources(handle, request.query), timeout=deadline * CHAT_RETRIEVAL_BUDGET_FRACTION)
+        except asyncio.TimeoutError:
+            CHAT_REQUESTS.inc(endpoint="chat", outcome="deadline")
+            raise HTTPException(status_code=504, detail="A recuperação dos documentos excedeu o prazo da requisição.")
+
+        # A geração roda em uma tarefa própria: se o prazo acabar, ela continua
+        # em segundo plano e o resultado é guardado para /chat/answer/.
+        generation = asyncio.ensure_future(
+            _answer_query(handle, request.query, normalized, chunk_ids, documents))
+        remaining = max(deadline - (time.perf_counter() - started), 0.0)
+        try:
+            response, cached = await asyncio.wait_for(asyncio.shield(generation), timeout=remaining)
+        except asyncio.TimeoutError:
+            CHAT_REQUESTS.inc(endpoint="chat", outcome="deadline")
+            logger.warning("Geração excedeu o prazo de %.1fs; retornando apenas os documentos recuperados.", deadline)
+            return await _register_pending_answer(request.query, generation, documents)
+        CHAT_REQUESTS.inc(endpoint="chat", outcome="cached" if cached else "ok")
+        return {"query": request.query, "status": "completed", **response}
+    except HTTPException:
+        raise
+    except AdmissionRejected as e:
+        CHAT_REQUESTS.inc(endpoint="chat", outcome="rejected")
+        raise _rejected_response(e)
+    except Exception as e:
+        CHAT_REQUESTS.inc(endpoint="chat", outcome="error")
+        logger.exception("Erro ao processar a requisição: %s", e)
+        raise HTTPException(status_code=500,
+                            detail=f"Erro ao processar a requisição: {e}. Verifique o log do servidor para mais detalhes.")
+    finally:
+        CHAT_REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint="chat")
+
+
+@app.get("/chat/answer/{answer_id}")
+async def get_chat_answer(answer_id: str, wait_ms: int = 0):
+    """
+    Retorna a resposta de um /chat/ que excedeu o prazo. Com wait_ms, aguarda
+    até esse tempo (no máximo CHAT_ANSWER_MAX_WAIT_SECONDS) pela conclusão.
+    Enquanto a geração não termina, responde 202 com status "pending"; depois
+    de expires_at (CHAT_PENDING_ANSWER_TIMEOUT_SECONDS), a resposta é dada como falha.
+    """
+    deadline = time.monotonic() + min(max(wait_ms, 0) / 1000.0, CHAT_ANSWER_MAX_WAIT_SECONDS)
+    while True:
+        answer = await asyncio.to_thread(task_store.get, answer_id)
+        if answer is None or answer["kind"] != "chat_answer":
+            raise HTTPException(status_code=404, detail="Resposta não encontrada (ID inválido ou expirado).")
+        if answer["status"] == "pending" and time.time() >= answer.get("expires_at", float("inf")):
+            await asyncio.to_thread(task_store.update, answer_id, status="failed", message=CHAT_ANSWER_EXPIRED_MESSAGE)
+            answer = {**answer, "status": "failed", "message": CHAT_ANSWER_EXPIRED_MESSAGE}
+        if answer["status"] != "pending" or time.monotonic() >= deadline:
+            break
+        await asyncio.sleep(0.2)
+
+    if answer["status"] == "pending":
+        return Response(content=json.dumps({"answer_id": answer_id, "status": "pending", "query": answer.get("query")},
+                                           ensure_ascii=False),
+                        status_code=202, media_type="application/json")
+    if answer["status"] == "failed":
+        raise HTTPException(status_code=500, detail=answer.get("message") or "Erro ao gerar a resposta.")
+    return {
+        "answer_id": answer_id,
+        "status": "completed",
+        "query": answer.get("query"),
+        "response": answer.get("response"),
+        "source_documents": answer.get("source_documents", []),
+        "context_stats": answer.get("context_stats"),
+    }
+
+
+async def _stream_answer(query: str, answer_key, source_documents, formatted_sources, tokens: asyncio.Queue):
+    """
+    Geração do /chat/stream: coloca cada trecho da resposta em tokens à medida
+    que chega do LLM. Retorna (resposta, False), no formato de _answer_query,
+    para que possa ser registrada como resposta pendente.
+    """
+    normalized, chunk_ids = answer_key
+    with CHAT_STAGE_SECONDS.time(stage="prompt_assembly"):
+        prompt, context_stats = _build_prompt(query, source_documents)
+    answer_parts = []
+    async with llm_admission.slot():
+        llm_started = time.perf_counter()
+        # Só o início do stream é repetido: depois do primeiro token não há como refazer.
+        first_chunk, chunks = await call_with_backoff(
+            lambda: _open_llm_stream(prompt),
+            max_retries=LLM_MAX_RETRIES,
+            base_delay=LLM_RETRY_BASE_SECONDS,
+            max_delay=LLM_RETRY_MAX_SECONDS,
+            on_retry=_log_llm_retry,
+        )
+        CHAT_STAGE_SECONDS.observe(time.perf_counter() - llm_started, stage="llm_first_token")
+        if first_chunk is not None and first_chunk.content:
+            answer_parts.append(first_chunk.content)
+            tokens.put_nowait(first_chunk.content)
+        async for chunk in chunks:
+            if chunk.content:
+                answer_parts.append(chunk.content)
+                tokens.put_nowait(chunk.content)
+        CHAT_STAGE_SECONDS.observe(time.perf_counter() - llm_started, stage="llm_call")
+
+    answer = "".join(answer_parts) or "Não foi possível gerar uma resposta para sua pergunta."
+    response = {"response": answer, "source_documents": formatted_sources, "context_stats": context_stats}
+    if chunk_ids is not None:
+        answer_cache.set(answer_key, response)
+    return response, False
+
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """
+    Variante em streaming do /chat/ (Server-Sent Events).
+    Envia primeiro a lista de documentos de origem (evento "sources"), depois os
+    tokens da resposta à medida que são gerados (eventos "token") e, por fim,
+    a resposta completa e as estatísticas do contexto (evento "done").
+    Respeita o mesmo prazo do /chat/: se a geração não terminar nele, envia o
+    evento "pending" com um answer_id para /chat/answer/{answer_id}.
+    Erros são enviados no evento "error".
+    """
+    logger.debug("Requisição de chat em streaming recebida: %s", request.query)
+    handle = index_handle
+    if handle is None:
+        CHAT_REQUESTS.inc(endpoint="chat_stream", outcome="unavailable")
+        raise HTTPException(status_code=503, detail="A IA ainda não foi inicializada. Tente novamente em instantes.")
+    if llm_admission.is_saturated():
+        # Recusa antes de abrir o stream, enquanto ainda é possível responder 503.
+        CHAT_REQUESTS.inc(endpoint="chat_stream", outcome="rejected")
+        raise _rejected_response(AdmissionRejected("A fila de chamadas ao LLM está cheia.", llm_admission.retry_after()))
+
+    async def event_stream():
+        started = time.perf_counter()
+        deadline = _chat_deadline_seconds(request.deadline_ms)
+        generation, pending = None, False
+        try:
+            try:
+                normalized, chunk_ids, documents = await asyncio.wait_for(
+                    _retrieve_sources(handle, request.query), timeout=deadline * CHAT_RETRIEVAL_BUDGET_FRACTION)
+            except asyncio.TimeoutError:
+                CHAT_REQUESTS.inc(endpoint="chat_stream", outcome="deadline")
+                yield _sse_event("error", {"detail": "A recuperação dos documentos excedeu o prazo da requisição."})
+                return
+            answer_key = (normalized, chunk_ids)
+            cached = answer_cache.get(answer_key) if chunk_ids is not None else None
+            if cached is not None:
+                CHAT_REQUESTS.inc(endpoint="chat_stream", outcome="cached")
+                yield _sse_event("sources", {"query": request.query, "source_documents": cached["source_documents"]})
+                yield _sse_event("token", {"text": cached["response"]})
+                yield _sse_event("done", {"response": cached["response"], "context_stats": cached.get("context_stats")})
+                return
+
+            source_documents = await _load_documents(handle, chunk_ids, documents)
+            with CHAT_STAGE_SECONDS.time(stage="response_formatting"):
+                formatted_sources = _format_sources(source_documents)
+            yield _sse_event("sources", {"query": request.query, "source_documents": formatted_sources})
+
+            # A geração roda em uma tarefa própria que entrega os trechos na
+            # fila (None no fim): se o prazo acabar, ela continua em segundo
+            # plano e a resposta completa fica em /chat/answer/.
+            tokens = asyncio.Queue()
+            generation = asyncio.ensure_future(
+                _stream_answer(request.query, answer_key, source_documents, formatted_sources, tokens))
+            generation.add_done_callback(lambda _: tokens.put_nowait(None))
+            while True:
+                remaining = max(deadline - (time.perf_counter() - started), 0.0)
+                try:
+                    text = await asyncio.wait_for(tokens.get(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    CHAT_REQUESTS.inc(endpoint="chat_stream", outcome="deadline")
+                    logger.warning("Geração em streaming excedeu o prazo de %.1fs; a resposta continua em segundo plano.",
+                                   deadline)
+                    pending = True
+                    partial = await _register_pending_answer(request.query, generation, None)
+                    yield _sse_event("pending", {"answer_id": partial["answer_id"], "response": partial["response"]})
+                    return
+                if text is None:
+                    break
+                yield _sse_event("token", {"text": text})
+
+            response, _ = await generation
+            CHAT_REQUESTS.inc(endpoint="chat_stream", outcome="ok")
+            yield _sse_event("done", {"response": response["response"], "context_stats": response["context_stats"]})
+        except AdmissionRejected as e:
+            CHAT_REQUESTS.inc(endpoint="chat_stream", outcome="rejected")
+            yield _sse_event("error", {"detail": f"{e} Tente novamente em {e.retry_after}s.", "retry_after": e.retry_after})
+        except Exception as e:
+            CHAT_REQUESTS.inc(endpoint="chat_stream", outcome="error")
+            logger.exception("Erro ao processar a requisição em streaming: %s", e)
+            yield _sse_event("error", {"detail": f"Erro ao processar a requisição: {e}. Verifique o log do servidor para mais detalhes."})
+        finally:
+            # Cliente desconectado antes do prazo: ninguém vai buscar a resposta.
+            if generation is not None and not pending and not generation.done():
+                generation.cancel()
+            CHAT_REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint="chat_stream")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.post("/chat/batch")
+async def chat_batch(request: ChatBatchRequest):
+    """
+    Responde a várias perguntas em uma única requisição (ex.: conjuntos de
+    regressão de FAQ). Os embeddings das perguntas são calculados em um único
+    lote e as buscas vetoriais rodam em paralelo; as gerações no LLM são
+    limitadas por CHAT_BATCH_CONCURRENCY.
+    A resposta é NDJSON: uma linha por pergunta, na ordem em que ficam prontas,
+    com o índice da pergunta na lista e o mesmo conteúdo do /chat/ (ou "error").
+    """
+    if not request.queries:
+        raise HTTPException(status_code=400, detail="Informe ao menos uma pergunta.")
+    if len(request.queries) > CHAT_BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=413,
+                            detail=f"O lote excede o máximo de {CHAT_BATCH_MAX_QUERIES} perguntas.")
+    handle = index_handle
+    if handle is None:
+        CHAT_REQUESTS.inc(endpoint="chat_batch", outcome="unavailable")
+        raise HTTPException(status_code=503, detail="A IA ainda não foi inicializada. Tente novamente em instantes.")
+
+    started = time.perf_counter()
+    try:
+        retrieved = await _retrieve_batch_with_cache(handle, request.queries)
     except Exception as e:
-        print(f"Erro ao processar a requisição: {e}")
-        print(traceback.format_exc())
+        logger.exception("Erro ao recuperar documentos do lote: %s", e)
         raise HTTPException(status_code=500,
                             detail=f"Erro ao processar a requisição: {e}. Verifique o log do servidor para mais detalhes.")
 
+    async def answer_item(index: int, query: str):
+        normalized, chunk_ids, documents = retrieved[index]
+        try:
+            response, cached = await _answer_query(handle, query, normalized, chunk_ids, documents,
+                                                   llm_slots=batch_llm_slots)
+            CHAT_REQUESTS.inc(endpoint="chat_batch", outcome="cached" if cached else "ok")
+            return {"index": index, "query": query, **response}
+        except AdmissionRejected as e:
+            CHAT_REQUESTS.inc(endpoint="chat_batch", outcome="rejected")
+            return {"index": index, "query": query, "error": f"{e} Tente novamente em {e.retry_after}s.",
+                    "retry_after": e.retry_after}
+        except Exception as e:
+            CHAT_REQUESTS.inc(endpoint="chat_batch", outcome="error")
+            logger.exception("Erro ao processar a pergunta %s do lote: %s", index, e)
+            return {"index": index, "query": query, "error": f"Erro ao processar a pergunta: {e}"}
+
+    async def result_stream():
+        tasks = [asyncio.create_task(answer_item(index, query)) for index, query in enumerate(request.queries)]
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                yield json.dumps(await next_result, ensure_ascii=False) + "\n"
+        finally:
+            # Cliente desconectado: cancela as gerações que ainda não terminaram.
+            for task in tasks:
+                task.cancel()
+            CHAT_REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint="chat_batch")
+
+    return StreamingResponse(result_stream(), media_type="application/x-ndjson")
+
+
+def _manifest_documents():
+    manifest = IngestManifest(CHROMA_PERSIST_DIRECTORY)
+    documents = []
+    for source in sorted(manifest.sources()):
+        entry = manifest.get(source)
+        documents.append({
+            "name": source,
+            "chunk_count": len(entry.get("chunk_ids", [])),
+            "ingested_at": entry.get("ingested_at"),
+            "hash": entry.get("hash"),
+        })
+    return documents
+
+
+@app.get("/documents")
+async def list_documents():
+    """
+    Lista os documentos ingeridos com o número de chunks e a data da ingestão
+    (timestamp Unix), a partir do manifesto de ingestão.
+    """
+    documents = await asyncio.to_thread(_manifest_documents)
+    return {"documents": documents, "total_chunks": sum(document["chunk_count"] for document in documents)}
+
+
+@app.delete("/documents/{name:path}")
+async def delete_document(name: str):
+    """
+    Remove um documento: apaga do ChromaDB apenas os chunks dele (rastreados no
+    manifesto), o arquivo em DOCUMENTS_PATH e publica uma nova versão do índice.
+    """
+    global write_vectorstore
+    await _load_ingest()
+    async with ingestion_pool.write_lock:
+        write_vectorstore = await _get_write_vectorstore()
+        removed = await asyncio.to_thread(ingest.delete_source, name, write_vectorstore)
+    if removed is None:
+        raise HTTPException(status_code=404, detail=f"Documento '{name}' não encontrado.")
+    logger.info("Documento %s removido (%s chunks).", name, removed)
+    await _publish_index_change()
+    return {"message": f"Documento '{name}' removido.", "chunks_removed": removed}
+
+
+def _embedding_cache_stats():
+    """
+    Estatísticas do cache de embeddings, ou None antes do aquecimento (sem
+    importar o módulo de embeddings só para isso).
+    """
+    if embeddings is None:
+        return None
+    from embeddings_config import get_embedding_cache_stats
+    return get_embedding_cache_stats()
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """
+    Retorna as taxas de acerto dos caches de recuperação, de respostas e de embeddings.
+    """
+    return {
+        "index_version": index_handle.version if index_handle is not None else None,
+        "retrieval_cache": retrieval_cache.stats(),
+        "answer_cache": answer_cache.stats(),
+        "embedding_cache": _embedding_cache_stats(),
+    }
+
+def _update_runtime_gauges():
+    """
+    Copia para os gauges o estado atual dos caches, do pool de ingestão e do índice.
+    """
+    caches = {
+        "retrieval": retrieval_cache.stats(),
+        "answer": answer_cache.stats(),
+        "embedding": _embedding_cache_stats(),
+    }
+    for name, stats in caches.items():
+        if not stats:
+            continue
+        CACHE_REQUESTS.set_total(stats["hits"], cache=name, result="hit")
+        CACHE_REQUESTS.set_total(stats["misses"], cache=name, result="miss")
+        CACHE_ENTRIES.set(stats["entries"], cache=name)
+    admission_stats = llm_admission.stats()
+    for state in ("active", "waiting"):
+        LLM_ADMISSION.set(admission_stats[state], state=state)
+    for result in ("admitted", "rejected"):
+        LLM_ADMISSIONS.set_total(admission_stats[result], result=result)
+    flight_stats = chat_single_flight.stats()
+    CHAT_SINGLE_FLIGHT.set(flight_stats["in_flight"])
+    for result in ("executions", "coalesced"):
+        CHAT_SINGLE_FLIGHT_CALLS.set_total(flight_stats[result], result=result)
+    pool_stats = ingestion_pool.stats()
+    for state in ("running", "waiting"):
+        INGESTION_QUEUE.set(pool_stats[state], state=state)
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """
+    Métricas no formato de texto do Prometheus: latência por estágio do chat e
+    da ingestão, contadores de requisições e estado dos caches e da fila.
+    """
+    _update_runtime_gauges()
+    return Response(content=metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/healthz")
+async def healthz():
+    """
+    Liveness: o processo está de pé e o event loop responde. Não depende do
+    LLM nem do índice (uma reinicialização não resolveria esses casos).
+    """
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """
+    Readiness: 200 quando o LLM, os embeddings e o índice estão carregados e o
+    chat pode ser atendido; 503 durante o aquecimento ou se ele falhou.
+    """
+    handle = index_handle
+    checks = {"llm": llm is not None, "embeddings": embeddings is not None, "index": handle is not None}
+    if all(checks.values()):
+        return {"status": "ready", "checks": checks, "index_version": handle.version}
+    warming_up = _warmup_task is not None and not _warmup_task.done()
+    body = {"status": "starting" if warming_up else "unavailable", "checks": checks, "error": _warmup_error}
+    return Response(content=json.dumps(body, ensure_ascii=False), status_code=503,
+                    media_type="application/json")
+
 @app.get("/")
 async def root():
-    return {"message": "KlarosAI API está rodando!"}
\ No newline at end of file
+    ready = index_handle is not None
+    return {"message": "KlarosAI API está rodando!" if ready else "KlarosAI API está iniciando...",
+            "ready": ready}
\ No newline at end of file
@@ -0,0 +1,503 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import Any, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from file_lock import FileLock
+
+logger = logging.getLogger("klaros.mmap_vectorstore")
+
+# Formatos dos vetores varridos na busca. Os vetores em float32 ficam em um
+# arquivo separado e só são lidos para reordenar os melhores candidatos.
+QUANTIZATIONS = ("float16", "int8")
+
+# Linhas convertidas para float32 por vez durante a varredura (limita a
+# memória temporária da busca: 8192 x 768 x 4 bytes ~ 25 MB).
+SCAN_BLOCK_ROWS = 8192
+
+# Compactação: reescreve os arquivos quando as linhas removidas passam dessa
+# fração do total (e o índice tem pelo menos COMPACTION_MIN_ROWS linhas).
+COMPACTION_DEAD_FRACTION = 0.25
+COMPACTION_MIN_ROWS = 1000
+
+# Limite de variáveis por consulta do SQLite (IN (...)).
+_SQLITE_MAX_VARIABLES = 500
+
+_CURRENT_FILE = "CURRENT"
+# Lock entre processos dos escritores (workers da API, ingest.py).
+_WRITE_LOCK_FILE = "write.lock"
+
+
+def _quantize(vectors: np.ndarray, quantization: str):
+    """
+    Retorna (vetores quantizados, escala de cada linha). Em int8 a quantização
+    é simétrica por vetor: v ~= q * escala.
+    """
+    if quantization == "float16":
+        return vectors.astype(np.float16), np.ones(len(vectors), dtype=np.float32)
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    quantized = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return quantized, scales.astype(np.float32)
+
+
+class MmapVectorStore(VectorStore):
+    """
+    Vector store local e compacto, alternativo ao ChromaDB
+    (VECTORSTORE_BACKEND=mmap).
+
+    Os embeddings ficam em arquivos NumPy mapeados em memória: uma cópia
+    quantizada (float16 ou int8) varrida por força bruta vetorizada e uma cópia
+    em float32 usada apenas para reordenar, pela distância L2 exata (a mesma
+    do ChromaDB), os rerank_factor * k melhores candidatos. Textos e metadados
+    ficam em SQLite. Só as páginas tocadas pela busca ocupam memória residente.
+
+    As linhas só são acrescentadas; remoções e substituições marcam a linha
+    antiga como removida e a compactação grava uma nova geração dos arquivos.
+    Um handle aberto enxerga um retrato da geração em que foi aberto, como o
+    IndexHandle da API. Escritas (upsert, delete, compactação) de qualquer
+    processo são serializadas por um lock de arquivo e, antes de escrever, o
+    handle recarrega a geração e as linhas vivas gravadas pelos outros.
+    """
+
+    def __init__(self, persist_directory: str, embedding_function: Embeddings,
+                 quantization: str = "int8", rerank_factor: int = 4):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Quantização desconhecida: {quantization}. Use {' ou '.join(QUANTIZATIONS)}.")
+        self.persist_directory = persist_directory
+        self._embedding_function = embedding_function
+        self.rerank_factor = max(1, rerank_factor)
+        self._lock = threading.Lock()
+        os.makedirs(persist_directory, exist_ok=True)
+        self._lock_path = os.path.join(persist_directory, _WRITE_LOCK_FILE)
+
+        with FileLock(self._lock_path):
+            self._generation = self._read_generation()
+            self._conn = self._connect(self._generation)
+            meta = self._read_meta()
+            # A quantização de um índice existente é a da sua criação.
+            self.quantization = meta.get("quantization", quantization)
+            self.dim = int(meta["dim"]) if "dim" in meta else None
+            self._collection_metadata = json.loads(meta.get("collection_metadata", "{}"))
+            if "quantization" not in meta:
+                self._write_meta(quantization=self.quantization)
+            # Uma escrita interrompida (falta de espaço, processo encerrado) pode
+            # ter deixado os arquivos com números de linhas diferentes.
+            self._truncate_files(self._file_rows())
+            self._load_state()
+
+    # --- Arquivos ---
+    def _path(self, generation: int, suffix: str) -> str:
+        return os.path.join(self.persist_directory, f"vectors-{generation}.{suffix}")
+
+    def _db_path(self, generation: int) -> str:
+        return os.path.join(self.persist_directory, f"index-{generation}.sqlite3")
+
+    def _read_generation(self) -> int:
+        try:
+            with open(os.path.join(self.persist_directory, _CURRENT_FILE), "r") as current_file:
+                return int(current_file.read().strip())
+        except (OSError, ValueError):
+            return 0
+
+    def _write_generation(self, generation: int):
+        tmp_path = os.path.join(self.persist_directory, f".{_CURRENT_FILE}.tmp")
+        with open(tmp_path, "w") as current_file:
+            current_file.write(str(generation))
+        os.replace(tmp_path, os.path.join(self.persist_directory, _CURRENT_FILE))
+
+    def _connect(self, generation: int):
+        conn = sqlite3.connect(self._db_path(generation), timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "row INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE, document TEXT, metadata TEXT NOT NULL)"
+        )
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        conn.commit()
+        return conn
+
+    def _read_meta(self):
+        return dict(self._conn.execute("SELECT key, value FROM meta").fetchall())
+
+    def _write_meta(self, **values):
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                [(key, str(value)) for key, value in values.items()],
+            )
+
+    def _quantized_dtype(self):
+        return np.float16 if self.quantization == "float16" else np.int8
+
+    def _row_bytes(self):
+        """
+        Bytes por linha de cada arquivo de vetores. aux guarda a norma ao
+        quadrado e a escala de cada linha, em float32.
+        """
+        return {
+            "q": self.dim * np.dtype(self._quantized_dtype()).itemsize,
+            "f32": self.dim * 4,
+            "aux": 8,
+        }
+
+    def _file_rows(self) -> int:
+        """
+        Linhas completas presentes nos três arquivos de vetores da geração atual
+        (inclui as removidas). Uma escrita interrompida entre os arquivos deixa
+        alguns deles mais longos; as linhas excedentes são ignoradas.
+        """
+        if not self.dim:
+            return 0
+        counts = []
+        for suffix, row_bytes in self._row_bytes().items():
+            path = self._path(self._generation, suffix)
+            counts.append(os.path.getsize(path) // row_bytes if os.path.exists(path) else 0)
+        return min(counts)
+
+    def _truncate_files(self, rows: int):
+        """
+        Corta os três arquivos de vetores em rows linhas, descartando o que uma
+        escrita interrompida deixou além delas.
+        """
+        if not self.dim:
+            return
+        for suffix, row_bytes in self._row_bytes().items():
+            path = self._path(self._generation, suffix)
+            if os.path.exists(path) and os.path.getsize(path) != rows * row_bytes:
+                try:
+                    os.truncate(path, rows * row_bytes)
+                except OSError as e:
+                    # No Windows, um arquivo mapeado por outro processo não pode
+                    # ser truncado; a próxima escrita sobrescreve o excedente,
+                    # pois grava em offsets explícitos.
+                    logger.warning("Não foi possível truncar %s: %s", path, e)
+
+    def _map(self, suffix: str, dtype, rows: int, columns: int):
+        return np.memmap(self._path(self._generation, suffix), dtype=dtype, mode="r", shape=(rows, columns))
+
+    def _load_state(self):
+        """
+        Lê as linhas vivas do SQLite e mapeia os arquivos de vetores. As linhas
+        são gravadas nos arquivos antes de entrarem no SQLite, então toda linha
+        viva já está nos arquivos.
+        """
+        self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        rows = np.array([row for (row,) in self._conn.execute("SELECT row FROM chunks")], dtype=np.int64)
+        self._rows = self._file_rows() if self.dim else 0
+        alive = np.zeros(self._rows, dtype=bool)
+        alive[rows[rows < self._rows]] = True
+        self._alive = alive
+        self._remap()
+
+    def _remap(self):
+        if self._rows == 0:
+            self._quantized = self._full = self._aux = None
+            return
+        self._quantized = self._map("q", self._quantized_dtype(), self._rows, self.dim)
+        self._full = self._map("f32", np.float32, self._rows, self.dim)
+        self._aux = self._map("aux", np.float32, self._rows, 2)
+
+    @contextmanager
+    def _writing(self):
+        """
+        Seção de escrita: exclui as demais threads e os demais processos
+        escritores e sincroniza o handle com o que eles gravaram.
+        """
+        with self._lock, FileLock(self._lock_path):
+            self._sync_for_write()
+            yield
+
+    def _sync_for_write(self):
+        """
+        Passa a usar a geração atual (outro processo pode ter compactado o
+        índice) e recarrega as linhas vivas se outro processo escreveu desde a
+        última leitura. Chamado com o lock de escrita adquirido.
+        """
+        generation = self._read_generation()
+        reload = generation != self._generation
+        if reload:
+            old_conn = self._conn
+            self._generation = generation
+            self._conn = self._connect(generation)
+            old_conn.close()
+        meta = self._read_meta()
+        if self.dim is None and "dim" in meta:
+            self.dim = int(meta["dim"])
+        self._collection_metadata = json.loads(meta.get("collection_metadata", "{}"))
+        self._truncate_files(self._file_rows())
+        data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if reload or data_version != self._data_version or self._file_rows() != self._rows:
+            self._load_state()
+
+    def _write_vectors(self, start: int, vectors: np.ndarray):
+        """
+        Grava os vetores a partir da linha start de cada arquivo, em offsets
+        explícitos: a linha i fica sempre em i * bytes por linha, mesmo que uma
+        escrita anterior tenha sido interrompida entre os arquivos.
+        """
+        quantized, scales = _quantize(vectors, self.quantization)
+        aux = np.stack([np.einsum("ij,ij->i", vectors, vectors), scales], axis=1).astype(np.float32)
+        row_bytes = self._row_bytes()
+        for suffix, array in (("q", quantized), ("f32", vectors), ("aux", aux)):
+            fd = os.open(self._path(self._generation, suffix), os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o644)
+            with os.fdopen(fd, "r+b") as data_file:
+                data_file.seek(start * row_bytes[suffix])
+                data_file.write(np.ascontiguousarray(array).tobytes())
+                data_file.flush()
+                os.fsync(data_file.fileno())
+
+    def _select_rows(self, column: str, values):
+        """
+        Executa SELECT row, id, document, metadata filtrando por column IN values,
+        em blocos que respeitam o limite de variáveis do SQLite.
+        """
+        values = list(values)
+        found = []
+        for start in range(0, len(values), _SQLITE_MAX_VARIABLES):
+            block = values[start:start + _SQLITE_MAX_VARIABLES]
+            placeholders = ",".join("?" * len(block))
+            found.extend(self._conn.execute(
+                f"SELECT row, id, document, metadata FROM chunks WHERE {column} IN ({placeholders})", block
+            ).fetchall())
+        return found
+
+    # --- Interface compatível com a coleção do ChromaDB (ingest.py) ---
+    @property
+    def metadata(self):
+        return dict(self._collection_metadata)
+
+    def modify(self, metadata=None):
+        with self._writing():
+            self._collection_metadata = dict(metadata or {})
+            self._write_meta(collection_metadata=json.dumps(self._collection_metadata))
+
+    def count(self) -> int:
+        return int(self._alive.sum())
+
+    def upsert(self, ids, embeddings, metadatas=None, documents=None):
+        """
+        Grava chunks com embeddings já calculados. IDs existentes são substituídos.
+        """
+        if not ids:
+            return
+        metadatas = metadatas or [{} for _ in ids]
+        documents = documents or [None for _ in ids]
+        # O último valor de um ID repetido no lote prevalece.
+        last_index = {chunk_id: index for index, chunk_id in enumerate(ids)}
+        order = sorted(last_index.values())
+        vectors = np.asarray([embeddings[index] for index in order], dtype=np.float32)
+
+        with self._writing():
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self._write_meta(dim=self.dim)
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Dimensão dos embeddings ({vectors.shape[1]}) diferente da do índice ({self.dim}).")
+
+            start = self._file_rows()
+            self._write_vectors(start, vectors)
+            new_ids = [ids[index] for index in order]
+            replaced = [row for row, _, _, _ in self._select_rows("id", new_ids)]
+            with self._conn:
+                for block_start in range(0, len(new_ids), _SQLITE_MAX_VARIABLES):
+                    block = new_ids[block_start:block_start + _SQLITE_MAX_VARIABLES]
+                    self._conn.execute(f"DELETE FROM chunks WHERE id IN ({','.join('?' * len(block))})", block)
+                self._conn.executemany(
+                    "INSERT INTO chunks (row, id, document, metadata) VALUES (?, ?, ?, ?)",
+                    [(start + position, ids[index], documents[index], json.dumps(metadatas[index] or {}))
+                     for position, index in enumerate(order)],
+                )
+
+            alive = np.zeros(start + len(order), dtype=bool)
+            alive[:len(self._alive)] = self._alive
+            alive[replaced] = False
+            alive[start:] = True
+            self._alive = alive
+            self._rows = len(alive)
+            self._remap()
+            self._maybe_compact()
+
+    # --- VectorStore ---
+    @property
+    def embeddings(self) -> Optional[Embeddings]:
+        return self._embedding_function
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                  ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        ids = list(ids) if ids else [str(uuid.uuid4()) for _ in texts]
+        vectors = self._embedding_function.embed_documents(texts)
+        self.upsert(ids=ids, embeddings=vectors, metadatas=metadatas, documents=texts)
+        return ids
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        if not ids:
+            return None
+        with self._writing():
+            removed = [row for row, _, _, _ in self._select_rows("id", ids)]
+            if not removed:
+                return True
+            with self._conn:
+                for start in range(0, len(removed), _SQLITE_MAX_VARIABLES):
+                    block = removed[start:start + _SQLITE_MAX_VARIABLES]
+                    self._conn.execute(f"DELETE FROM chunks WHERE row IN ({','.join('?' * len(block))})", block)
+            alive = self._alive.copy()
+            alive[[row for row in removed if row < len(alive)]] = False
+            self._alive = alive
+            self._maybe_compact()
+        return True
+
+    def get_by_ids(self, ids, /) -> List[Document]:
+        with self._lock:
+            found = self._select_rows("id", ids)
+        by_id = {chunk_id: self._to_document(chunk_id, document, metadata) for _, chunk_id, document, metadata in found}
+        return [by_id[chunk_id] for chunk_id in ids if chunk_id in by_id]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return self.similarity_search_by_vector(self._embedding_function.embed_query(query), k=k, **kwargs)
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(self._embedding_function.embed_query(query), k=k, **kwargs)
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [document for document, _ in self.similarity_search_by_vector_with_score(embedding, k=k, **kwargs)]
+
+    def similarity_search_by_vector_with_score(self, embedding: List[float], k: int = 4,
+                                               **kwargs: Any) -> List[Tuple[Document, float]]:
+        """
+        Retorna os k chunks mais próximos com a distância L2 ao quadrado
+        (menor = mais parecido), como o ChromaDB.
+        """
+        with self._lock:
+            # Retrato do estado: escritas posteriores trocam os arrays, não os alteram.
+            alive, quantized, full, aux, rows = self._alive, self._quantized, self._full, self._aux, self._rows
+        if rows == 0 or k <= 0:
+            return []
+        query = np.asarray(embedding, dtype=np.float32)
+        candidates = min(int(alive.sum()), k * self.rerank_factor)
+        if candidates == 0:
+            return []
+
+        # 1) Varredura vetorizada dos vetores quantizados. A distância aproximada
+        #    omite ||q||^2, que é constante para a consulta.
+        best_rows = np.empty(0, dtype=np.int64)
+        best_distances = np.empty(0, dtype=np.float32)
+        for start in range(0, rows, SCAN_BLOCK_ROWS):
+            end = min(start + SCAN_BLOCK_ROWS, rows)
+            dots = quantized[start:end].astype(np.float32) @ query
+            distances = aux[start:end, 0] - 2.0 * dots * aux[start:end, 1]
+            distances[~alive[start:end]] = np.inf
+            if len(distances) > candidates:
+                selected = np.argpartition(distances, candidates - 1)[:candidates]
+            else:
+                selected = np.arange(len(distances))
+            best_rows = np.concatenate([best_rows, selected + start])
+            best_distances = np.concatenate([best_distances, distances[selected]])
+            if len(best_rows) > candidates:
+                keep = np.argpartition(best_distances, candidates - 1)[:candidates]
+                best_rows, best_distances = best_rows[keep], best_distances[keep]
+        best_rows = np.sort(best_rows[np.isfinite(best_distances)])
+
+        # 2) Reordenação exata em float32 apenas dos candidatos.
+        differences = np.asarray(full[best_rows]) - query
+        exact = np.einsum("ij,ij->i", differences, differences)
+        order = np.argsort(exact)[:k]
+        top_rows = [int(best_rows[index]) for index in order]
+
+        with self._lock:
+            found = {row: (chunk_id, document, metadata)
+                     for row, chunk_id, document, metadata in self._select_rows("row", top_rows)}
+        results = []
+        for row, index in zip(top_rows, order):
+            # A linha pode ter sido removida depois do retrato.
+            if row in found:
+                results.append((self._to_document(*found[row]), float(exact[index])))
+        return results
+
+    def _select_relevance_score_fn(self):
+        return self._euclidean_relevance_score_fn
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None,
+                   ids: Optional[List[str]] = None, persist_directory: str = "./mmap_index",
+                   **kwargs: Any) -> "MmapVectorStore":
+        store = cls(persist_directory=persist_directory, embedding_function=embedding, **kwargs)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
+
+    @staticmethod
+    def _to_document(chunk_id: str, document: str, metadata: str) -> Document:
+        return Document(page_content=document or "", metadata=json.loads(metadata), id=chunk_id)
+
+    # --- Compactação ---
+    def _maybe_compact(self):
+        dead = self._rows - int(self._alive.sum())
+        if self._rows >= COMPACTION_MIN_ROWS and dead > COMPACTION_DEAD_FRACTION * self._rows:
+            self._compact()
+
+    def _compact(self):
+        """
+        Grava uma nova geração só com as linhas vivas e passa a usá-la. Handles
+        abertos em outros processos continuam lendo a geração anterior até
+        serem reabertos. Chamado dentro de _writing(), com o estado sincronizado.
+        """
+        old_generation, new_generation = self._generation, self._generation + 1
+        live_rows = np.flatnonzero(self._alive)
+        for path in (self._db_path(new_generation), *(self._path(new_generation, suffix) for suffix in ("q", "f32", "aux"))):
+            if os.path.exists(path):
+                os.remove(path)
+
+        for suffix, source in (("q", self._quantized), ("f32", self._full), ("aux", self._aux)):
+            with open(self._path(new_generation, suffix), "wb") as data_file:
+                for start in range(0, len(live_rows), SCAN_BLOCK_ROWS):
+                    data_file.write(np.ascontiguousarray(source[live_rows[start:start + SCAN_BLOCK_ROWS]]).tobytes())
+                data_file.flush()
+                os.fsync(data_file.fileno())
+
+        self._connect(new_generation).close()
+        # ATTACH/DETACH não podem rodar dentro de uma transação.
+        self._conn.execute("ATTACH DATABASE ? AS compacted", (self._db_path(new_generation),))
+        try:
+            with self._conn:
+                self._conn.execute(
+                    "INSERT INTO compacted.chunks (row, id, document, metadata) "
+                    "SELECT ROW_NUMBER() OVER (ORDER BY row) - 1, id, document, metadata FROM main.chunks"
+                )
+                self._conn.execute("INSERT INTO compacted.meta SELECT key, value FROM main.meta")
+        finally:
+            self._conn.execute("DETACH DATABASE compacted")
+
+        self._write_generation(new_generation)
+        old_conn = self._conn
+        self._generation = new_generation
+        self._conn = self._connect(new_generation)
+        old_conn.close()
+        self._load_state()
+        logger.info("Índice compactado: %s linhas (geração %s).", len(live_rows), new_generation)
+
+        # Inclui gerações antigas que não puderam ser removidas antes.
+        for generation in range(old_generation + 1):
+            self._remove_generation(generation)
+
+    def _remove_generation(self, generation: int):
+        paths = [self._db_path(generation), self._db_path(generation) + "-wal", self._db_path(generation) + "-shm"]
+        paths += [self._path(generation, suffix) for suffix in ("q", "f32", "aux")]
+        for path in paths:
+            try:
+                if os.path.exists(path):
+                    os.remove(path)
+            except OSError:
+                # No Windows, arquivos ainda mapeados por outro processo não
+                # podem ser removidos; ficam para a próxima compactação.
+                pass
@@ -0,0 +1,69 @@
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normaliza uma pergunta para uso como chave de cache: Unicode NFC,
+    minúsculas e espaços colapsados.
+    """
+    return " ".join(unicodedata.normalize("NFC", query).lower().split())
+
+
+class TTLLRUCache:
+    """
+    Cache em memória limitado por número de entradas (despejo LRU) e com
+    tempo de vida (TTL) por entrada. Mantém contadores de acertos e erros.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl_seconds: float = 3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Retorna o valor armazenado para a chave, ou None se ausente/expirado.
+        """
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            value, expires_at = item
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+        }
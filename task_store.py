@@ -0,0 +1,150 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Estados finais: tarefas nesses estados são removidas depois do TTL.
+FINISHED_STATUSES = ("completed", "failed")
+
+
+class TaskStore:
+    """
+    Estado compartilhado entre os workers da API (uvicorn --workers N) em
+    SQLite (modo WAL): tarefas em segundo plano e a versão publicada do índice.
+    Tarefas finalizadas são removidas após ttl_seconds; tarefas sem
+    atualização há mais de stale_seconds (ex.: worker encerrado) também.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float = 3600, stale_seconds: float = 86400):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS tasks ("
+            "task_id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, message TEXT, "
+            "data TEXT NOT NULL, created_at REAL NOT NULL, updated_at REAL NOT NULL, finished_at REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_finished_at ON tasks(finished_at)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self._conn.commit()
+
+    # --- Tarefas ---
+    def create(self, task_id: str, status: str = "pending", message: str = None, kind: str = "ingestion", **data):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO tasks (task_id, kind, status, message, data, created_at, updated_at, finished_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (task_id, kind, status, message, json.dumps(data), now, now,
+                 now if status in FINISHED_STATUSES else None),
+            )
+
+    def update(self, task_id: str, status: str = None, message: str = None, **data):
+        """
+        Atualiza o status, a mensagem e/ou campos extras (mesclados aos existentes).
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            # Leitura e escrita na mesma transação de escrita: outro worker
+            # não intercala uma atualização da mesma tarefa.
+            self._conn.execute("BEGIN IMMEDIATE")
+            row = self._conn.execute(
+                "SELECT status, message, data FROM tasks WHERE task_id = ?", (task_id,)
+            ).fetchone()
+            if row is None:
+                return
+            new_status = status if status is not None else row[0]
+            new_message = message if message is not None else row[1]
+            new_data = {**json.loads(row[2]), **data}
+            self._conn.execute(
+                "UPDATE tasks SET status = ?, message = ?, data = ?, updated_at = ?, "
+                "finished_at = CASE WHEN ? THEN COALESCE(finished_at, ?) ELSE NULL END WHERE task_id = ?",
+                (new_status, new_message, json.dumps(new_data), now,
+                 new_status in FINISHED_STATUSES, now, task_id),
+            )
+
+    def get(self, task_id: str):
+        """
+        Retorna a tarefa como dict (task_id, kind, status, message, updated_at e
+        os campos extras) ou None.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT task_id, kind, status, message, data, updated_at FROM tasks WHERE task_id = ?", (task_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {**json.loads(row[4]), "task_id": row[0], "kind": row[1], "status": row[2], "message": row[3],
+                "updated_at": row[5]}
+
+    def evict_expired(self) -> int:
+        """
+        Remove as tarefas finalizadas há mais de ttl_seconds e as paradas há
+        mais de stale_seconds. Retorna o número de tarefas removidas.
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "DELETE FROM tasks WHERE finished_at < ? OR updated_at < ?",
+                (now - self.ttl_seconds, now - self.stale_seconds),
+            )
+        return cursor.rowcount
+
+    # --- Versão do índice ---
+    def get_index_version(self) -> int:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'index_version'").fetchone()
+        return row[0] if row else 0
+
+    def bump_index_version(self) -> int:
+        """
+        Publica uma nova versão do índice (incremento atômico entre processos)
+        e a retorna. Os demais workers a detectam e recarregam o índice.
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('index_version', 1) "
+                "ON CONFLICT(key) DO UPDATE SET value = value + 1"
+            )
+            return self._conn.execute("SELECT value FROM meta WHERE key = 'index_version'").fetchone()[0]
+
+
+class TaskProgress:
+    """
+    Callback de progresso de uma tarefa: grava os campos recebidos no task
+    store no máximo uma vez a cada interval segundos (sempre, com force=True).
+    Pode ser usado nos processos do pool de ingestão, que compartilham o
+    mesmo arquivo SQLite com a API.
+    """
+
+    def __init__(self, store: TaskStore, task_id: str, interval: float = 0.5):
+        self.store = store
+        self.task_id = task_id
+        self.interval = interval
+        self._last_update = 0.0
+
+    def __call__(self, force: bool = False, **progress):
+        now = time.monotonic()
+        if not force and now - self._last_update < self.interval:
+            return
+        self._last_update = now
+        self.store.update(self.task_id, **progress)
+
+
+def open_task_store() -> TaskStore:
+    """
+    Abre o task store configurado (TASK_STORE_PATH e TASK_TTL_SECONDS),
+    compartilhado pelos workers da API e pelo ingest.py.
+    """
+    return TaskStore(
+        path=os.getenv("TASK_STORE_PATH", "./task_store/tasks.sqlite3"),
+        ttl_seconds=float(os.getenv("TASK_TTL_SECONDS", "3600")),
+    )
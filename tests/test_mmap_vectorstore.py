@@ -0,0 +1,122 @@
+import os
+
+import numpy as np
+import pytest
+from langchain_core.embeddings import FakeEmbeddings
+
+import mmap_vectorstore
+from mmap_vectorstore import MmapVectorStore
+
+DIM = 16
+
+
+def _open(path, quantization="int8", rerank_factor=4):
+    return MmapVectorStore(persist_directory=str(path), embedding_function=FakeEmbeddings(size=DIM),
+                           quantization=quantization, rerank_factor=rerank_factor)
+
+
+def _vectors(count, seed=0, dim=DIM):
+    return np.random.default_rng(seed).standard_normal((count, dim)).astype(np.float32)
+
+
+def _upsert(store, ids, vectors):
+    store.upsert(ids=ids, embeddings=vectors.tolist(),
+                 metadatas=[{"source": chunk_id} for chunk_id in ids],
+                 documents=[f"texto {chunk_id}" for chunk_id in ids])
+
+
+def _nearest_id(store, vector):
+    [(document, _)] = store.similarity_search_by_vector_with_score(vector.tolist(), k=1)
+    return document.id
+
+
+def test_truncates_files_left_uneven_by_an_interrupted_append(tmp_path):
+    store = _open(tmp_path)
+    vectors = _vectors(3)
+    _upsert(store, ["a", "b", "c"], vectors)
+    row_bytes = store._row_bytes()
+
+    # Append interrompido: uma linha inteira em f32 e meia linha em q, sem
+    # entrada no SQLite.
+    with open(store._path(store._generation, "f32"), "ab") as data_file:
+        data_file.write(_vectors(1, seed=1).tobytes())
+    with open(store._path(store._generation, "q"), "ab") as data_file:
+        data_file.write(b"\x01" * (row_bytes["q"] // 2))
+
+    reopened = _open(tmp_path)
+    for suffix, size in row_bytes.items():
+        assert os.path.getsize(reopened._path(reopened._generation, suffix)) == 3 * size
+    assert reopened.count() == 3
+
+    # A próxima escrita fica alinhada na linha 3 dos três arquivos.
+    new_vector = _vectors(1, seed=2)
+    _upsert(reopened, ["d"], new_vector)
+    assert reopened.count() == 4
+    assert _nearest_id(reopened, new_vector[0]) == "d"
+    assert _nearest_id(reopened, vectors[1]) == "b"
+
+
+def test_upsert_replaces_an_existing_id(tmp_path):
+    store = _open(tmp_path)
+    old_vector, new_vector = _vectors(2)
+    _upsert(store, ["a"], old_vector[None, :])
+    _upsert(store, ["b"], _vectors(1, seed=3))
+    store.upsert(ids=["a"], embeddings=[new_vector.tolist()], metadatas=[{"version": 2}], documents=["novo"])
+
+    assert store.count() == 2
+    [document] = store.get_by_ids(["a"])
+    assert document.page_content == "novo"
+    assert document.metadata == {"version": 2}
+    results = store.similarity_search_by_vector_with_score(new_vector.tolist(), k=2)
+    assert [document.id for document, _ in results].count("a") == 1
+    assert results[0][0].id == "a"
+    assert results[0][1] == pytest.approx(0.0, abs=1e-4)
+    assert _open(tmp_path).count() == 2
+
+
+def test_delete_then_compaction_keeps_live_rows(tmp_path, monkeypatch):
+    monkeypatch.setattr(mmap_vectorstore, "COMPACTION_MIN_ROWS", 10)
+    store = _open(tmp_path)
+    vectors = _vectors(40)
+    ids = [f"chunk-{index}" for index in range(40)]
+    _upsert(store, ids, vectors)
+    assert store._generation == 0
+
+    removed = ids[:15]
+    store.delete(ids=removed)
+
+    assert store._generation == 1
+    assert store._rows == 25
+    assert store.count() == 25
+    assert not os.path.exists(store._path(0, "q"))
+    assert store.get_by_ids(removed) == []
+    for index in (15, 27, 39):
+        assert _nearest_id(store, vectors[index]) == ids[index]
+        assert store.get_by_ids([ids[index]])[0].page_content == f"texto {ids[index]}"
+
+    reopened = _open(tmp_path)
+    assert reopened._generation == 1
+    assert reopened.count() == 25
+    assert _nearest_id(reopened, vectors[20]) == ids[20]
+
+
+@pytest.mark.parametrize("quantization", ["int8", "float16"])
+def test_recall_matches_exact_search(tmp_path, quantization):
+    vectors = _vectors(2000, seed=4, dim=64)
+    queries = _vectors(20, seed=5, dim=64)
+    ids = [f"chunk-{index}" for index in range(len(vectors))]
+    store = MmapVectorStore(persist_directory=str(tmp_path), embedding_function=FakeEmbeddings(size=64),
+                            quantization=quantization)
+    _upsert(store, ids, vectors)
+
+    k = 10
+    hits = 0
+    for query in queries:
+        distances = ((vectors - query) ** 2).sum(axis=1)
+        expected = {ids[index] for index in np.argsort(distances)[:k]}
+        results = store.similarity_search_by_vector_with_score(query.tolist(), k=k)
+        hits += len(expected & {document.id for document, _ in results})
+        # As distâncias retornadas são as exatas (reordenação em float32).
+        for document, score in results:
+            assert score == pytest.approx(distances[ids.index(document.id)], rel=1e-4)
+    assert hits / (k * len(queries)) >= 0.95